@@ -0,0 +1,43 @@
+import hmac
+from typing import Optional
+from fastapi import Header, HTTPException, Request
+from app.core.config import settings
+from app.core.metrics import RATE_LIMITED, route_label
+from app.core.ratelimit import rate_limiter
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    return bool(settings.ADMIN_TOKEN and token and hmac.compare_digest(token, settings.ADMIN_TOKEN))
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    Chặn endpoint quản trị nếu header X-Admin-Token không khớp ADMIN_TOKEN
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Endpoint quản trị đang tắt (chưa đặt ADMIN_TOKEN)")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Sai admin token")
+
+
+def client_id(request: Request) -> str:
+    if settings.RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def rate_limit(request: Request):
+    """
+    Token bucket theo client (RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST). Vượt giới hạn -> 429
+    """
+    if not rate_limiter.enabled:
+        return
+    wait = rate_limiter.acquire(client_id(request))
+    if wait:
+        RATE_LIMITED.inc(route_label(request.scope))
+        raise HTTPException(
+            status_code=429, detail="Quá nhiều request, thử lại sau",
+            headers={"Retry-After": rate_limiter.retry_after(wait)},
+        )
@@ -1,10 +1,23 @@
-from fastapi import APIRouter, HTTPException, Query
+import asyncio
+import hashlib
+import time
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from app.api.deps import rate_limit, require_admin
+from app.core.config import settings
+from app.core.metrics import ENRICH_STAGE
+from app.core.profiling import profile_store
+from app.core.singleflight import enrich_flight
 from app.db.database import db
-from app.schemas.schemas import SearchResultItem, KnowledgeResponse, HealthResponse
-from app.services.enrichment import enrichment_service
+from app.schemas.schemas import SearchResultItem, KnowledgeResponse, HealthResponse, EnrichBatchRequest
+from app.services.cache import response_cache
+from app.services.enrichment import enrichment_service, TEMPLATE_PROJECTION
+from app.services.export import export_service, ExportResponse, EXPORT_PARTS
+from app.services.search import search_service
+from app.services.suggest import suggest_service
+from app.utils.responses import FastJSONResponse, dumps
 from app.utils.storage import storage_client
 from fastapi.responses import RedirectResponse
-from typing import List
+from typing import Any, Dict, List, Optional
 
 router = APIRouter()
 
@@ -16,116 +29,406 @@ def health():
 # API 1: Search
 @router.get("/search", response_model=List[SearchResultItem])
 async def search_diagrams(
-    q: str = Query(..., min_length=2, description="Từ khóa tìm kiếm (VD: frog, cycle)")
+    q: str = Query(..., min_length=2, description="Từ khóa tìm kiếm (VD: frog, cycle)"),
+    limit: int = Query(20, ge=1, le=100, description="Số kết quả mỗi trang"),
+    offset: int = Query(0, ge=0, le=10000, description="Bỏ qua bao nhiêu kết quả (phân trang)")
 ):
-    if db.pg_conn is None or db.pg_conn.closed:
-        db.connect()
-    cursor = db.pg_conn.cursor()
-    
-    # Join với bảng entities để tìm cả chữ bên trong ảnh
-    sql = """
-        SELECT DISTINCT d.id, d.category, d.storage_path 
-        FROM diagrams d
-        LEFT JOIN entities e ON d.id = e.diagram_id
-        WHERE 
-            d.id ILIKE %s 
-            OR d.category ILIKE %s 
-            OR e.content ILIKE %s 
-        LIMIT 20;
-    """
-    search_term = f"%{q}%"
-    cursor.execute(sql, (search_term, search_term, search_term))
-    
-    results = cursor.fetchall()
-    cursor.close()
+    # Tìm trên id, category và cả chữ bên trong ảnh, kết quả xếp theo độ liên quan
+    results = await search_service.search(q, limit=limit, offset=offset)
     
+    # Tự động tạo link ảnh cho các kết quả tìm được (ký 1 lượt, có cache)
+    image_links = storage_client.generate_presigned_urls(row['id'] for row in results)
+
     data = []
     for row in results:
-        # Tự động tạo link ảnh cho mỗi kết quả tìm được
-        image_link = storage_client.generate_presigned_url(row['id'])
         data.append(SearchResultItem(
             diagram_id=row['id'],
             category=row['category'],
-            storage_path=image_link
+            storage_path=image_links[row['id']]
         ))
     return data
 
+# Gợi ý khi gõ: tra index tiền tố trong RAM (category + chữ trong ảnh + concept), không gọi DB/R2
+@router.get("/suggest")
+def suggest(
+    q: str = Query(..., min_length=1, max_length=100, description="Phần đã gõ (VD: fr, life cy)"),
+    limit: int = Query(10, ge=1, le=20, description="Số gợi ý tối đa"),
+):
+    results = suggest_service.suggest(q, limit)
+    if results is None:
+        raise HTTPException(status_code=503, detail="Index gợi ý đang được nạp", headers={"Retry-After": "5"})
+    return FastJSONResponse(results, headers={"Cache-Control": f"public, max-age={settings.SUGGEST_CACHE_SECONDS}"})
+
+# Trạng thái index tìm kiếm (chế độ, số sơ đồ, bộ nhớ đang dùng). Chỉ admin: phải duyệt mọi posting list
+@router.get("/search/index", dependencies=[Depends(require_admin)])
+def search_index_stats():
+    return search_service.memory_stats()
+
+# Nạp ngay các thay đổi (gọi sau khi chạy build_search_index.py thay vì chờ lịch refresh)
+@router.post("/search/index/refresh", dependencies=[Depends(require_admin)])
+async def refresh_search_index():
+    if search_service.memory_index is None:
+        raise HTTPException(status_code=409, detail="SEARCH_MODE không phải memory")
+    return await search_service.refresh_memory_index()
+
+MAX_DETAIL_FIELDS = 20
+
+def _detail_projection(fields: Optional[str]) -> Optional[Dict[str, int]]:
+    """
+    "text,relationships.R1" -> projection Mongo. Bỏ đường dẫn con nếu đã lấy cả trường cha
+    (Mongo báo lỗi path collision khi có cả "text" lẫn "text.T1")
+    """
+    if fields is None:
+        return None
+    names = sorted({name.strip() for name in fields.split(",") if name.strip()})
+    if not names or len(names) > MAX_DETAIL_FIELDS:
+        raise HTTPException(status_code=400, detail=f"fields phải có từ 1 đến {MAX_DETAIL_FIELDS} trường")
+    if any("$" in name or name.startswith(".") or name.endswith(".") or ".." in name for name in names):
+        raise HTTPException(status_code=400, detail="Tên trường không hợp lệ")
+    projection = {}
+    for name in names:  # đã sắp xếp -> trường cha luôn đứng trước trường con
+        if not any(name.startswith(parent + ".") for parent in projection):
+            projection[name] = 1
+    return projection
+
 # API 2: Detail
 @router.get("/diagrams/{diagram_id}")
-async def get_diagram_detail(diagram_id: str):
+async def get_diagram_detail(
+    diagram_id: str,
+    fields: Optional[str] = Query(None, description="Chỉ lấy các trường này, cách nhau dấu phẩy (VD: text,relationships)")
+):
     """
     Lấy metadata chi tiết từ MongoDB
     """
-    # 1. Tìm trong Mongo
-    doc = db.mongo_db["diagrams"].find_one({"_id": diagram_id})
+    # 1. Tìm trong Mongo (chỉ các trường được yêu cầu nếu có `fields`)
+    doc = await db.mongo("diagrams").find_one({"_id": diagram_id}, _detail_projection(fields))
     
     if not doc:
         raise HTTPException(status_code=404, detail="Không tìm thấy ảnh này")
 
-    # 2. Chuẩn hóa dữ liệu trả về 
-    return {
+    # 2. Chuẩn hóa dữ liệu trả về (trả thẳng response orjson, không qua jsonable_encoder)
+    return FastJSONResponse({
         "diagram_id": diagram_id,
         "raw_data": doc, # Trả về nguyên cục JSON trong Mongo
         "message": "Dữ liệu thô từ MongoDB"
-    }
+    })
+
+# Export hàng loạt: NDJSON (mỗi dòng 1 sơ đồ), gửi dần từng batch thay vì gọi /diagrams/{id} từng cái
+@router.get("/export/diagrams")
+async def export_diagrams(
+    include: str = Query("basic,raw", description="Các phần của mỗi dòng: basic (category, group_type), raw (document Mongo), template (dữ liệu đã format như /enrich)"),
+    fields: Optional[str] = Query(None, description="Chỉ lấy các trường này của raw (như /diagrams/{id})"),
+    after: Optional[str] = Query(None, description="Chỉ lấy sơ đồ có id > after (tiếp tục export bị ngắt)"),
+    limit: Optional[int] = Query(None, ge=1, description="Số sơ đồ tối đa"),
+    batch_size: Optional[int] = Query(None, ge=1, le=5000, description="Số sơ đồ mỗi lần đọc DB"),
+):
+    requested = {part.strip() for part in include.split(",") if part.strip()}
+    unknown = requested - set(EXPORT_PARTS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"include không hợp lệ: {', '.join(sorted(unknown))}")
+    parts = tuple(part for part in EXPORT_PARTS if part in requested)
+    if fields is not None and "template" in parts:
+        # template cần các trường cố định của document, không ghép với projection tùy ý được
+        raise HTTPException(status_code=400, detail="Không dùng fields cùng include=template")
+    projection = _detail_projection(fields)
+    db.mongo("diagrams")  # Mongo chưa sẵn sàng -> 503 ngay, trước khi gửi status 200
+
+    slot = export_service.reserve()
+    if slot is None:
+        raise HTTPException(status_code=429, detail="Đang có quá nhiều export chạy, thử lại sau")
+    return ExportResponse(
+        export_service.stream(parts, projection, after=after, limit=limit, batch_size=batch_size, slot=slot),
+        slot=slot,
+        media_type="application/x-ndjson",
+    )
 
 # API 3: LÀM GIÀU TRI THỨC
-@router.get("/enrich/{diagram_id}", response_model=KnowledgeResponse)
-async def enrich_knowledge(diagram_id: str):
+
+async def _timed(name: str, coro, timeout: float, timings: Dict[str, float]):
     """
-    Trả về dữ liệu đã được làm giàu + Gợi ý liên kết
+    Chạy 1 bước lấy dữ liệu với timeout, ghi lại thời gian (ms) vào `timings`
     """
-    # 1. Lấy thông tin cơ bản từ Postgres
-    if db.pg_conn is None or db.pg_conn.closed:
-        db.connect()
-    cursor = db.pg_conn.cursor()
-    
-    cursor.execute("SELECT id, category, group_type FROM diagrams WHERE id = %s", (diagram_id,))
-    basic_info = cursor.fetchone()
-    
+    start = time.perf_counter()
+    try:
+        return await asyncio.wait_for(coro, timeout=timeout)
+    finally:
+        timings[name] = (time.perf_counter() - start) * 1000
+
+async def _optional(task: asyncio.Task, name: str, default, degraded: List[str]):
+    """
+    Nguồn phụ: lỗi hoặc quá hạn thì trả về giá trị mặc định thay vì làm hỏng cả request
+    """
+    try:
+        return await task
+    except Exception as e:
+        print(f"- Enrich: bỏ qua bước {name}: {e!r}")
+        degraded.append(name)
+        return default
+
+async def _build_knowledge(diagram_id: str, timings: Dict[str, float], degraded: List[str]) -> Dict[str, Any]:
+    related_task = asyncio.create_task(_timed(
+        "related",
+        enrichment_service.get_related_diagrams(diagram_id),
+        settings.ENRICH_RELATED_TIMEOUT, timings,
+    ))
+
+    # Template đã tính sẵn: 1 lần tra khóa chính thay cho Postgres + Mongo + format
+    if settings.ENRICH_MODE == "precomputed":
+        start = time.perf_counter()
+        row = (await enrichment_service.get_materialized([diagram_id])).get(diagram_id)
+        timings["materialized"] = (time.perf_counter() - start) * 1000
+        if row is not None:
+            keywords, related_list = await _optional(related_task, "related", ([], []), degraded)
+            return _knowledge_dict(diagram_id, row['category'], row['group_type'], row['template_type'],
+                                   row['data'], related_list)
+
+    # 1-3. Ba nguồn độc lập -> chạy song song thay vì lần lượt Postgres -> Mongo -> Postgres
+    basic_task = asyncio.create_task(_timed(
+        "basic",
+        db.pg_fetch(
+            "SELECT id, category, group_type FROM diagrams WHERE id = %s", (diagram_id,),
+            fetch="one", name="diagram_basic",
+        ),
+        settings.ENRICH_BASIC_TIMEOUT, timings,
+    ))
+    # Chi tiết từ MongoDB (Tọa độ, Bbox...)
+    mongo_task = asyncio.create_task(_timed(
+        "mongo",
+        db.mongo("diagrams").find_one({"_id": diagram_id}, TEMPLATE_PROJECTION),
+        settings.ENRICH_MONGO_TIMEOUT, timings,
+    ))
+
+    # Thông tin cơ bản là bắt buộc: không có thì dừng luôn, hủy các bước còn lại
+    try:
+        basic_info = await basic_task
+    except asyncio.TimeoutError:
+        mongo_task.cancel()
+        related_task.cancel()
+        raise HTTPException(status_code=504, detail="Postgres phản hồi quá chậm")
+    except Exception:
+        mongo_task.cancel()
+        related_task.cancel()
+        raise
+
     if not basic_info:
+        mongo_task.cancel()
+        related_task.cancel()
         raise HTTPException(status_code=404, detail="Không tìm thấy ảnh")
 
-    # 2. Lấy chi tiết từ MongoDB (Tọa độ, Bbox...)
-    mongo_doc = db.mongo_db["diagrams"].find_one({"_id": diagram_id})
-    if not mongo_doc:
-        mongo_data = {}
-    else:
-        # Lọc bớt dữ liệu rác nếu cần, hoặc trả về hết
-        mongo_data = {
-            "entities": mongo_doc.get("entities", [])
-        }
+    mongo_doc = await _optional(mongo_task, "mongo", None, degraded)
+    keywords, related_list = await _optional(related_task, "related", ([], []), degraded)
+
+    start = time.perf_counter()
+    knowledge = _knowledge_from(diagram_id, basic_info, mongo_doc, related_list)
+    timings["format"] = (time.perf_counter() - start) * 1000
+    return knowledge
+
+def _knowledge_from(diagram_id: str, basic_info, mongo_doc, related_list) -> Dict[str, Any]:
+    template_type = enrichment_service.template_type_for(basic_info['group_type'])
 
-   # 3. CHẠY THUẬT TOÁN LÀM GIÀU
-    keywords, related_list = enrichment_service.get_related_diagrams(diagram_id)
-    
-    # Xác định loại template
-    template_type = "structure_view" if basic_info['group_type'] == 'Structure' else "process_view"
-    
     # Gọi hàm xử lý dữ liệu theo template
     formatted_data = enrichment_service.process_template_data(template_type, mongo_doc)
-    # ----------------
+    return _knowledge_dict(diagram_id, basic_info['category'], basic_info['group_type'], template_type,
+                           formatted_data, related_list)
 
+def _knowledge_dict(diagram_id: str, category, group_type, template_type: str, data, related_list) -> Dict[str, Any]:
+    """
+    Dữ liệu đúng khuôn KnowledgeResponse. Trả dict thay vì dựng model: formatter đã tạo đúng kiểu,
+    validate lại hàng trăm parts/stages chỉ tốn CPU (serialize bằng orjson ở endpoint)
+    """
     # 4. Ghép vào Response
-    response = KnowledgeResponse(
-        diagram_id=diagram_id,
-        title=f"Biểu đồ về {basic_info['category']}",
-        group_type=basic_info['group_type'] or "Unknown",
-        template_type=template_type,
-        
+    return {
+        "diagram_id": diagram_id,
+        "title": f"Biểu đồ về {category}",
+        "group_type": group_type or "Unknown",
+        "template_type": template_type,
+
         # trả về dữ liệu đã format
-        data=formatted_data, 
-        
-        related_knowledge=related_list
-    )
-    
-    return response
+        "data": data,
+
+        "related_knowledge": related_list
+    }
+
+def _etag(body: bytes) -> str:
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
+
+async def _compute_enrich(diagram_id: str, cache_key: str):
+    timings: Dict[str, float] = {}
+    degraded: List[str] = []
+    knowledge = await _build_knowledge(diagram_id, timings, degraded)
+    body = dumps(knowledge)
+    etag = _etag(body)
+    # Kết quả thiếu phần (nguồn phụ lỗi/quá hạn) thì không cache
+    if not degraded:
+        await response_cache.set(cache_key, (etag, body))
+    for name, ms in timings.items():
+        ENRICH_STAGE.observe(ms / 1000, name)
+    return etag, body, timings, degraded
+
+@router.get("/enrich/{diagram_id}", response_model=KnowledgeResponse, dependencies=[Depends(rate_limit)])
+async def enrich_knowledge(diagram_id: str, request: Request):
+    """
+    Trả về dữ liệu đã được làm giàu + Gợi ý liên kết.
+    Kết quả được cache theo phiên bản dữ liệu, hỗ trợ ETag / If-None-Match (304).
+    Cache chưa có mà nhiều request cùng id đến 1 lúc -> chỉ 1 request lấy dữ liệu, các request khác dùng chung
+    """
+    cache_key = await response_cache.key("enrich", diagram_id)
+    cached = await response_cache.get(cache_key)
+    if cached is not None:
+        etag, body = cached
+        timings, degraded = {}, []
+        headers = {"ETag": etag, "X-Cache": "HIT"}
+    else:
+        (etag, body, timings, degraded), shared = await enrich_flight.do(
+            cache_key, _compute_enrich, diagram_id, cache_key
+        )
+        headers = {"ETag": etag, "X-Cache": "COALESCED" if shared else "MISS"}
+
+    # Thời gian từng bước, xem được trong DevTools (tab Timing) hoặc log của gateway
+    if timings:
+        headers["Server-Timing"] = ", ".join(f"{name};dur={ms:.1f}" for name, ms in timings.items())
+    if degraded:
+        headers["X-Enrich-Degraded"] = ",".join(degraded)
+
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# API 3b: LÀM GIÀU NHIỀU SƠ ĐỒ 1 LẦN (lưới ảnh ở frontend)
+@router.post("/enrich:batch", response_model=List[KnowledgeResponse])
+async def enrich_knowledge_batch(payload: EnrichBatchRequest):
+    """
+    Giống /enrich/{diagram_id} cho tối đa ENRICH_BATCH_MAX sơ đồ: mỗi nguồn dữ liệu chỉ 1 round trip.
+    Trả về theo thứ tự id gửi lên, bỏ qua id không tồn tại.
+    """
+    diagram_ids = list(dict.fromkeys(payload.ids))  # bỏ trùng, giữ thứ tự (số id đã kiểm tra ở schema)
+
+    # Lấy từ cache trước, chỉ tính các id còn thiếu
+    cache_keys = {diagram_id: await response_cache.key("enrich", diagram_id) for diagram_id in diagram_ids}
+    bodies: Dict[str, bytes] = {}
+    for diagram_id in diagram_ids:
+        cached = await response_cache.get(cache_keys[diagram_id])
+        if cached is not None:
+            bodies[diagram_id] = cached[1]
+    missing = [diagram_id for diagram_id in diagram_ids if diagram_id not in bodies]
+    degraded: List[str] = []
+
+    if missing:
+        materialized = {}
+        if settings.ENRICH_MODE == "precomputed":
+            materialized = await enrichment_service.get_materialized(missing)
+        live = [diagram_id for diagram_id in missing if diagram_id not in materialized]
+
+        # Cùng timeout/cách xử lý lỗi như /enrich/{id}: Postgres (basic) bắt buộc, Mongo và related là nguồn phụ
+        timings: Dict[str, float] = {}
+        related_task = asyncio.create_task(_timed(
+            "related", enrichment_service.get_related_diagrams_batch(missing),
+            settings.ENRICH_RELATED_TIMEOUT, timings,
+        ))
+        basic_rows, mongo_docs = [], []
+        if live:
+            basic_task = asyncio.create_task(_timed(
+                "basic",
+                db.pg_fetch(
+                    "SELECT id, category, group_type FROM diagrams WHERE id = ANY(%s)", (live,),
+                    name="diagram_basic_batch",
+                ),
+                settings.ENRICH_BASIC_TIMEOUT, timings,
+            ))
+            mongo_task = asyncio.create_task(_timed(
+                "mongo",
+                db.mongo("diagrams").find({"_id": {"$in": live}}, TEMPLATE_PROJECTION).to_list(None),
+                settings.ENRICH_MONGO_TIMEOUT, timings,
+            ))
+            try:
+                basic_rows = await basic_task
+            except asyncio.TimeoutError:
+                mongo_task.cancel()
+                related_task.cancel()
+                raise HTTPException(status_code=504, detail="Postgres phản hồi quá chậm")
+            except Exception:
+                mongo_task.cancel()
+                related_task.cancel()
+                raise
+            mongo_docs = await _optional(mongo_task, "mongo", [], degraded)
+        related = await _optional(related_task, "related", {}, degraded)
+        basic_by_id = {row['id']: row for row in basic_rows}
+        docs_by_id = {doc["_id"]: doc for doc in mongo_docs}
+
+        for diagram_id in missing:
+            related_list = related.get(diagram_id, ([], []))[1]
+            if diagram_id in materialized:
+                row = materialized[diagram_id]
+                knowledge = _knowledge_dict(diagram_id, row['category'], row['group_type'], row['template_type'],
+                                            row['data'], related_list)
+            elif diagram_id in basic_by_id:
+                knowledge = _knowledge_from(diagram_id, basic_by_id[diagram_id], docs_by_id.get(diagram_id),
+                                            related_list)
+            else:
+                continue
+            body = dumps(knowledge)
+            bodies[diagram_id] = body
+            # Kết quả thiếu phần thì không cache (giống /enrich/{id})
+            if not degraded:
+                await response_cache.set(cache_keys[diagram_id], (_etag(body), body))
+        for name, ms in timings.items():
+            ENRICH_STAGE.observe(ms / 1000, name)
+
+    # Các phần tử đã là JSON hoàn chỉnh -> ghép thẳng, không parse/serialize lại
+    content = b"[" + b",".join(bodies[i] for i in diagram_ids if i in bodies) + b"]"
+    headers = {"X-Enrich-Degraded": ",".join(degraded)} if degraded else None
+    return Response(content=content, media_type="application/json", headers=headers)
+
+# Xóa cache /enrich + tăng phiên bản dữ liệu (VD: sau khi nạp lại dữ liệu AI2D)
+@router.post("/admin/cache/invalidate", dependencies=[Depends(require_admin)])
+async def invalidate_cache():
+    version = await response_cache.invalidate()
+    return {"data_version": version}
+
+@router.get("/admin/cache", dependencies=[Depends(require_admin)])
+def cache_stats():
+    return response_cache.stats()
+
+# Profile request (PROFILING_ENABLED + header X-Profile): danh sách, chi tiết JSON hoặc file pstats
+@router.get("/admin/profiles", dependencies=[Depends(require_admin)])
+def list_profiles():
+    return profile_store.list()
+
+@router.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+def get_profile(profile_id: int, format: str = Query("json", pattern="^(json|pstats)$")):
+    """
+    format=json: query DB theo thứ tự thời gian + top hàm theo cumulative time.
+    format=pstats: file cho `python -m pstats` / snakeviz
+    """
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Không có profile (đã bị đẩy khỏi buffer?)")
+    if format == "pstats":
+        return Response(
+            content=profile.pstats_bytes(),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.pstats"'},
+        )
+    return profile.detail()
+
+@router.delete("/admin/profiles", dependencies=[Depends(require_admin)])
+def clear_profiles():
+    profile_store.clear()
+    return {"status": "ok"}
 
 # API 4: LẤY ẢNH (UTILS)
-@router.get("/diagrams/{diagram_id}/image")
+@router.get("/diagrams/{diagram_id}/image", dependencies=[Depends(rate_limit)])
 async def get_diagram_image(diagram_id: str):
     """
-    Task 4: Trả về link ảnh trực tiếp từ R2 (Redirect luôn sang ảnh cho tiện)
+    Task 4: Trả về link ảnh trực tiếp từ R2 (Redirect luôn sang ảnh cho tiện).
+    Không cần gộp request: ký link chạy đồng bộ (không nhường event loop) và có cache,
+    request trùng đến sau dùng luôn link trong cache
     """
     # 1. Tạo link presigned
     url = storage_client.generate_presigned_url(diagram_id)
@@ -1,4 +1,5 @@
 import os
+from typing import List
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,6 +11,8 @@ class Settings:
     # Mongo
     MONGO_URL: str = os.getenv("MONGO_URL")
     MONGO_DB_NAME: str = os.getenv("MONGO_DB_NAME")
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
     
     # Postgres
     POSTGRES_USER: str = os.getenv("POSTGRES_USER")
@@ -17,15 +20,104 @@ class Settings:
     POSTGRES_SERVER: str = os.getenv("POSTGRES_SERVER")
     POSTGRES_PORT: str = os.getenv("POSTGRES_PORT", "5432")
     POSTGRES_DB: str = os.getenv("POSTGRES_DB")
+    PG_POOL_MIN: int = int(os.getenv("PG_POOL_MIN", "1"))
+    PG_POOL_MAX: int = int(os.getenv("PG_POOL_MAX", "10"))
+    PG_POOL_TIMEOUT: float = float(os.getenv("PG_POOL_TIMEOUT", "5"))
+    # Connection nằm trong pool quá số giây này thì SELECT 1 trước khi giao (0 = kiểm tra mỗi lần mượn)
+    PG_POOL_CHECK_IDLE: float = float(os.getenv("PG_POOL_CHECK_IDLE", "30"))
+
+    # Khởi động: các DB được mở song song ở nền, mỗi lần thử tối đa DB_CONNECT_TIMEOUT giây.
+    # Startup chờ tối đa STARTUP_WAIT_TIMEOUT giây (0 = không chờ), DB chưa lên thì thử lại
+    # ở nền, giãn cách từ DB_RECONNECT_MIN_DELAY tới DB_RECONNECT_MAX_DELAY giây
+    DB_CONNECT_TIMEOUT: float = float(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+    STARTUP_WAIT_TIMEOUT: float = float(os.getenv("STARTUP_WAIT_TIMEOUT", "10"))
+    DB_RECONNECT_MIN_DELAY: float = float(os.getenv("DB_RECONNECT_MIN_DELAY", "1"))
+    DB_RECONNECT_MAX_DELAY: float = float(os.getenv("DB_RECONNECT_MAX_DELAY", "60"))
     
+    # Timeout (giây) cho từng nguồn dữ liệu của /enrich
+    ENRICH_BASIC_TIMEOUT: float = float(os.getenv("ENRICH_BASIC_TIMEOUT", "2"))
+    ENRICH_MONGO_TIMEOUT: float = float(os.getenv("ENRICH_MONGO_TIMEOUT", "2"))
+    ENRICH_RELATED_TIMEOUT: float = float(os.getenv("ENRICH_RELATED_TIMEOUT", "1"))
+    ENRICH_BATCH_MAX: int = int(os.getenv("ENRICH_BATCH_MAX", "100"))
+    # "live" (tính từ Mongo mỗi lần) hoặc "precomputed" (đọc bảng diagram_enrichment, thiếu thì tính live)
+    ENRICH_MODE: str = os.getenv("ENRICH_MODE", "live")
+
+    # Export NDJSON (/export/diagrams): số sơ đồ mỗi batch đọc DB, số batch đọc trước tối đa
+    # (giới hạn bộ nhớ mỗi stream), số stream chạy cùng lúc
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+    EXPORT_PREFETCH_BATCHES: int = int(os.getenv("EXPORT_PREFETCH_BATCHES", "2"))
+    EXPORT_MAX_STREAMS: int = int(os.getenv("EXPORT_MAX_STREAMS", "4"))
+
+    # Cache phản hồi /enrich: "memory" (LRU trong process) hoặc "mongo" (dùng chung giữa các replica)
+    ENRICH_CACHE_BACKEND: str = os.getenv("ENRICH_CACHE_BACKEND", "memory")
+    ENRICH_CACHE_SIZE: int = int(os.getenv("ENRICH_CACHE_SIZE", "2000"))
+    ENRICH_CACHE_TTL: float = float(os.getenv("ENRICH_CACHE_TTL", "3600"))
+    # Số template đã format (parts/stages) giữ trong RAM
+    TEMPLATE_CACHE_SIZE: int = int(os.getenv("TEMPLATE_CACHE_SIZE", "2000"))
+    # Bao lâu đọc lại phiên bản dữ liệu từ Mongo một lần (giây)
+    DATA_VERSION_TTL: float = float(os.getenv("DATA_VERSION_TTL", "10"))
+
+    # Tìm kiếm: "postgres" (bảng diagram_search) hoặc "memory" (inverted index trong RAM)
+    SEARCH_MODE: str = os.getenv("SEARCH_MODE", "postgres")
+    SEARCH_INDEX_NGRAM: int = int(os.getenv("SEARCH_INDEX_NGRAM", "3"))
+    SEARCH_INDEX_REFRESH_SECONDS: float = float(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", "300"))
+
+    # Gợi ý khi gõ (/suggest): index tiền tố trong RAM, làm mới ở nền mỗi SUGGEST_REFRESH_SECONDS
+    # (0 = chỉ nạp 1 lần), trình duyệt được cache kết quả SUGGEST_CACHE_SECONDS giây
+    SUGGEST_ENABLED: bool = os.getenv("SUGGEST_ENABLED", "true").lower() in ("1", "true", "yes")
+    SUGGEST_REFRESH_SECONDS: float = float(os.getenv("SUGGEST_REFRESH_SECONDS", "600"))
+    SUGGEST_CACHE_SECONDS: int = int(os.getenv("SUGGEST_CACHE_SECONDS", "60"))
+
+    # Health check: timeout mỗi lần ping (readiness), DB bắt buộc để ready,
+    # chu kỳ làm mới số bản ghi hiển thị ở /health (task nền, 0 = tắt)
+    HEALTH_CHECK_TIMEOUT: float = float(os.getenv("HEALTH_CHECK_TIMEOUT", "1"))
+    HEALTH_REQUIRED_STORES: List[str] = [
+        store.strip() for store in os.getenv("HEALTH_REQUIRED_STORES", "mongo,postgres").split(",") if store.strip()
+    ]
+    HEALTH_COUNTS_INTERVAL: float = float(os.getenv("HEALTH_COUNTS_INTERVAL", "300"))
+    HEALTH_COUNTS_TIMEOUT: float = float(os.getenv("HEALTH_COUNTS_TIMEOUT", "10"))
+
+    # Gộp các request /enrich trùng id đang chạy cùng lúc thành 1 lần lấy dữ liệu
+    COALESCE_ENABLED: bool = os.getenv("COALESCE_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Giới hạn tốc độ theo client (token bucket) cho /enrich và /diagrams/{id}/image: 0 = tắt.
+    # Client = IP kết nối, hoặc IP đầu tiên trong X-Forwarded-For khi chạy sau proxy tin cậy
+    RATE_LIMIT_PER_SECOND: float = float(os.getenv("RATE_LIMIT_PER_SECOND", "0"))
+    RATE_LIMIT_BURST: int = int(os.getenv("RATE_LIMIT_BURST", "20"))
+    RATE_LIMIT_MAX_CLIENTS: int = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+    RATE_LIMIT_TRUST_FORWARDED: bool = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+
+    # Metrics kiểu Prometheus ở /metrics (thời gian theo route, theo query DB, pool, cache...)
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Profile request theo yêu cầu (header X-Profile + X-Admin-Token), giữ PROFILE_BUFFER_SIZE profile gần nhất
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+    PROFILE_BUFFER_SIZE: int = int(os.getenv("PROFILE_BUFFER_SIZE", "20"))
+
+    # Token cho các endpoint quản trị (header X-Admin-Token). Để trống = tắt các endpoint này
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN")
+
     # Cloudflare R2
     R2_ACCOUNT_ID: str = os.getenv("R2_ACCOUNT_ID")
     R2_ACCESS_KEY: str = os.getenv("R2_ACCESS_KEY")
     R2_SECRET_KEY: str = os.getenv("R2_SECRET_KEY")
     R2_BUCKET_NAME: str = os.getenv("R2_BUCKET_NAME")
+    # Cache link ảnh đã ký: ký lại khi hạn còn < MIN_REMAINING giây, thời điểm ký làm tròn theo BUCKET giây
+    R2_URL_CACHE_SIZE: int = int(os.getenv("R2_URL_CACHE_SIZE", "10000"))
+    R2_URL_BUCKET_SECONDS: int = int(os.getenv("R2_URL_BUCKET_SECONDS", "600"))
+    R2_URL_MIN_REMAINING: int = int(os.getenv("R2_URL_MIN_REMAINING", "900"))
 
     # Neo4j
     NEO4J_URI: str = os.getenv("NEO4J_URI")
     NEO4J_USER: str = os.getenv("NEO4J_USER")
     NEO4J_PASSWORD: str = os.getenv("NEO4J_PASSWORD")
+    NEO4J_MAX_CONCURRENCY: int = int(os.getenv("NEO4J_MAX_CONCURRENCY", "10"))
+
+    # Gợi ý sơ đồ liên quan: "sql" (trùng từ khóa trong Postgres), "graph" (đồ thị concept Neo4j)
+    # hoặc "precomputed" (bảng diagram_related tạo bởi app/scripts/build_similarity.py)
+    RELATED_MODE: str = os.getenv("RELATED_MODE", "sql")
+    RELATED_LIMIT: int = int(os.getenv("RELATED_LIMIT", "10"))
+    RELATED_GRAPH_DEPTH: int = int(os.getenv("RELATED_GRAPH_DEPTH", "2"))
+    RELATED_GRAPH_DECAY: float = float(os.getenv("RELATED_GRAPH_DECAY", "0.5"))
+    RELATED_GRAPH_MAX_CONCEPTS: int = int(os.getenv("RELATED_GRAPH_MAX_CONCEPTS", "200"))
+    RELATED_GRAPH_TIMEOUT: float = float(os.getenv("RELATED_GRAPH_TIMEOUT", "0.5"))
+    RELATED_GRAPH_CACHE_SIZE: int = int(os.getenv("RELATED_GRAPH_CACHE_SIZE", "5000"))
 settings = Settings()
\ No newline at end of file
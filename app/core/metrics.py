@@ -0,0 +1,167 @@
+"""
+Metrics kiểu Prometheus (text exposition format 0.0.4), viết gọn trong process:
+mỗi lần ghi chỉ là tra dict + cộng số dưới 1 lock, không có thư viện ngoài.
+Các số liệu có sẵn ở nơi khác (pool, cache...) được đọc lúc scrape qua `register_collector`.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Mốc histogram (giây): từ truy vấn cache (~1ms) tới request chậm (vài giây)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labelnames, labels)} {value}" for labels, value in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [đếm theo từng mốc (không cộng dồn) ..., +Inf, tổng thời gian]
+        self._values: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 2)
+            row[index] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(row)) for labels, row in self._values.items()]
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), row):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {row[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def metric_lines(name: str, documentation: str, samples: Iterable[Tuple[Dict[str, str], float]],
+                 kind: str = "gauge") -> List[str]:
+    """Dòng metric cho collector: samples = [(nhãn, giá trị), ...], kind = gauge | counter"""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {value}")
+    return lines
+
+
+def route_label(scope) -> str:
+    """
+    Nhãn route cho metrics và rate limit: template của route đã khớp (/api/v1/enrich/{diagram_id}),
+    không phải URL thật -> số nhãn cố định. Route trong router con (include_router) không mang
+    prefix trong `route.path`: ghép prefix mà FastAPI ghi vào scope khi khớp route
+    (FastAPI cũ chép route kèm prefix vào app -> không có thông tin này, prefix rỗng)
+    """
+    route = scope.get("route")
+    # URL không khớp route nào (404) gom chung 1 nhãn
+    if route is None:
+        return "unmatched"
+    included = (scope.get("fastapi") or {}).get("included_router")
+    prefix = getattr(getattr(included, "include_context", None), "prefix", "") or ""
+    return prefix + route.path
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[str]]):
+        """Hàm trả về các dòng metric, được gọi mỗi lần scrape /metrics"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.collect()
+        for collector in self._collectors:
+            try:
+                lines += collector()
+            except Exception as e:
+                print(f"- Metrics collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+# Registry dùng chung + các metric chính
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "Thời gian xử lý request theo route", ("method", "route", "status"),
+)
+DB_LATENCY = registry.histogram(
+    "db_query_duration_seconds", "Thời gian mỗi lần gọi DB theo store và tên query", ("store", "query"),
+)
+DB_ERRORS = registry.counter("db_query_errors_total", "Số lần gọi DB bị lỗi", ("store", "query"))
+DB_CONNECT_ERRORS = registry.counter("db_connect_errors_total", "Số lần kết nối DB thất bại", ("store",))
+PG_POOL_WAIT = registry.histogram(
+    "pg_pool_wait_seconds", "Thời gian chờ mượn connection Postgres từ pool",
+    buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+ENRICH_STAGE = registry.histogram("enrich_stage_duration_seconds", "Thời gian từng bước của /enrich", ("stage",))
+PRESIGN = registry.counter("r2_presign_total", "Số link R2 theo kết quả (cache/signed/error)", ("result",))
+COALESCED = registry.counter(
+    "coalesced_requests_total", "Số request dùng chung kết quả của request trùng đang chạy", ("flight",),
+)
+RATE_LIMITED = registry.counter("rate_limited_total", "Số request bị từ chối vì vượt giới hạn tốc độ", ("route",))
@@ -0,0 +1,147 @@
+"""
+Profile từng request theo yêu cầu (chẩn đoán endpoint chậm):
+bật PROFILING_ENABLED, rồi gửi request kèm header `X-Profile: 1` + `X-Admin-Token`.
+Mỗi profile gồm cProfile của event loop trong lúc request chạy + danh sách query DB kèm thời gian,
+giữ N profile gần nhất trong RAM (PROFILE_BUFFER_SIZE), tải về qua /api/v1/admin/profiles.
+"""
+import cProfile
+import io
+import itertools
+import marshal
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+# Profile của request đang chạy (task con / thread executor thấy qua context copy)
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+
+
+class RequestProfile:
+    def __init__(self, profile_id: int, method: str, path: str, query_string: str):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.status: Optional[int] = None
+        self.started_at = time.time()
+        self.duration_ms = 0.0
+        self.queries: List[Dict[str, Any]] = []
+        self.stats: Dict = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_query(self, store: str, name: str, started: float, duration: float, failed: bool):
+        entry = {
+            "store": store,
+            "query": name,
+            "start_ms": round((started - self._start) * 1000, 3),
+            "duration_ms": round(duration * 1000, 3),
+            "error": failed,
+        }
+        with self._lock:
+            self.queries.append(entry)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query_string": self.query_string,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            "query_count": len(self.queries),
+        }
+
+    def detail(self, top: int = 30) -> Dict[str, Any]:
+        """Tóm tắt dạng JSON: query theo thứ tự thời gian + các hàm tốn thời gian nhất (cumulative)"""
+        buffer = io.StringIO()
+        stats = pstats.Stats(stream=buffer)
+        stats.stats = dict(self.stats)
+        stats.get_top_level_stats()
+        stats.sort_stats("cumulative").print_stats(top)
+        return {**self.summary(), "queries": sorted(self.queries, key=lambda q: q["start_ms"]),
+                "top_functions": buffer.getvalue()}
+
+    def pstats_bytes(self) -> bytes:
+        """Giống pstats.Stats.dump_stats -> mở bằng `python -m pstats`, snakeviz..."""
+        return marshal.dumps(self.stats)
+
+
+class ProfileStore:
+    """
+    Ring buffer N profile gần nhất. cProfile chỉ bật được 1 cái trên 1 thread
+    -> tại mỗi thời điểm chỉ profile 1 request, request khác đến lúc đó chạy bình thường
+    """
+
+    def __init__(self, maxsize: int):
+        self._profiles: "deque[RequestProfile]" = deque(maxlen=maxsize)
+        self._ids = itertools.count(1)
+        self._active = threading.Lock()
+        self._lock = threading.Lock()
+
+    def begin(self, method: str, path: str, query_string: str) -> Optional[RequestProfile]:
+        """Trả về profile mới, hoặc None nếu đang profile request khác"""
+        if not self._active.acquire(blocking=False):
+            return None
+        return RequestProfile(next(self._ids), method, path, query_string)
+
+    def finish(self, profile: RequestProfile):
+        try:
+            with self._lock:
+                self._profiles.append(profile)
+        finally:
+            self._active.release()
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [profile.summary() for profile in reversed(self._profiles)]
+
+    def get(self, profile_id: int) -> Optional[RequestProfile]:
+        with self._lock:
+            for profile in self._profiles:
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+
+def record_query(store: str, name: str, started: float, duration: float, failed: bool = False):
+    """Gọi từ lớp DB: ghi query vào profile của request hiện tại (nếu có)"""
+    profile = _current.get()
+    if profile is not None:
+        profile.add_query(store, name, started, duration, failed)
+
+
+@contextmanager
+def capture(profile: RequestProfile):
+    """
+    Bật cProfile + gom query cho `profile` trong khối with, xong thì lưu vào ring buffer.
+    cProfile đo mọi code trên event loop trong lúc đó (cả request khác chạy xen),
+    phần chạy trong thread executor (Postgres, Neo4j) xem ở danh sách query
+    """
+    token = _current.set(profile)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profile
+    finally:
+        profiler.disable()
+        _current.reset(token)
+        profile.duration_ms = (time.perf_counter() - profile._start) * 1000
+        profiler.create_stats()
+        profile.stats = profiler.stats
+        profile_store.finish(profile)
+
+
+# Tạo instance
+profile_store = ProfileStore(maxsize=settings.PROFILE_BUFFER_SIZE)
@@ -0,0 +1,51 @@
+"""
+Giới hạn tốc độ theo client (token bucket): mỗi client có tối đa RATE_LIMIT_BURST token,
+nạp lại RATE_LIMIT_PER_SECOND token/giây, mỗi request tiêu 1 token. Hết token -> 429 + Retry-After.
+Trạng thái nằm trong RAM của từng replica (giới hạn thực tế = số replica x cấu hình).
+"""
+import math
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.core.config import settings
+
+
+class TokenBucketLimiter:
+    def __init__(self, rate: float, burst: int, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # client -> (số token còn lại, thời điểm cập nhật), LRU: client lâu không gọi bị bỏ trước
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self, client: str, now: Optional[float] = None) -> float:
+        """
+        Tiêu 1 token của `client`. Trả về 0 nếu được phép, ngược lại số giây cần chờ.
+        Chỉ gọi từ event loop (không có await ở giữa) nên không cần lock
+        """
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[client] = (tokens, now)
+        self._buckets.move_to_end(client)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return 0.0 if allowed else (1 - tokens) / self.rate
+
+    @staticmethod
+    def retry_after(wait: float) -> str:
+        return str(max(1, math.ceil(wait)))
+
+
+# Tạo instance
+rate_limiter = TokenBucketLimiter(
+    settings.RATE_LIMIT_PER_SECOND, settings.RATE_LIMIT_BURST, settings.RATE_LIMIT_MAX_CLIENTS
+)
@@ -0,0 +1,43 @@
+"""
+Gộp request trùng (single-flight): khi nhiều request cùng key đến lúc kết quả chưa có
+(VD: 1 sơ đồ được chia sẻ, hàng trăm người mở cùng lúc khi cache còn trống),
+chỉ request đầu tiên thực sự gọi DB, các request sau chờ và dùng chung kết quả đó.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from app.core.config import settings
+from app.core.metrics import COALESCED
+
+
+class SingleFlight:
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args) -> Tuple[Any, bool]:
+        """
+        Chạy fn(*args) nếu chưa có lời gọi nào cùng `key` đang chạy, ngược lại chờ lời gọi đó.
+        Trả về (kết quả, shared): shared = True nếu dùng lại kết quả của request khác.
+        Lỗi (kể cả HTTPException 404) cũng được chia cho mọi request đang chờ
+        """
+        if not self.enabled:
+            return await fn(*args), False
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            COALESCED.inc(self.name)
+        else:
+            # Chạy trong task riêng: request đầu bị hủy (client ngắt) thì các request đang chờ vẫn có kết quả
+            task = asyncio.ensure_future(fn(*args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _, key=key: self._inflight.pop(key, None))
+        return await asyncio.shield(task), shared
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+
+# Tạo instance
+enrich_flight = SingleFlight("enrich", enabled=settings.COALESCE_ENABLED)
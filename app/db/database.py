@@ -1,59 +1,433 @@
 # Hàm connect Mongo & Postgres
-from pymongo import MongoClient
+import asyncio
+import contextvars
+import functools
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pymongo import MongoClient, AsyncMongoClient, monitoring
 import psycopg2
-from neo4j import GraphDatabase
 from psycopg2.extras import RealDictCursor
 from app.core.config import settings
+from app.core.metrics import DB_CONNECT_ERRORS, DB_ERRORS, DB_LATENCY, PG_POOL_WAIT
+from app.core.profiling import record_query
+
+
+class PoolTimeoutError(Exception):
+    """Hết thời gian chờ lấy connection từ pool (pool đang bận hết)"""
+
+
+class StoreUnavailableError(Exception):
+    """DB chưa kết nối được (đang thử lại ở nền) -> API trả 503 thay vì tự kết nối giữa request"""
+
+
+class PostgresPool:
+    """
+    Pool connection Postgres dùng chung giữa các thread.
+    - Tối đa `maxconn` connection được mượn cùng lúc, chờ quá `acquire_timeout` giây thì báo lỗi
+    - Connection hỏng (bị đóng / mất kết nối) tự động bị loại và thay bằng connection mới.
+      `conn.closed` chỉ được bật SAU khi 1 lệnh đã lỗi, nên connection nằm chờ quá `check_idle_after`
+      giây được thử `SELECT 1` trước khi giao (server restart, failover, bị kill vì idle quá lâu)
+    """
+
+    def __init__(self, connection_factory, minconn: int = 1, maxconn: int = 10, acquire_timeout: float = 5.0,
+                 check_idle_after: float = 30.0):
+        self._factory = connection_factory
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.check_idle_after = check_idle_after
+        self._idle = deque()  # (conn, thời điểm được trả về pool)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._in_use = 0
+        self._closed = False
+
+        # Mở sẵn minconn connection để request đầu tiên không phải chờ bắt tay SSL
+        for _ in range(minconn):
+            self._idle.append((self._factory(), time.monotonic()))
+
+    @staticmethod
+    def _is_healthy(conn) -> bool:
+        return not conn.closed
+
+    def _is_usable(self, conn, idle_since: float) -> bool:
+        if not self._is_healthy(conn):
+            return False
+        if time.monotonic() - idle_since < self.check_idle_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        if self._closed:
+            raise PoolTimeoutError("Pool đã đóng")
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise PoolTimeoutError(f"Không lấy được connection Postgres sau {self.acquire_timeout}s")
+
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    conn = self._factory()
+                    break
+                conn, idle_since = entry
+                if self._is_usable(conn, idle_since):
+                    break
+                # Connection chết (server restart, mạng rớt...) -> bỏ đi, lấy cái khác
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+        return conn
+
+    def putconn(self, conn, broken: bool = False):
+        try:
+            if broken or self._closed or not self._is_healthy(conn):
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            # Lỗi do mất kết nối thì psycopg2 đánh dấu conn.closed != 0
+            broken = not self._is_healthy(conn)
+            raise
+        finally:
+            self.putconn(conn, broken)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_use": self._in_use, "idle": len(self._idle), "max": self.maxconn}
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Driver báo thời gian từng lệnh Mongo (find, aggregate...) -> không cần bọc từng lời gọi
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        duration = event.duration_micros / 1e6
+        DB_LATENCY.observe(duration, "mongo", event.command_name)
+        record_query("mongo", event.command_name, time.perf_counter() - duration, duration)
+
+    def failed(self, event):
+        duration = event.duration_micros / 1e6
+        DB_LATENCY.observe(duration, "mongo", event.command_name)
+        DB_ERRORS.inc("mongo", event.command_name)
+        record_query("mongo", event.command_name, time.perf_counter() - duration, duration, failed=True)
+
+
+def _create_pg_connection():
+    conn = psycopg2.connect(
+        host=settings.POSTGRES_SERVER,
+        database=settings.POSTGRES_DB,
+        user=settings.POSTGRES_USER,
+        password=settings.POSTGRES_PASSWORD,
+        port=settings.POSTGRES_PORT,
+        sslmode='require',
+        connect_timeout=max(1, int(settings.DB_CONNECT_TIMEOUT)),
+        cursor_factory=RealDictCursor # Để kết quả trả về dạng Dict {key: value}
+    )
+    # API chỉ đọc -> autocommit để không giữ transaction "idle in transaction" giữa các request
+    conn.autocommit = True
+    return conn
+
 
 class Database:
     def __init__(self):
         self.mongo_client = None
         self.mongo_db = None
-        self.pg_conn = None
+        # Client async cho các endpoint (không block event loop), client sync giữ cho script / health
+        self.mongo_async_client = None
+        self.mongo_async_db = None
+        self.pg_pool = None
         self.neo4j_driver = None
+        self._pg_lock = threading.Lock()
+        # Số thread chạy query = số connection tối đa, để thread không phải xếp hàng chờ pool
+        self._pg_executor = ThreadPoolExecutor(max_workers=settings.PG_POOL_MAX, thread_name_prefix="pg")
+        self._neo4j_executor = ThreadPoolExecutor(max_workers=settings.NEO4J_MAX_CONCURRENCY, thread_name_prefix="neo4j")
+        self._connect_tasks = {}
+
+    # --- KẾT NỐI ---
+    # Mỗi hàm _connect_* là blocking, tự giới hạn thời gian bằng timeout của driver (DB_CONNECT_TIMEOUT)
+
+    def _connect_mongo(self):
+        timeout_ms = int(settings.DB_CONNECT_TIMEOUT * 1000)
+        client = MongoClient(
+            settings.MONGO_URL, connectTimeoutMS=timeout_ms, serverSelectionTimeoutMS=timeout_ms,
+            event_listeners=[MongoCommandMetrics()],
+        )
+        # Client Mongo tự kết nối ở nền -> ping 1 lần để biết URL/mạng có dùng được không
+        try:
+            client.admin.command("ping")
+        except Exception:
+            client.close()
+            raise
+        async_client = AsyncMongoClient(
+            settings.MONGO_URL,
+            maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+            minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+            connectTimeoutMS=timeout_ms,
+            event_listeners=[MongoCommandMetrics()],
+        )
+        self.mongo_client, self.mongo_db = client, client[settings.MONGO_DB_NAME]
+        self.mongo_async_client, self.mongo_async_db = async_client, async_client[settings.MONGO_DB_NAME]
+
+    def _connect_postgres(self):
+        with self._pg_lock:
+            if self.pg_pool is None:
+                self.pg_pool = PostgresPool(
+                    _create_pg_connection,
+                    minconn=settings.PG_POOL_MIN,
+                    maxconn=settings.PG_POOL_MAX,
+                    acquire_timeout=settings.PG_POOL_TIMEOUT,
+                    check_idle_after=settings.PG_POOL_CHECK_IDLE,
+                )
+        return self.pg_pool
+
+    def _connect_neo4j(self):
+        # Import neo4j ở đây: nặng (~0.3s) mà API chỉ cần khi RELATED_MODE=graph
+        from neo4j import GraphDatabase
+
+        driver = GraphDatabase.driver(
+            settings.NEO4J_URI,
+            auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD),
+            connection_timeout=settings.DB_CONNECT_TIMEOUT,
+        )
+        try:
+            driver.verify_connectivity()
+        except Exception:
+            driver.close()
+            raise
+        self.neo4j_driver = driver
+
+    @staticmethod
+    def _neo4j_wanted() -> bool:
+        # Neo4j chỉ được mở khi có tính năng dùng tới (import driver nặng); bắt buộc cho health thì luôn mở
+        if "neo4j" in settings.HEALTH_REQUIRED_STORES:
+            return True
+        # /suggest đọc thêm tên Concept từ đồ thị
+        return bool(settings.NEO4J_URI) and (settings.RELATED_MODE == "graph" or settings.SUGGEST_ENABLED)
+
+    def _connectors(self):
+        connectors = {"mongo": self._connect_mongo, "postgres": self._connect_postgres}
+        if self._neo4j_wanted():
+            connectors["neo4j"] = self._connect_neo4j
+        return connectors
+
+    def is_enabled(self, store: str) -> bool:
+        """DB có được kết nối trong process này không. False = cố ý bỏ qua theo cấu hình, không phải lỗi"""
+        return store in self._connectors()
 
     def connect(self):
-        # 1. Connect MongoDB
-        try:
-            self.mongo_client = MongoClient(settings.MONGO_URL)
-            self.mongo_db = self.mongo_client[settings.MONGO_DB_NAME]
-            print("Connected to MongoDB!")
-        except Exception as e:
-            print(f"Failed to connect MongoDB: {e}")
-
-        # 2. Connect PostgreSQL
-        try:
-            self.pg_conn = psycopg2.connect(
-                host=settings.POSTGRES_SERVER,
-                database=settings.POSTGRES_DB,
-                user=settings.POSTGRES_USER,
-                password=settings.POSTGRES_PASSWORD,
-                port=settings.POSTGRES_PORT,
-                sslmode='require',
-                cursor_factory=RealDictCursor # Để kết quả trả về dạng Dict {key: value}
-            )
-            print("Connected to PostgreSQL!")
-        except Exception as e:
-            print(f"Failed to connect PostgreSQL: {e}")
-
-        # 3. Connect Neo4j
-        try:
-            self.neo4j_driver = GraphDatabase.driver(
-                settings.NEO4J_URI, 
-                auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD)
-            )
-            self.neo4j_driver.verify_connectivity()
-            print("Connected to Neo4j Aura!")
-        except Exception as e:
-            print(f"Failed to connect Neo4j: {e}")
+        """
+        Kết nối lần lượt, không thử lại (cho script / REPL). API dùng `start()`
+        """
+        for store, connector in self._connectors().items():
+            try:
+                connector()
+                print(f"Connected to {store}!")
+            except Exception as e:
+                DB_CONNECT_ERRORS.inc(store)
+                print(f"Failed to connect {store}: {e}")
+
+    async def _keep_connecting(self, store: str, connector):
+        # Thử đến khi được, giãn cách theo cấp số nhân (có jitter để các replica không thử cùng lúc)
+        delay = settings.DB_RECONNECT_MIN_DELAY
+        loop = asyncio.get_running_loop()
+        while True:
+            start = time.perf_counter()
+            try:
+                await loop.run_in_executor(None, connector)
+                print(f"Connected to {store} in {time.perf_counter() - start:.2f}s")
+                return
+            except Exception as e:
+                DB_CONNECT_ERRORS.inc(store)
+                print(f"Failed to connect {store}: {e!r}, retry in {delay:.0f}s")
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 2, settings.DB_RECONNECT_MAX_DELAY)
+
+    async def start(self, wait: float = None):
+        """
+        Mở các DB song song ở nền. Chờ tối đa `wait` giây (mặc định STARTUP_WAIT_TIMEOUT) rồi trả về:
+        DB nào chưa xong thì vẫn tiếp tục thử ở nền, request cần DB đó nhận 503 trong lúc chờ
+        """
+        for store, connector in self._connectors().items():
+            if store not in self._connect_tasks:
+                self._connect_tasks[store] = asyncio.create_task(self._keep_connecting(store, connector))
+        wait = settings.STARTUP_WAIT_TIMEOUT if wait is None else wait
+        if wait > 0:
+            await asyncio.wait(list(self._connect_tasks.values()), timeout=wait)
+        pending = [store for store, task in self._connect_tasks.items() if not task.done()]
+        if pending:
+            print(f"Still connecting in background: {', '.join(pending)}")
+
+    async def wait_connected(self, store: str):
+        """Chờ tới khi `store` kết nối xong (không có task kết nối -> trả về ngay)"""
+        task = self._connect_tasks.get(store)
+        if task is not None:
+            await asyncio.shield(task)
+
+    def mongo(self, collection: str):
+        """Collection Mongo (client async) cho endpoint; chưa kết nối -> StoreUnavailableError"""
+        if self.mongo_async_db is None:
+            raise StoreUnavailableError("MongoDB chưa sẵn sàng")
+        return self.mongo_async_db[collection]
+
+    @contextmanager
+    def pg_connection(self):
+        """
+        Mượn 1 connection từ pool, tự trả lại khi xong (kể cả khi lỗi).
+        Chưa có pool (Postgres đang kết nối lại ở nền) -> StoreUnavailableError
+        """
+        pool = self.pg_pool
+        if pool is None:
+            raise StoreUnavailableError("PostgreSQL chưa sẵn sàng")
+        start = time.perf_counter()
+        with pool.connection() as conn:
+            PG_POOL_WAIT.observe(time.perf_counter() - start)
+            yield conn
+
+    @staticmethod
+    @contextmanager
+    def _measure(store: str, name: str):
+        # Thời gian + lỗi của 1 lần gọi DB, nhãn theo store và tên query
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            DB_ERRORS.inc(store, name)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            DB_LATENCY.observe(duration, store, name)
+            record_query(store, name, start, duration, failed)
+
+    @staticmethod
+    def _run_in(executor, fn, *args):
+        # Chạy trên thread của executor với context của request (profiling gom query qua contextvar)
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(executor, functools.partial(contextvars.copy_context().run, fn, *args))
+
+    def _pg_call(self, fn, *args):
+        """
+        fn(conn, *args) với connection từ pool. Connection chết giữa chừng (OperationalError và psycopg2
+        đã đánh dấu conn.closed) -> thử lại đúng 1 lần với connection mới thay vì trả 500.
+        Chỉ dùng cho query đọc (API chạy autocommit), chạy lại không có tác dụng phụ
+        """
+        for attempt in (1, 2):
+            conn = None
+            try:
+                with self.pg_connection() as conn:
+                    return fn(conn, *args)
+            except psycopg2.OperationalError:
+                if attempt == 2 or conn is None or not conn.closed:
+                    raise
+                print("- Postgres connection lost, retrying with a new connection")
+
+    @staticmethod
+    def _execute(conn, sql: str, params, fetch: str):
+        with conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            if fetch == "one":
+                return cursor.fetchone()
+            return cursor.fetchall()
+
+    def pg_execute(self, sql: str, params=None, fetch: str = "all", name: str = "query"):
+        """
+        Chạy 1 câu query (blocking). fetch = "all" | "one", `name` là nhãn trong /metrics
+        """
+        with self._measure("postgres", name):
+            return self._pg_call(self._execute, sql, params, fetch)
+
+    async def pg_run(self, fn, *args):
+        """
+        Chạy fn(conn, *args) trên thread riêng với connection mượn từ pool,
+        để không block event loop của uvicorn
+        """
+        def _call():
+            with self._measure("postgres", fn.__name__.lstrip("_")):
+                return self._pg_call(fn, *args)
+
+        return await self._run_in(self._pg_executor, _call)
+
+    async def pg_fetch(self, sql: str, params=None, fetch: str = "all", name: str = "query"):
+        return await self._run_in(self._pg_executor, self.pg_execute, sql, params, fetch, name)
+
+    def neo4j_execute(self, query: str, params=None, timeout: float = None, name: str = "query"):
+        """
+        Chạy 1 câu Cypher đọc (blocking), trả về list dict.
+        `timeout` là timeout transaction phía server (giây)
+        """
+        from neo4j import Query
+
+        if self.neo4j_driver is None:
+            raise StoreUnavailableError("Neo4j chưa sẵn sàng")
+        with self._measure("neo4j", name), self.neo4j_driver.session() as session:
+            result = session.run(Query(query, timeout=timeout), params or {})
+            return [record.data() for record in result]
+
+    async def neo4j_fetch(self, query: str, params=None, timeout: float = None, name: str = "query"):
+        return await self._run_in(self._neo4j_executor, self.neo4j_execute, query, params, timeout, name)
+
+    async def aclose(self):
+        """
+        Đóng cả client async (phải await) lẫn các kết nối sync
+        """
+        for task in self._connect_tasks.values():
+            task.cancel()
+        self._connect_tasks = {}
+        if self.mongo_async_client:
+            await self.mongo_async_client.close()
+        self.close()
 
     def close(self):
         if self.mongo_client:
             self.mongo_client.close()
-        if self.pg_conn:
-            self.pg_conn.close()
-        if self.neo4j_driver: 
+        if self.pg_pool:
+            self.pg_pool.close()
+        if self.neo4j_driver:
             self.neo4j_driver.close()
 
 # Tạo 1 instance dùng chung
-db = Database()
\ No newline at end of file
+db = Database()
@@ -1,73 +1,174 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 from app.core.config import settings
-from app.db.database import db
+from app.core.metrics import REQUEST_LATENCY, metric_lines, registry, route_label
+from app.core.profiling import capture, profile_store
+from app.api.deps import is_admin_token
+from app.db.database import db, PoolTimeoutError, StoreUnavailableError
 from app.api.v1.endpoints import router as api_router
+from app.services.cache import response_cache
+from app.services.enrichment import enrichment_service
+from app.services.health import health_service
+from app.services.search import search_service
+from app.services.suggest import suggest_service
+from app.utils.responses import FastJSONResponse
+from app.utils.storage import storage_client
 
 # Hàm chạy khi server bắt đầu khởi động
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Kết nối DB
-    db.connect()
+    # Startup: mở các DB song song, chờ có giới hạn; DB nào chưa lên thì thử lại ở nền
+    await db.start()
+    if settings.SEARCH_MODE == "memory":
+        # Nạp index khi Postgres sẵn sàng, trong lúc chờ /search dùng Postgres (hoặc 503)
+        search_service.start_memory_index_when_ready()
+    if settings.SUGGEST_ENABLED:
+        suggest_service.start()
+    health_service.start()
     yield
     # Shutdown: Ngắt kết nối
-    db.close()
+    await health_service.stop()
+    await suggest_service.stop()
+    await search_service.stop_memory_index()
+    await db.aclose()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    lifespan=lifespan
+    lifespan=lifespan,
+    # Mọi endpoint trả JSON qua orjson
+    default_response_class=FastJSONResponse
 )
 
 app.include_router(api_router, prefix="/api/v1")
 
+
+class MetricsMiddleware:
+    """
+    Đo thời gian mỗi request theo route template (/api/v1/enrich/{diagram_id}), không theo URL thật
+    -> số nhãn cố định. ASGI thuần (không dùng BaseHTTPMiddleware) để không bọc lại response
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_LATENCY.observe(time.perf_counter() - start, scope["method"], route_label(scope), status)
+
+
+class ProfilingMiddleware:
+    """
+    Profile request có header `X-Profile` + `X-Admin-Token` đúng (khi PROFILING_ENABLED).
+    Sai token thì request vẫn chạy bình thường, chỉ không profile. Id profile trả về ở header X-Profile-Id
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if b"x-profile" not in headers or not is_admin_token(headers.get(b"x-admin-token", b"").decode("latin-1")):
+            return await self.app(scope, receive, send)
+        profile = profile_store.begin(scope["method"], scope["path"], scope["query_string"].decode("latin-1"))
+        if profile is None:
+            # Đang profile request khác
+            return await self.app(scope, receive, send)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", str(profile.id).encode())]}
+            await send(message)
+
+        with capture(profile):
+            await self.app(scope, receive, send_with_id)
+
+
+def _runtime_metrics():
+    # Số liệu đã có sẵn ở các service, chỉ đọc lúc scrape
+    lines = []
+    if db.pg_pool is not None:
+        pool = db.pg_pool.stats()
+        lines += metric_lines("pg_pool_connections", "Connection Postgres theo trạng thái",
+                              [({"state": state}, pool[state]) for state in ("in_use", "idle", "max")])
+    caches = {
+        "response": response_cache.stats(),
+        "template": enrichment_service._template_cache.stats(),
+        "graph_related": enrichment_service._graph_cache.stats(),
+    }
+    lines += metric_lines("cache_entries", "Số phần tử đang có trong cache",
+                          [({"cache": name}, stats["size"]) for name, stats in caches.items()])
+    lines += metric_lines("cache_hits_total", "Số lần cache hit từ lúc khởi động",
+                          [({"cache": name}, stats["hits"]) for name, stats in caches.items()], kind="counter")
+    lines += metric_lines("cache_misses_total", "Số lần cache miss từ lúc khởi động",
+                          [({"cache": name}, stats["misses"]) for name, stats in caches.items()], kind="counter")
+    lines += metric_lines("r2_url_cache_entries", "Số link R2 đã ký đang cache",
+                          [({}, storage_client.url_cache_stats()["size"])])
+    return lines
+
+
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    registry.register_collector(_runtime_metrics)
+
+    # Prometheus scrape endpoint (text format 0.0.4)
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Pool Postgres bận hết -> 503 để load balancer/client retry, thay vì 500
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+# DB chưa kết nối được (đang thử lại ở nền) -> 503 kèm Retry-After
+@app.exception_handler(StoreUnavailableError)
+async def store_unavailable_handler(request: Request, exc: StoreUnavailableError):
+    retry_after = str(max(1, int(settings.DB_RECONNECT_MIN_DELAY)))
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": retry_after})
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to AI2D Knowledge Graph API"}
 
 # API KIỂM TRA SỨC KHỎE HỆ THỐNG
+# Liveness: process còn chạy là được, không đụng DB (probe gọi liên tục)
+@app.get("/health/live")
+def liveness():
+    return {"status": "ok"}
+
+# Readiness: ping song song từng DB, có timeout. Chưa sẵn sàng -> 503 để bị rút khỏi load balancer
+@app.get("/health/ready")
+async def readiness():
+    result = await health_service.readiness()
+    if result["status"] != "ready":
+        return JSONResponse(status_code=503, content=result)
+    return result
+
+# Số bản ghi từng DB: đọc từ cache do task nền làm mới (HEALTH_COUNTS_INTERVAL), không đếm mỗi request
 @app.get("/health")
 def health_check():
-    # Mặc định khai báo cả 3 là dead
-    status = {"status": "ok", "mongo": "dead", "postgres": "dead", "neo4j": "dead"}
-    
-    # 1. Test Mongo: Đếm số lượng diagrams
-    try:
-        if db.mongo_db is not None:
-            # Lệnh count_documents({}) đếm tất cả docs
-            count = db.mongo_db["diagrams"].count_documents({})
-            status["mongo"] = f"alive ({count} docs)"
-    except Exception as e:
-        status["mongo"] = f"Error: {str(e)}"
-
-    # 2. Test Postgres: Đếm số lượng dòng trong bảng diagrams
-    try:
-        if db.pg_conn is not None:
-            # Check nếu connection bị đóng thì connect lại
-            if db.pg_conn.closed:
-                db.connect()
-                
-            cursor = db.pg_conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM diagrams;")
-            pg_count = cursor.fetchone()['count']
-            status["postgres"] = f"alive ({pg_count} rows)"
-            cursor.close()
-    except Exception as e:
-        status["postgres"] = f"Error: {str(e)}"
-
-    # 3. Test Neo4j: Đếm số lượng Node (Nút)
-    try:
-        if db.neo4j_driver is not None:
-            # Kiểm tra kết nối bằng cách đếm tổng số node
-            # MATCH (n) RETURN count(n) là lệnh nhẹ nhất để test
-            with db.neo4j_driver.session() as session:
-                result = session.run("MATCH (n) RETURN count(n) AS count")
-                # Lấy kết quả đầu tiên
-                neo4j_count = result.single()["count"]
-                status["neo4j"] = f"alive ({neo4j_count} nodes)"
-    except Exception as e:
-        status["neo4j"] = f"Error: {str(e)}"
-
-    return status
+    return health_service.counts()
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import List, Optional, Any, Dict
+from pydantic import BaseModel, Field
+from typing import List, Optional, Any, Dict, Union
+from app.core.config import settings
 
 # --- PHẦN HEALTH CHECK ---
 class HealthResponse(BaseModel):
@@ -20,7 +21,38 @@ class EntityItem(BaseModel):
     type: str
     bbox: List[int] # [x, y, w, h]
 
-# 3. Khuôn mẫu cho phản hồi chi tiết (API /enrich)
+# 3. Khuôn mẫu dữ liệu đã format theo template (Template A: cấu trúc, Template B: chu trình)
+class StructurePart(BaseModel):
+    entity_id: str
+    name: str
+    description: str
+    bbox: Optional[List[int]] = None # [x, y, w, h]
+
+class StructureData(BaseModel):
+    summary: str
+    parts: List[StructurePart]
+
+class ProcessStage(BaseModel):
+    step: int
+    name: str
+    description: str
+    next_step: str # "End" nếu là bước cuối
+
+class ProcessData(BaseModel):
+    summary: str
+    is_cycle: bool = False # Mũi tên khép thành vòng (VD: vòng đời ếch)
+    stages: List[ProcessStage]
+
+class RelatedKnowledgeItem(BaseModel):
+    concept: Optional[str] = None
+    found_in_diagram: str
+    category: Optional[str] = None
+    relation: str
+    score: Optional[float] = None # Chỉ có ở RELATED_MODE=graph/precomputed
+    thumbnail_url: str
+
+# 4. Khuôn mẫu cho phản hồi chi tiết (API /enrich)
+# Endpoint /enrich tự serialize dữ liệu đã format (orjson), model này dùng cho tài liệu OpenAPI
 class KnowledgeResponse(BaseModel):
     diagram_id: str
     title: str
@@ -28,7 +60,11 @@ class KnowledgeResponse(BaseModel):
     template_type: str
     
     # Data chính (Sẽ linh động tùy loại biểu đồ)
-    data: Dict[str, Any] 
+    data: Union[StructureData, ProcessData, Dict[str, Any]]
     
     # Phần tri thức làm giàu (Quan trọng)
-    related_knowledge: List[Dict[str, Any]] = []
\ No newline at end of file
+    related_knowledge: List[RelatedKnowledgeItem] = []
+
+# 5. Khuôn mẫu cho request làm giàu nhiều sơ đồ (API /enrich:batch)
+class EnrichBatchRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=settings.ENRICH_BATCH_MAX)
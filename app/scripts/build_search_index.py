@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import psycopg2
+from dotenv import load_dotenv
+
+# Import module app nếu cần (để chắc chắn path đúng)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+load_dotenv()
+
+# --- CẤU HÌNH ---
+POSTGRES_CONFIG = dict(
+    host=os.getenv("POSTGRES_SERVER"),
+    database=os.getenv("POSTGRES_DB"),
+    user=os.getenv("POSTGRES_USER"),
+    password=os.getenv("POSTGRES_PASSWORD"),
+    port=os.getenv("POSTGRES_PORT", "5432"),
+    sslmode=os.getenv("POSTGRES_SSLMODE", "require"),
+)
+
+# Migration: bảng tài liệu tìm kiếm (1 dòng / sơ đồ) + index trigram và full-text
+MIGRATION_SQL = """
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+    CREATE TABLE IF NOT EXISTS diagram_search (
+        diagram_id   TEXT PRIMARY KEY,
+        category     TEXT,
+        storage_path TEXT,
+        document     TEXT NOT NULL,
+        tsv          TSVECTOR NOT NULL,
+        updated_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    -- updated_at: để index RAM của /search (SEARCH_MODE=memory) chỉ nạp lại dòng thay đổi
+    ALTER TABLE diagram_search ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+    CREATE INDEX IF NOT EXISTS idx_diagram_search_document_trgm
+        ON diagram_search USING gin (document gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS idx_diagram_search_tsv
+        ON diagram_search USING gin (tsv);
+"""
+
+# Gộp id + category + chữ trong ảnh thành 1 document (lowercase) cho mỗi sơ đồ.
+# Category có trọng số A, chữ trong ảnh trọng số B khi xếp hạng.
+REFRESH_SQL = """
+    INSERT INTO diagram_search (diagram_id, category, storage_path, document, tsv)
+    SELECT d.id, d.category, d.storage_path,
+        lower(concat_ws(' ', d.id, d.category, agg.content)),
+        setweight(to_tsvector('simple', coalesce(d.category, '')), 'A')
+            || setweight(to_tsvector('simple', coalesce(agg.content, '')), 'B')
+    FROM diagrams d
+    LEFT JOIN (
+        SELECT diagram_id, string_agg(DISTINCT content, ' ') AS content
+        FROM entities
+        GROUP BY diagram_id
+    ) agg ON agg.diagram_id = d.id
+    ON CONFLICT (diagram_id) DO UPDATE SET
+        category = EXCLUDED.category,
+        storage_path = EXCLUDED.storage_path,
+        document = EXCLUDED.document,
+        tsv = EXCLUDED.tsv,
+        updated_at = now()
+    WHERE diagram_search.document IS DISTINCT FROM EXCLUDED.document
+       OR diagram_search.category IS DISTINCT FROM EXCLUDED.category
+       OR diagram_search.storage_path IS DISTINCT FROM EXCLUDED.storage_path;
+
+    DELETE FROM diagram_search s
+    WHERE NOT EXISTS (SELECT 1 FROM diagrams d WHERE d.id = s.diagram_id);
+"""
+
+
+def build_search_index(conn):
+    """
+    Tạo bảng/index nếu chưa có rồi đồng bộ lại document cho mọi sơ đồ.
+    Chạy lại sau mỗi lần nạp dữ liệu vào bảng diagrams/entities.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(MIGRATION_SQL)
+        cursor.execute(REFRESH_SQL)
+        cursor.execute("ANALYZE diagram_search;")
+    conn.commit()
+
+
+if __name__ == "__main__":
+    print("⏳ Đang xây dựng index tìm kiếm trong PostgreSQL...")
+    start = time.perf_counter()
+    conn = psycopg2.connect(**POSTGRES_CONFIG)
+    build_search_index(conn)
+    conn.close()
+    print(f"🎉 HOÀN TẤT sau {time.perf_counter() - start:.1f}s.")
@@ -0,0 +1,181 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2.extras import Json, RealDictCursor, execute_values
+from scipy import sparse
+
+# Import module app nếu cần (để chắc chắn path đúng)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+load_dotenv()
+
+# --- CẤU HÌNH ---
+POSTGRES_CONFIG = dict(
+    host=os.getenv("POSTGRES_SERVER"),
+    database=os.getenv("POSTGRES_DB"),
+    user=os.getenv("POSTGRES_USER"),
+    password=os.getenv("POSTGRES_PASSWORD"),
+    port=os.getenv("POSTGRES_PORT", "5432"),
+    sslmode=os.getenv("POSTGRES_SSLMODE", "require"),
+)
+
+# Mỗi sơ đồ 1 dòng: từ khóa + danh sách sơ đồ liên quan đã xếp hạng (đúng format related_knowledge)
+# -> /enrich chỉ cần 1 lần tra theo khóa chính (RELATED_MODE=precomputed)
+MIGRATION_SQL = """
+    CREATE TABLE IF NOT EXISTS diagram_related (
+        diagram_id TEXT PRIMARY KEY,
+        keywords   TEXT[] NOT NULL,
+        related    JSONB NOT NULL,
+        built_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+LOAD_SQL = """
+    SELECT d.id, d.category, array_remove(array_agg(DISTINCT e.content), NULL) AS keywords
+    FROM diagrams d
+    LEFT JOIN entities e ON e.diagram_id = d.id AND e.type = 'text'
+    GROUP BY d.id, d.category
+    ORDER BY d.id;
+"""
+
+
+def build_matrix(keywords_per_diagram, weighting="tfidf", max_df=0.05):
+    """
+    Ma trận thưa sơ đồ × concept.
+    - tfidf: trọng số idf = log(N / df), mỗi dòng chuẩn hóa L2 -> tích vô hướng = cosine
+    - jaccard: ma trận nhị phân, điểm tính ở compute_neighbors
+    Concept xuất hiện trong hơn `max_df` phần sơ đồ (VD "Sun") gần như không phân biệt được gì
+    mà lại làm ma trận tương đồng gần đặc (N²) -> bỏ khỏi phần tính điểm.
+    """
+    vocabulary = {}
+    indptr, indices = [0], []
+    for keywords in keywords_per_diagram:
+        for term in set(keywords):
+            indices.append(vocabulary.setdefault(term, len(vocabulary)))
+        indptr.append(len(indices))
+
+    n_docs = len(keywords_per_diagram)
+    data = np.ones(len(indices), dtype=np.float32)
+    matrix = sparse.csr_matrix((data, np.array(indices, dtype=np.int32), np.array(indptr)),
+                               shape=(n_docs, len(vocabulary)))
+
+    df = np.bincount(matrix.indices, minlength=len(vocabulary)).astype(np.float32)
+    idf = np.log(max(n_docs, 1) / np.maximum(df, 1)).astype(np.float32)
+
+    keep = (df <= max(max_df * n_docs, 1)).astype(np.float32)
+    if weighting == "tfidf":
+        matrix = matrix @ sparse.diags(idf * keep)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        matrix = sparse.diags(1 / np.maximum(norms, 1e-9)) @ matrix
+        matrix = matrix.tocsr()
+    else:
+        matrix = (matrix @ sparse.diags(keep)).tocsr()
+    matrix.eliminate_zeros()
+    terms = np.empty(len(vocabulary), dtype=object)
+    for term, column in vocabulary.items():
+        terms[column] = term
+    return matrix, terms, idf
+
+
+def compute_neighbors(matrix, k=10, weighting="tfidf", chunk_size=2000):
+    """
+    Top-k láng giềng cho mọi sơ đồ, tính theo từng khối dòng để bộ nhớ không phụ thuộc N².
+    Trả về (neighbors[N, k], scores[N, k]); ô trống = -1.
+    """
+    n_docs = matrix.shape[0]
+    neighbors = np.full((n_docs, k), -1, dtype=np.int32)
+    scores = np.zeros((n_docs, k), dtype=np.float32)
+    transposed = matrix.T.tocsc()
+    sizes = np.diff(matrix.indptr).astype(np.float32)
+
+    for start in range(0, n_docs, chunk_size):
+        stop = min(start + chunk_size, n_docs)
+        block = (matrix[start:stop] @ transposed).tocsr()  # điểm thô (tích vô hướng / số concept chung)
+        for row in range(stop - start):
+            lo, hi = block.indptr[row], block.indptr[row + 1]
+            cols = block.indices[lo:hi]
+            vals = block.data[lo:hi]
+            mask = cols != start + row  # bỏ chính nó
+            cols, vals = cols[mask], vals[mask]
+            if weighting == "jaccard":
+                vals = vals / (sizes[start + row] + sizes[cols] - vals)
+            if not len(cols):
+                continue
+            if len(cols) > k:
+                top = np.argpartition(-vals, k)[:k]
+                cols, vals = cols[top], vals[top]
+            # sắp xếp: điểm giảm dần, hòa thì theo thứ tự id
+            order = np.lexsort((cols, -vals))
+            neighbors[start + row, :len(order)] = cols[order]
+            scores[start + row, :len(order)] = vals[order]
+    return neighbors, scores
+
+
+def build_rows(diagrams, keyword_sets, neighbors, scores, idf_by_term):
+    """
+    Dòng cho bảng diagram_related: concept hiển thị = concept chung hiếm nhất (idf cao nhất)
+    """
+    rows = []
+    for i, diagram in enumerate(diagrams):
+        related = []
+        for j, score in zip(neighbors[i], scores[i]):
+            if j < 0:
+                break
+            other = diagrams[j]
+            shared = keyword_sets[i] & keyword_sets[j]
+            concept = max(shared, key=lambda term: (idf_by_term.get(term, 0), term)) if shared else None
+            related.append({
+                "concept": concept,
+                "found_in_diagram": other["id"],
+                "category": other["category"],
+                "relation": "appears_in",
+                "score": round(float(score), 4),
+                "thumbnail_url": f"https://ai2d.r2.cloudflarestorage.com/ai2d/raw/{other['id']}"
+            })
+        rows.append((diagram["id"], sorted(keyword_sets[i]), Json(related)))
+    return rows
+
+
+def build_similarity(conn, k=10, weighting="tfidf", max_df=0.05):
+    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute(LOAD_SQL)
+        diagrams = cursor.fetchall()
+
+    start = time.perf_counter()
+    keyword_sets = [set(d["keywords"]) for d in diagrams]
+    matrix, terms, idf = build_matrix(keyword_sets, weighting, max_df)
+    neighbors, scores = compute_neighbors(matrix, k=k, weighting=weighting)
+    idf_by_term = dict(zip(terms, idf.tolist()))
+    rows = build_rows(diagrams, keyword_sets, neighbors, scores, idf_by_term)
+    print(f"   -> Tính top-{k} cho {len(diagrams)} sơ đồ, {len(terms)} concept: {time.perf_counter() - start:.1f}s")
+
+    with conn.cursor() as cursor:
+        cursor.execute(MIGRATION_SQL)
+        cursor.execute("CREATE TEMP TABLE diagram_related_new (LIKE diagram_related INCLUDING DEFAULTS) ON COMMIT DROP;")
+        execute_values(cursor, "INSERT INTO diagram_related_new (diagram_id, keywords, related) VALUES %s",
+                       rows, page_size=1000)
+        # Thay toàn bộ trong 1 transaction: API không bao giờ thấy bảng dở dang
+        cursor.execute("DELETE FROM diagram_related;")
+        cursor.execute("INSERT INTO diagram_related SELECT * FROM diagram_related_new;")
+    conn.commit()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tính trước danh sách sơ đồ liên quan cho /enrich")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--weighting", choices=["tfidf", "jaccard"], default="tfidf")
+    parser.add_argument("--max-df", type=float, default=0.05, help="Bỏ concept có mặt trong hơn tỉ lệ này số sơ đồ")
+    args = parser.parse_args()
+
+    print("⏳ Đang tính ma trận tương đồng giữa các sơ đồ...")
+    start = time.perf_counter()
+    conn = psycopg2.connect(**POSTGRES_CONFIG)
+    count = build_similarity(conn, k=args.top_k, weighting=args.weighting, max_df=args.max_df)
+    conn.close()
+    print(f"🎉 HOÀN TẤT! {count} sơ đồ sau {time.perf_counter() - start:.1f}s.")
@@ -0,0 +1,183 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2.extras import Json, RealDictCursor, execute_values
+from pymongo import MongoClient
+
+# Import module app nếu cần (để chắc chắn path đúng)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+load_dotenv()
+
+from app.services.cache import DATA_VERSION_ID, META_COLLECTION
+from app.services.enrichment import FORMAT_VERSION, TEMPLATE_PROJECTION, enrichment_service
+
+# --- CẤU HÌNH ---
+MONGO_URL = os.getenv("MONGO_URL")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
+
+POSTGRES_CONFIG = dict(
+    host=os.getenv("POSTGRES_SERVER"),
+    database=os.getenv("POSTGRES_DB"),
+    user=os.getenv("POSTGRES_USER"),
+    password=os.getenv("POSTGRES_PASSWORD"),
+    port=os.getenv("POSTGRES_PORT", "5432"),
+    sslmode=os.getenv("POSTGRES_SSLMODE", "require"),
+)
+
+# Mỗi sơ đồ 1 dòng: phần /enrich tính được từ document Mongo + diagrams.group_type.
+# format_version: phiên bản formatter -> API (ENRICH_MODE=precomputed) chỉ dùng dòng đúng FORMAT_VERSION.
+# Hết hạn theo từng sơ đồ: source_hash (chạy lại chỉ tính sơ đồ đổi) + `sync_to_neo4j.py --watch`
+# xóa dòng của sơ đồ vừa đổi (invalidate_rows). data_version chỉ để biết dòng được tính lúc nào
+MIGRATION_SQL = """
+    CREATE TABLE IF NOT EXISTS diagram_enrichment (
+        diagram_id     TEXT PRIMARY KEY,
+        category       TEXT,
+        group_type     TEXT,
+        template_type  TEXT NOT NULL,
+        data           JSONB NOT NULL,
+        source_hash    TEXT NOT NULL,
+        format_version INT NOT NULL,
+        data_version   INT NOT NULL,
+        built_at       TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    -- Bản đầu có cột keywords nhưng API không đọc
+    ALTER TABLE diagram_enrichment DROP COLUMN IF EXISTS keywords;
+"""
+
+LOAD_DIAGRAMS_SQL = "SELECT id, category, group_type FROM diagrams"
+EXISTING_HASHES_SQL = "SELECT diagram_id, source_hash FROM diagram_enrichment WHERE format_version = %s"
+
+UPSERT_SQL = """
+    INSERT INTO diagram_enrichment
+        (diagram_id, category, group_type, template_type, data, source_hash, format_version, data_version)
+    VALUES %s
+    ON CONFLICT (diagram_id) DO UPDATE SET
+        category = EXCLUDED.category,
+        group_type = EXCLUDED.group_type,
+        template_type = EXCLUDED.template_type,
+        data = EXCLUDED.data,
+        source_hash = EXCLUDED.source_hash,
+        format_version = EXCLUDED.format_version,
+        data_version = EXCLUDED.data_version,
+        built_at = now();
+"""
+
+DELETE_REMOVED_SQL = "DELETE FROM diagram_enrichment WHERE NOT (diagram_id = ANY(%s))"
+INVALIDATE_SQL = "DELETE FROM diagram_enrichment WHERE diagram_id = ANY(%s)"
+
+
+def source_hash(doc, diagram):
+    payload = json.dumps([diagram["category"], diagram["group_type"], doc], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def build_rows(docs, diagrams, data_version, existing_hashes=None, stats=None, seen=None):
+    """
+    Tính template cho từng document (chỉ sơ đồ có trong bảng diagrams).
+    Bỏ qua sơ đồ có source_hash trùng với dòng đã tính (chạy lại chỉ tốn thời gian đọc)
+    """
+    existing_hashes = existing_hashes or {}
+    for doc in docs:
+        diagram = diagrams.get(doc["_id"])
+        if diagram is None:
+            continue
+        if seen is not None:
+            seen.append(doc["_id"])
+        digest = source_hash(doc, diagram)
+        if existing_hashes.get(doc["_id"]) == digest:
+            if stats is not None:
+                stats["skipped"] += 1
+            continue
+        template_type = enrichment_service.template_type_for(diagram["group_type"])
+        yield (
+            doc["_id"],
+            diagram["category"],
+            diagram["group_type"],
+            template_type,
+            # Quét toàn bộ corpus: không đẩy template đang nóng của API ra khỏi cache
+            Json(enrichment_service.process_template_data(template_type, doc, use_cache=False)),
+            digest,
+            FORMAT_VERSION,
+            data_version,
+        )
+
+
+def materialize(conn, mongo_db, batch_size=500):
+    meta = mongo_db[META_COLLECTION].find_one({"_id": DATA_VERSION_ID})
+    data_version = meta["value"] if meta else 0
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute(MIGRATION_SQL)
+        cursor.execute(LOAD_DIAGRAMS_SQL)
+        diagrams = {row["id"]: row for row in cursor.fetchall()}
+        cursor.execute(EXISTING_HASHES_SQL, (FORMAT_VERSION,))
+        existing_hashes = {row["diagram_id"]: row["source_hash"] for row in cursor.fetchall()}
+    print(f"✅ {len(diagrams)} sơ đồ trong Postgres, {len(existing_hashes)} sơ đồ đã tính sẵn "
+          f"(format v{FORMAT_VERSION}, dữ liệu v{data_version}).")
+
+    stats = {"written": 0, "skipped": 0}
+    start = time.perf_counter()
+    docs = mongo_db["diagrams"].find({}, TEMPLATE_PROJECTION, batch_size=batch_size)
+    batch, seen = [], []
+    # Cả job là 1 transaction: API không bao giờ thấy bảng dở dang
+    with conn.cursor() as cursor:
+        for row in build_rows(docs, diagrams, data_version, existing_hashes, stats, seen):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                execute_values(cursor, UPSERT_SQL, batch, page_size=batch_size)
+                stats["written"] += len(batch)
+                batch = []
+                print(f"   -> Đã tính {stats['written']}, bỏ qua {stats['skipped']} sơ đồ...")
+        if batch:
+            execute_values(cursor, UPSERT_SQL, batch, page_size=batch_size)
+            stats["written"] += len(batch)
+        # Sơ đồ không còn trong Postgres hoặc Mongo
+        cursor.execute(DELETE_REMOVED_SQL, (seen,))
+        stats["deleted"] = cursor.rowcount
+    conn.commit()
+
+    elapsed = time.perf_counter() - start
+    print(f"🎉 HOÀN TẤT! Tính {stats['written']} sơ đồ, bỏ qua {stats['skipped']} sơ đồ không đổi, "
+          f"xóa {stats['deleted']} dòng cũ trong {elapsed:.1f}s.")
+
+    # Dữ liệu đổi trong lúc chạy -> vài dòng vừa ghi có thể tính từ document cũ
+    meta = mongo_db[META_COLLECTION].find_one({"_id": DATA_VERSION_ID})
+    if (meta["value"] if meta else 0) != data_version:
+        print("⚠️ Phiên bản dữ liệu đã đổi trong lúc chạy, hãy chạy lại job (chỉ tính lại sơ đồ đổi).")
+    return stats
+
+
+def invalidate_rows(conn, diagram_ids):
+    """
+    Xóa dòng tính sẵn của các sơ đồ vừa đổi (conn autocommit): API tính live riêng các sơ đồ này
+    cho tới lần chạy job sau, các sơ đồ khác vẫn đọc bảng. Chưa có bảng (chưa chạy job) -> bỏ qua
+    """
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(INVALIDATE_SQL, (list(diagram_ids),))
+            return cursor.rowcount
+    except psycopg2.errors.UndefinedTable:
+        return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Tính sẵn template /enrich cho mọi sơ đồ (chạy sau mỗi lần nạp/đồng bộ dữ liệu)"
+    )
+    parser.add_argument("--batch-size", type=int, default=500, help="Số sơ đồ mỗi lần ghi")
+    args = parser.parse_args()
+
+    print("⏳ Đang tính sẵn dữ liệu /enrich...")
+    mongo_client = MongoClient(MONGO_URL)
+    conn = psycopg2.connect(**POSTGRES_CONFIG)
+    materialize(conn, mongo_client[MONGO_DB_NAME], batch_size=args.batch_size)
+    conn.close()
+    mongo_client.close()
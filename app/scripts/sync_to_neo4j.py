@@ -1,14 +1,28 @@
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
 import os
+import queue
 import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pymongo import MongoClient
 from neo4j import GraphDatabase
 from dotenv import load_dotenv
 
 # Import module app nếu cần (để chắc chắn path đúng)
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 load_dotenv()
 
+from app.services.cache import META_COLLECTION, bump_data_version
+
+SYNC_STATE_ID = "neo4j_sync"
+
 # --- CẤU HÌNH ---
 MONGO_URL = os.getenv("MONGO_URL")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
@@ -17,6 +31,9 @@ NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASS = os.getenv("NEO4J_PASSWORD")
 
+# Chỉ các trường build_graph_records cần -> ít dữ liệu qua mạng và ít phải pickle sang process worker
+SYNC_PROJECTION = {"id": 1, "text": 1, "relationships": 1}
+
 def get_text_mapping(json_doc):
     """
     Hàm này tạo từ điển map ID -> Text Content
@@ -45,96 +62,557 @@ def get_text_mapping(json_doc):
 
     return id_to_text
 
-def sync_data():
+# --- CYPHER (mỗi batch = 1 transaction, UNWIND cả danh sách thay vì 1 session.run / cạnh) ---
+CONSTRAINTS = [
+    "CREATE CONSTRAINT diagram_id IF NOT EXISTS FOR (d:Diagram) REQUIRE d.id IS UNIQUE",
+    "CREATE CONSTRAINT concept_name IF NOT EXISTS FOR (c:Concept) REQUIRE c.name IS UNIQUE",
+]
+
+# Xóa cạnh cũ của các sơ đồ sắp ghi lại. CONNECTED_TO dùng chung giữa các sơ đồ nên mỗi cạnh
+# nhớ danh sách sơ đồ tạo ra nó (r.diagrams); chỉ xóa hẳn khi không còn sơ đồ nào.
+REMOVE_STALE_EDGES = """
+    UNWIND $ids AS id
+    MATCH (d:Diagram {id: id})-[:CONTAINS]->(:Concept)-[r:CONNECTED_TO]->(:Concept)<-[:CONTAINS]-(d)
+    WHERE id IN coalesce(r.diagrams, [])
+    SET r.diagrams = [x IN r.diagrams WHERE x <> id]
+    WITH DISTINCT r
+    WHERE size(r.diagrams) = 0
+    DELETE r
+"""
+
+REMOVE_STALE_CONTAINS = """
+    UNWIND $ids AS id
+    MATCH (:Diagram {id: id})-[c:CONTAINS]->(:Concept)
+    DELETE c
+"""
+
+DELETE_DIAGRAMS = """
+    UNWIND $ids AS id
+    MATCH (d:Diagram {id: id})
+    DETACH DELETE d
+"""
+
+# sync_hash = dấu vân tay của node/cạnh sinh ra từ document, ghi cùng transaction với dữ liệu
+# -> lần chạy sau (hoặc chạy lại sau khi crash) bỏ qua được các sơ đồ đã đồng bộ
+MERGE_DIAGRAMS = """
+    UNWIND $diagrams AS row
+    MERGE (d:Diagram {id: row.id})
+    SET d.storage_path = 'https://ai2d.r2.cloudflarestorage.com/ai2d/raw/' + row.id,
+        d.sync_hash = row.hash
+"""
+
+# Cypher query: Tạo 2 Concept và nối mũi tên
+MERGE_EDGES = """
+    UNWIND $edges AS e
+    MATCH (d:Diagram {id: e.diagram_id})
+
+    MERGE (c1:Concept {name: e.t1})
+    MERGE (c2:Concept {name: e.t2})
+
+    MERGE (d)-[:CONTAINS]->(c1)
+    MERGE (d)-[:CONTAINS]->(c2)
+
+    MERGE (c1)-[r:CONNECTED_TO {type: e.rel_type}]->(c2)
+    SET r.diagrams = CASE
+        WHEN e.diagram_id IN coalesce(r.diagrams, []) THEN r.diagrams
+        ELSE coalesce(r.diagrams, []) + e.diagram_id
+    END
+"""
+
+EXISTING_HASHES = "MATCH (d:Diagram) RETURN d.id AS id, d.sync_hash AS hash"
+
+MERGE_CONCEPTS = """
+    UNWIND $concepts AS c
+    MATCH (d:Diagram {id: c.diagram_id})
+    MERGE (k:Concept {name: c.name})
+    MERGE (d)-[:CONTAINS]->(k)
+"""
+
+
+def diagram_id_of(doc):
+    # ID ảnh (vd: 4859.png) = id của node Diagram trong Neo4j
+    return doc.get('id') or doc.get('_id')
+
+
+def build_graph_records(doc):
+    """
+    Biến 1 document Mongo thành danh sách cạnh (mũi tên giữa 2 concept)
+    và danh sách concept dự phòng (khi sơ đồ không có mũi tên nào map được)
+    """
+    diagram_id = diagram_id_of(doc)
+
+    # Chuẩn bị Mapping (ID -> Tên concept)
+    id_map = get_text_mapping(doc)
+
+    # Duyệt các quan hệ (Relationships) để vẽ Graph
+    edges = []
+    for rel_id, rel_data in doc.get('relationships', {}).items():
+        # Chỉ quan tâm quan hệ giữa các vật (interObject) -> Mũi tên
+        if rel_data.get('category') != 'interObject':
+            continue
+        origin_id = rel_data.get('origin')
+        target_id = rel_data.get('target')
+
+        # Chỉ vẽ nếu cả 2 đầu đều định danh được tên (Text)
+        if origin_id in id_map and target_id in id_map:
+            origin_text = id_map[origin_id]
+            target_text = id_map[target_id]
+
+            # Bỏ qua nếu nối chính nó hoặc text rỗng
+            if origin_text == target_text or not origin_text:
+                continue
+
+            edges.append({
+                "diagram_id": diagram_id,
+                "t1": origin_text,
+                "t2": target_text,
+                "rel_type": rel_data.get('relation', 'related_to'), # vd: arrowHeadTail
+            })
+
+    # Nếu sơ đồ không có mũi tên nào (hoặc không map được),
+    # ít nhất hãy nối Diagram với các Text tìm thấy (Fallback)
+    concepts = []
+    if not edges:
+        concepts = [
+            {"diagram_id": diagram_id, "name": text_content}
+            for text_content in set(id_map.values()) if len(text_content) > 1
+        ]
+
+    return diagram_id, edges, concepts
+
+
+def records_hash(edges, concepts):
+    """
+    Hash của node/cạnh 1 sơ đồ sinh ra: document đổi nhưng graph không đổi thì không cần ghi lại
+    """
+    payload = json.dumps(
+        [sorted((e["t1"], e["t2"], e["rel_type"]) for e in edges), sorted(c["name"] for c in concepts)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class GraphBatch:
+    """
+    Gom node/cạnh của nhiều sơ đồ lại để ghi 1 lần
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.hashes = []
+        self.edges = []
+        self.concepts = []
+
+    def add(self, diagram_id, edges, concepts, content_hash=None):
+        self.ids.append(diagram_id)
+        self.hashes.append(content_hash or records_hash(edges, concepts))
+        self.edges.extend(edges)
+        self.concepts.extend(concepts)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _write_batch_tx(tx, batch):
+    # Ghi đè: bỏ cạnh cũ của các sơ đồ này rồi tạo lại -> chạy lại nhiều lần vẫn đúng
+    tx.run(REMOVE_STALE_EDGES, ids=batch.ids).consume()
+    tx.run(REMOVE_STALE_CONTAINS, ids=batch.ids).consume()
+    tx.run(MERGE_DIAGRAMS, diagrams=[
+        {"id": diagram_id, "hash": content_hash} for diagram_id, content_hash in zip(batch.ids, batch.hashes)
+    ]).consume()
+    if batch.edges:
+        tx.run(MERGE_EDGES, edges=batch.edges).consume()
+    if batch.concepts:
+        tx.run(MERGE_CONCEPTS, concepts=batch.concepts).consume()
+
+
+def write_batch(driver, batch):
+    # execute_write tự retry khi gặp lỗi tạm thời (deadlock giữa các worker song song)
+    with driver.session() as session:
+        session.execute_write(_write_batch_tx, batch)
+    return len(batch)
+
+
+def ensure_constraints(driver):
+    # Unique constraint = index cho MERGE, đồng thời chống tạo trùng node khi ghi song song
+    with driver.session() as session:
+        for query in CONSTRAINTS:
+            session.run(query).consume()
+
+
+def _delete_diagrams_tx(tx, ids):
+    tx.run(REMOVE_STALE_EDGES, ids=ids).consume()
+    tx.run(DELETE_DIAGRAMS, ids=ids).consume()
+
+
+def delete_diagrams(driver, ids):
+    with driver.session() as session:
+        session.execute_write(_delete_diagrams_tx, list(ids))
+
+
+def load_existing_hashes(driver):
+    with driver.session() as session:
+        return {record["id"]: record["hash"] for record in session.run(EXISTING_HASHES)}
+
+
+def iter_batches(docs, batch_size, existing_hashes=None, stats=None):
+    """
+    Chia document thành batch. Nếu có `existing_hashes` (chế độ incremental)
+    thì bỏ qua sơ đồ có hash trùng với hash đang lưu trong Neo4j.
+    """
+    batch = GraphBatch()
+    for doc in docs:
+        diagram_id, edges, concepts = build_graph_records(doc)
+        content_hash = records_hash(edges, concepts)
+        if existing_hashes is not None and existing_hashes.get(diagram_id) == content_hash:
+            if stats is not None:
+                stats["skipped"] += 1
+            continue
+        batch.add(diagram_id, edges, concepts, content_hash)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = GraphBatch()
+    if len(batch):
+        yield batch
+
+
+# --- PIPELINE: đọc Mongo (thread) -> biến đổi (process) -> ghi Neo4j (thread) ---
+
+class StageCounter:
+    """
+    Số sơ đồ đã qua 1 stage và tổng thời gian stage đó thực sự làm việc (cộng dồn các worker).
+    Bận gần 100% = stage đang là nút thắt; các stage khác phải chờ nó
+    """
+
+    def __init__(self, name, parallelism=1):
+        self.name = name
+        self.parallelism = parallelism
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items, seconds):
+        with self._lock:
+            self.items += items
+            self.busy += seconds
+
+    def utilisation(self, elapsed):
+        return self.busy / max(elapsed * self.parallelism, 1e-9)
+
+    def capacity(self):
+        # Số docs/s tối đa nếu stage này không phải chờ ai
+        return self.items * self.parallelism / self.busy if self.busy else float("inf")
+
+
+def new_stage_counters(processes, workers):
+    return {
+        "read": StageCounter("read", 1),
+        "transform": StageCounter("transform", max(processes, 1)),
+        "write": StageCounter("write", max(workers, 1)),
+    }
+
+
+def report_stages(counters, elapsed):
+    for counter in counters.values():
+        capacity = f"tối đa ~{counter.capacity():.0f} docs/s" if counter.busy else "không có việc"
+        print(f"   [{counter.name:<9}] {counter.items} sơ đồ, bận {counter.utilisation(elapsed):4.0%}, {capacity}")
+    bottleneck = max(counters.values(), key=lambda counter: counter.utilisation(elapsed))
+    print(f"   -> Stage chậm nhất: {bottleneck.name}")
+
+
+def transform_chunk(docs):
+    """
+    Chạy trong process worker: document -> (id, cạnh, concept, hash) + thời gian xử lý
+    """
+    start = time.perf_counter()
+    records = []
+    for doc in docs:
+        diagram_id, edges, concepts = build_graph_records(doc)
+        records.append((diagram_id, edges, concepts, records_hash(edges, concepts)))
+    return records, time.perf_counter() - start
+
+
+def _read_chunks(docs, chunk_size, pool, slots, results, stop, counter):
+    """
+    Stage đọc (thread): lấy `chunk_size` document từ cursor rồi giao cho pool biến đổi.
+    Mỗi chunk chiếm 1 slot, slot chỉ được trả khi kết quả đã được lấy ra ghi
+    -> ghi chậm thì đọc cũng dừng, số chunk nằm trong RAM luôn có giới hạn
+    """
+    submitted = 0
+    try:
+        docs = iter(docs)
+        while not stop.is_set():
+            start = time.perf_counter()
+            chunk = list(itertools.islice(docs, chunk_size))
+            counter.add(len(chunk), time.perf_counter() - start)
+            if not chunk:
+                break
+            while not slots.acquire(timeout=0.1):
+                if stop.is_set():
+                    return
+            pool.submit(transform_chunk, chunk).add_done_callback(results.put)
+            submitted += 1
+        results.put(submitted)
+    except BaseException as e:
+        results.put(e)
+
+
+def iter_batches_parallel(docs, batch_size, processes, existing_hashes=None, stats=None, counters=None):
+    """
+    Giống iter_batches nhưng đọc, biến đổi và ghi chạy chồng lên nhau:
+    cursor được đọc trên 1 thread, document được biến đổi trên `processes` process
+    (0 = 1 thread, đỡ chi phí tạo process khi dữ liệu ít / máy 1 CPU)
+    """
+    counters = counters or new_stage_counters(processes, 1)
+    if processes > 0:
+        # spawn: thread đọc cursor + thread nền của pymongo đang chạy, fork lúc đó dễ kẹt lock
+        pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        pool = ThreadPoolExecutor(max_workers=1)
+    slots = threading.Semaphore(2 * max(processes, 1))
+    results = queue.Queue()
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=_read_chunks, args=(docs, batch_size, pool, slots, results, stop, counters["read"]), daemon=True
+    )
+    reader.start()
+
+    batch = GraphBatch()
+    received, total = 0, None
+    try:
+        while total is None or received < total:
+            item = results.get()
+            if isinstance(item, BaseException):
+                raise item
+            if isinstance(item, int):
+                total = item  # thread đọc đã xong, đây là tổng số chunk
+                continue
+            received += 1
+            slots.release()
+            records, seconds = item.result()
+            counters["transform"].add(len(records), seconds)
+            for diagram_id, edges, concepts, content_hash in records:
+                if existing_hashes is not None and existing_hashes.get(diagram_id) == content_hash:
+                    if stats is not None:
+                        stats["skipped"] += 1
+                    continue
+                batch.add(diagram_id, edges, concepts, content_hash)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = GraphBatch()
+        if len(batch):
+            yield batch
+    finally:
+        # Ghi lỗi / dừng giữa chừng: báo thread đọc dừng, bỏ các chunk chưa xử lý
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def write_batches(driver, batches, workers, on_progress, counter=None):
+    """
+    Ghi các batch vào Neo4j với `workers` luồng song song.
+    Chỉ giữ tối đa 2 * workers batch đang chờ để bộ nhớ không phình theo kích thước dữ liệu.
+    """
+    def timed_write(batch):
+        start = time.perf_counter()
+        written = write_batch(driver, batch)
+        if counter is not None:
+            counter.add(written, time.perf_counter() - start)
+        return written
+
+    done = 0
+    if workers <= 1:
+        for batch in batches:
+            done += timed_write(batch)
+            on_progress(done)
+        return done
+
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch in batches:
+            pending.add(executor.submit(timed_write, batch))
+            if len(pending) >= 2 * workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done += future.result()
+                on_progress(done)
+        for future in pending:
+            done += future.result()
+    on_progress(done)
+    return done
+
+
+def sync_collection(driver, collection, batch_size=200, workers=4, incremental=False, processes=None):
+    """
+    Đồng bộ collection diagrams (Mongo) vào Neo4j với driver đã mở.
+    `processes`: None = đọc/biến đổi/ghi lần lượt trên thread chính như cũ,
+    số >= 0 = chạy pipeline (iter_batches_parallel) và in thời gian bận của từng stage.
+    `incremental`: chỉ GHI sơ đồ mới/đổi và xóa sơ đồ đã mất. Vẫn đọc, biến đổi và hash toàn bộ collection
+    (document AI2D không có updated_at để lọc theo mốc), chỉ tiết kiệm phần ghi Neo4j.
+    Đồng bộ liên tục theo thay đổi thì dùng --watch (change stream)
+    Trả về thống kê {"written", "skipped", "deleted"}
+    """
+    ensure_constraints(driver)
+
+    stats = {"skipped": 0, "deleted": 0}
+    existing_hashes = None
+    if incremental:
+        # Trạng thái đã đồng bộ (hash từng sơ đồ) nằm ngay trong Neo4j -> chạy lại sau crash là tự resume
+        existing_hashes = load_existing_hashes(driver)
+        # Cùng khóa với node Diagram (trường id nếu có, không thì _id), nếu không sơ đồ có id khác _id
+        # sẽ bị xóa rồi ghi lại ở mọi lần chạy
+        mongo_ids = {diagram_id_of(doc) for doc in collection.find({}, {"_id": 1, "id": 1})}
+        removed = [diagram_id for diagram_id in existing_hashes if diagram_id not in mongo_ids]
+        for i in range(0, len(removed), batch_size):
+            delete_diagrams(driver, removed[i:i + batch_size])
+        stats["deleted"] = len(removed)
+        print(f"✅ Neo4j đang có {len(existing_hashes)} sơ đồ, xóa {len(removed)} sơ đồ không còn trong MongoDB.")
+    
+    # Lấy toàn bộ sơ đồ
+    cursor = collection.find({}, SYNC_PROJECTION, batch_size=batch_size)
+    total_docs = collection.count_documents({})
+    print(f"✅ Tìm thấy {total_docs} sơ đồ trong MongoDB.")
+
+    start = time.perf_counter()
+    last_report = [0]
+
+    def on_progress(done):
+        if done - last_report[0] >= 1000 or done + stats["skipped"] == total_docs:
+            last_report[0] = done
+            rate = (done + stats["skipped"]) / max(time.perf_counter() - start, 1e-9)
+            print(f"   -> Đã ghi {done}, bỏ qua {stats['skipped']}/{total_docs} sơ đồ ({rate:.0f} docs/s)...")
+
+    counters = None
+    if processes is None:
+        batches = iter_batches(cursor, batch_size, existing_hashes, stats)
+    else:
+        counters = new_stage_counters(processes, workers)
+        batches = iter_batches_parallel(cursor, batch_size, processes, existing_hashes, stats, counters)
+    stats["written"] = write_batches(driver, batches, workers, on_progress, counters and counters["write"])
+
+    elapsed = time.perf_counter() - start
+    if counters is not None:
+        report_stages(counters, elapsed)
+    print(f"🎉 HOÀN TẤT! Neo4j đã được nâng cấp với dữ liệu gốc. "
+          f"Ghi {stats['written']} sơ đồ, bỏ qua {stats['skipped']} sơ đồ không đổi trong {elapsed:.1f}s "
+          f"({(stats['written'] + stats['skipped']) / max(elapsed, 1e-9):.0f} docs/s)")
+    return stats
+
+
+def sync_data(batch_size=200, workers=4, incremental=False, processes=None):
     print("⏳ Đang kết nối MongoDB & Neo4j...")
     
     # Kết nối
     mongo_client = MongoClient(MONGO_URL)
     mongo_db = mongo_client[MONGO_DB_NAME]
-    collection = mongo_db["diagrams"]
-    
     driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
-    
-    # Lấy toàn bộ sơ đồ
-    cursor = collection.find({})
-    total_docs = collection.count_documents({})
-    print(f"✅ Tìm thấy {total_docs} sơ đồ trong MongoDB.")
 
-    count = 0
-    with driver.session() as session:
-        for doc in cursor:
-            diagram_id = doc.get('id') or doc.get('_id') # ID ảnh (vd: 4859.png)
-            
-            # 1. Tạo Node Diagram
-            # Lấy category từ Postgres là tốt nhất, nhưng ở đây tạm lấy 'Unknown' hoặc từ JSON nếu có
-            session.run("""
-                MERGE (d:Diagram {id: $id})
-                SET d.storage_path = 'https://ai2d.r2.cloudflarestorage.com/ai2d/raw/' + $id
-            """, id=diagram_id)
-
-            # 2. Chuẩn bị Mapping (ID -> Tên concept)
-            id_map = get_text_mapping(doc)
-            
-            # 3. Duyệt các quan hệ (Relationships) để vẽ Graph
-            relationships = doc.get('relationships', {})
-            has_arrows = False
-            
-            for rel_id, rel_data in relationships.items():
-                category = rel_data.get('category')
-                
-                # Chỉ quan tâm quan hệ giữa các vật (interObject) -> Mũi tên
-                if category == 'interObject':
-                    origin_id = rel_data.get('origin')
-                    target_id = rel_data.get('target')
-                    relation_type = rel_data.get('relation', 'related_to') # vd: arrowHeadTail
-                    
-                    # Chỉ vẽ nếu cả 2 đầu đều định danh được tên (Text)
-                    if origin_id in id_map and target_id in id_map:
-                        origin_text = id_map[origin_id]
-                        target_text = id_map[target_id]
-                        
-                        # Bỏ qua nếu nối chính nó hoặc text rỗng
-                        if origin_text == target_text or not origin_text:
-                            continue
-
-                        has_arrows = True
-                        
-                        # Cypher query: Tạo 2 Concept và nối mũi tên
-                        query = """
-                        MATCH (d:Diagram {id: $diagram_id})
-                        
-                        MERGE (c1:Concept {name: $t1})
-                        MERGE (c2:Concept {name: $t2})
-                        
-                        MERGE (d)-[:CONTAINS]->(c1)
-                        MERGE (d)-[:CONTAINS]->(c2)
-                        
-                        MERGE (c1)-[:CONNECTED_TO {type: $rel_type}]->(c2)
-                        """
-                        session.run(query, 
-                                    diagram_id=diagram_id, 
-                                    t1=origin_text, 
-                                    t2=target_text,
-                                    rel_type=relation_type)
-
-            # Nếu sơ đồ không có mũi tên nào (hoặc không map được), 
-            # ít nhất hãy nối Diagram với các Text tìm thấy (Fallback)
-            if not has_arrows:
-                for text_content in set(id_map.values()):
-                    if len(text_content) > 1:
-                        session.run("""
-                            MATCH (d:Diagram {id: $id})
-                            MERGE (c:Concept {name: $text})
-                            MERGE (d)-[:CONTAINS]->(c)
-                        """, id=diagram_id, text=text_content)
-
-            count += 1
-            if count % 100 == 0:
-                print(f"   -> Đã xử lý {count}/{total_docs} sơ đồ...")
-
-    print("🎉 HOÀN TẤT! Neo4j đã được nâng cấp với dữ liệu gốc.")
+    stats = sync_collection(driver, mongo_db["diagrams"], batch_size, workers, incremental, processes)
+
+    # Báo cho API biết dữ liệu đã đổi -> cache /enrich của mọi replica tự hết hiệu lực
+    if stats["written"] or stats["deleted"]:
+        version = bump_data_version(mongo_db)
+        print(f"   -> Phiên bản dữ liệu mới: {version}")
+
     driver.close()
     mongo_client.close()
 
+
+def current_cluster_time():
+    """
+    Thời điểm hiện tại của cluster Mongo (operationTime của 1 lệnh bất kỳ trên replica set).
+    Lấy TRƯỚC lượt đồng bộ incremental rồi mở change stream từ đó -> không sót thay đổi
+    ghi vào lúc lượt đồng bộ đang chạy (ghi lại 2 lần cũng không sao: ghi đè theo sơ đồ)
+    """
+    mongo_client = MongoClient(MONGO_URL)
+    try:
+        return mongo_client.admin.command("ping").get("operationTime")
+    finally:
+        mongo_client.close()
+
+
+def watch_changes(batch_size=200, start_at=None):
+    """
+    Theo dõi change stream của collection diagrams và đồng bộ ngay từng thay đổi.
+    Resume token lưu trong Mongo (meta.neo4j_sync) -> khởi động lại sẽ tiếp tục đúng chỗ.
+    Chưa có token thì đọc từ `start_at` (cluster time lấy trước lượt đồng bộ, xem current_cluster_time).
+    Cần MongoDB chạy replica set (Atlas mặc định có).
+    Có cấu hình Postgres thì xóa luôn template tính sẵn (diagram_enrichment) của các sơ đồ vừa đổi.
+    """
+    # Import ở đây: process biến đổi của sync_data không cần psycopg2/enrichment
+    import psycopg2
+    from app.scripts.materialize_enrichment import POSTGRES_CONFIG, invalidate_rows
+
+    mongo_client = MongoClient(MONGO_URL)
+    mongo_db = mongo_client[MONGO_DB_NAME]
+    collection = mongo_db["diagrams"]
+    meta = mongo_db[META_COLLECTION]
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
+    ensure_constraints(driver)
+    pg_conn = None
+    if POSTGRES_CONFIG["host"]:
+        pg_conn = psycopg2.connect(**POSTGRES_CONFIG)
+        pg_conn.autocommit = True
+
+    state = meta.find_one({"_id": SYNC_STATE_ID}) or {}
+    print(f"👀 Đang theo dõi thay đổi MongoDB{' (resume)' if state.get('resume_token') else ''}...")
+
+    # resume_after và start_at_operation_time không dùng cùng nhau được
+    if state.get("resume_token") is not None:
+        start = {"resume_after": state["resume_token"]}
+    else:
+        start = {"start_at_operation_time": start_at}
+    with collection.watch(full_document="updateLookup", max_await_time_ms=1000, **start) as stream:
+        while stream.alive:
+            batch, removed, changed_ids = GraphBatch(), [], set()
+            # Gom các thay đổi đến trong ~1s thành 1 batch
+            while len(batch) + len(removed) < batch_size:
+                change = stream.try_next()
+                if change is None:
+                    break
+                if change["operationType"] == "delete":
+                    removed.append(change["documentKey"]["_id"])
+                    changed_ids.add(str(change["documentKey"]["_id"]))
+                elif change.get("fullDocument") is not None:
+                    batch.add(*build_graph_records(change["fullDocument"]))
+                    changed_ids.add(str(diagram_id_of(change["fullDocument"])))
+
+            if len(batch):
+                write_batch(driver, batch)
+            if removed:
+                delete_diagrams(driver, removed)
+            if len(batch) or removed:
+                bump_data_version(mongo_db)
+                print(f"   -> Đồng bộ {len(batch)} sơ đồ, xóa {len(removed)} sơ đồ")
+            if pg_conn is not None and changed_ids:
+                try:
+                    invalidated = invalidate_rows(pg_conn, changed_ids)
+                    print(f"   -> Bỏ {invalidated} template tính sẵn")
+                except Exception as e:
+                    print(f"⚠️ Không xóa được template tính sẵn: {e}")
+            if stream.resume_token is not None:
+                meta.update_one(
+                    {"_id": SYNC_STATE_ID},
+                    {"$set": {"resume_token": stream.resume_token}, "$currentDate": {"updated_at": True}},
+                    upsert=True,
+                )
+
 if __name__ == "__main__":
-    sync_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Đồng bộ sơ đồ AI2D từ MongoDB sang Neo4j")
+    parser.add_argument("--batch-size", type=int, default=200, help="Số sơ đồ mỗi transaction")
+    parser.add_argument("--workers", type=int, default=4, help="Số luồng ghi Neo4j song song")
+    parser.add_argument("--processes", type=int, default=min(4, (os.cpu_count() or 1) - 1),
+                        help="Số process biến đổi document (0 = 1 thread, vẫn đọc/ghi song song)")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Không dùng pipeline: đọc, biến đổi, ghi lần lượt trên thread chính")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Chỉ ghi sơ đồ mới/thay đổi, xóa sơ đồ không còn trong MongoDB "
+                             "(vẫn đọc + hash toàn bộ collection, chỉ bỏ qua phần ghi)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Sau khi đồng bộ incremental, theo dõi change stream và đồng bộ liên tục")
+    args = parser.parse_args()
+    watch_from = current_cluster_time() if args.watch else None
+    sync_data(batch_size=args.batch_size, workers=args.workers, incremental=args.incremental or args.watch,
+              processes=None if args.sequential else max(args.processes, 0))
+    if args.watch:
+        watch_changes(batch_size=args.batch_size, start_at=watch_from)
@@ -0,0 +1,206 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.db.database import db
+
+# Phiên bản dữ liệu AI2D: lưu trong Mongo (collection `meta`), tăng mỗi lần chạy script đồng bộ.
+# Key cache gồm cả phiên bản -> tăng phiên bản là mọi replica tự bỏ cache cũ.
+META_COLLECTION = "meta"
+DATA_VERSION_ID = "data_version"
+
+
+def bump_data_version(mongo_db) -> int:
+    """
+    Tăng phiên bản dữ liệu (gọi từ script đồng bộ sau khi ghi xong dữ liệu mới)
+    """
+    doc = mongo_db[META_COLLECTION].find_one_and_update(
+        {"_id": DATA_VERSION_ID},
+        {"$inc": {"value": 1}, "$currentDate": {"updated_at": True}},
+        upsert=True,
+        return_document=True,
+    )
+    return doc["value"]
+
+
+class DataVersion:
+    """
+    Đọc phiên bản dữ liệu, nhớ trong `ttl` giây để không tốn 1 round trip Mongo mỗi request
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._value = 0
+        self._checked_at = 0.0
+
+    async def current(self) -> int:
+        if time.monotonic() - self._checked_at < self.ttl or db.mongo_async_db is None:
+            return self._value
+        try:
+            doc = await db.mongo_async_db[META_COLLECTION].find_one({"_id": DATA_VERSION_ID})
+            self._value = doc["value"] if doc else 0
+        except Exception as e:
+            print(f"- Failed to read data version: {e}")
+        self._checked_at = time.monotonic()
+        return self._value
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    def set(self, value: int):
+        self._value = value
+        self._checked_at = time.monotonic()
+
+
+class LRUCache:
+    """
+    Cache trong process: tối đa `maxsize` phần tử, mỗi phần tử sống `ttl` giây
+    """
+
+    def __init__(self, maxsize: int = 1000, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self.get_nowait(key)
+
+    async def set(self, key: str, value: Any):
+        self.set_nowait(key, value)
+
+    # Bản đồng bộ, cho code không chạy trong event loop (formatter, script)
+    def get_nowait(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set_nowait(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    async def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "size": len(self._data), "max": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class MongoCache:
+    """
+    Cache dùng chung giữa các replica, lưu trong 1 collection Mongo có TTL index.
+    Mỗi replica vẫn giữ 1 LRU nhỏ phía trước để request nóng không cần round trip.
+    """
+
+    def __init__(self, collection: str = "response_cache", maxsize: int = 1000, ttl: float = 3600):
+        self.collection = collection
+        self.ttl = ttl
+        self.local = LRUCache(maxsize=maxsize, ttl=min(ttl, 60))
+        self._index_ready = False
+
+    async def _ensure_index(self, coll):
+        if not self._index_ready:
+            await coll.create_index("expire_at", expireAfterSeconds=0)
+            self._index_ready = True
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self.local.get(key)
+        if value is not None or db.mongo_async_db is None:
+            return value
+        doc = await db.mongo_async_db[self.collection].find_one({"_id": key})
+        if doc is None or doc["expire_at"].replace(tzinfo=timezone.utc) < datetime.now(timezone.utc):
+            return None
+        value = (doc["etag"], doc["body"])
+        await self.local.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Any):
+        await self.local.set(key, value)
+        if db.mongo_async_db is None:
+            return
+        coll = db.mongo_async_db[self.collection]
+        await self._ensure_index(coll)
+        etag, body = value
+        await coll.replace_one(
+            {"_id": key},
+            {"etag": etag, "body": body, "expire_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl)},
+            upsert=True,
+        )
+
+    async def clear(self):
+        await self.local.clear()
+        if db.mongo_async_db is not None:
+            await db.mongo_async_db[self.collection].delete_many({})
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.local.stats(), "backend": "mongo"}
+
+
+class ResponseCache:
+    """
+    Cache phản hồi /enrich: key = diagram_id + phiên bản dữ liệu, value = (etag, body JSON)
+    """
+
+    def __init__(self, backend, data_version: DataVersion):
+        self.backend = backend
+        self.data_version = data_version
+
+    async def key(self, namespace: str, item_id: str) -> str:
+        return f"{namespace}:v{await self.data_version.current()}:{item_id}"
+
+    async def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        try:
+            return await self.backend.get(key)
+        except Exception as e:
+            # Cache hỏng thì coi như miss, không làm hỏng request
+            print(f"- Cache get failed: {e}")
+            return None
+
+    async def set(self, key: str, value: Tuple[str, bytes]):
+        try:
+            await self.backend.set(key, value)
+        except Exception as e:
+            print(f"- Cache set failed: {e}")
+
+    async def invalidate(self) -> int:
+        """
+        Tăng phiên bản dữ liệu + xóa cache (dùng cho endpoint admin)
+        """
+        await self.backend.clear()
+        if db.mongo_db is None:
+            version = self.data_version.value + 1
+        else:
+            loop = asyncio.get_running_loop()
+            version = await loop.run_in_executor(None, bump_data_version, db.mongo_db)
+        self.data_version.set(version)
+        return version
+
+    def stats(self) -> Dict[str, Any]:
+        return self.backend.stats()
+
+
+def _create_backend():
+    if settings.ENRICH_CACHE_BACKEND == "mongo":
+        return MongoCache(maxsize=settings.ENRICH_CACHE_SIZE, ttl=settings.ENRICH_CACHE_TTL)
+    return LRUCache(maxsize=settings.ENRICH_CACHE_SIZE, ttl=settings.ENRICH_CACHE_TTL)
+
+# Tạo instance
+response_cache = ResponseCache(_create_backend(), DataVersion(ttl=settings.DATA_VERSION_TTL))
@@ -0,0 +1,275 @@
+import heapq
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class DiagramGraph:
+    """
+    Cấu trúc đồ thị của 1 document AI2D, dựng 1 lần rồi dùng cho cả hai template:
+    - text <-> blob (quan hệ intraObject), tra theo id
+    - mũi tên (interObject) thành danh sách kề giữa các text, khóa theo id (không theo tên hiển thị,
+      2 nhãn trùng tên không đè nhau)
+    """
+
+    def __init__(self, mongo_doc: Dict[str, Any]):
+        self.category = mongo_doc.get("category")
+        self.texts: Dict[str, Dict[str, Any]] = mongo_doc.get("text") or {}
+        self.blobs: Dict[str, Dict[str, Any]] = mongo_doc.get("blobs") or {}
+
+        texts = self.texts
+        text_to_blob: Dict[str, str] = {}
+        arrows = []
+        for rel in (mongo_doc.get("relationships") or {}).values():
+            category = rel.get("category")
+            if category == "intraObject":
+                origin, target = rel.get("origin"), rel.get("target")
+                # Thường là blob -> text, nhưng chấp nhận cả chiều ngược lại
+                if target in texts:
+                    if target not in text_to_blob:
+                        text_to_blob[target] = origin
+                elif origin in texts and origin not in text_to_blob:
+                    text_to_blob[origin] = target
+            elif category == "interObject":
+                arrows.append((rel.get("origin"), rel.get("target")))
+        self.text_to_blob = text_to_blob
+        self._arrows = arrows
+        self._successors: Optional[Dict[str, List[str]]] = None
+
+    @property
+    def successors(self) -> Dict[str, List[str]]:
+        """
+        Danh sách kề text -> text theo mũi tên. Chỉ template chu trình cần nên dựng khi dùng lần đầu
+        """
+        if self._successors is None:
+            # Mũi tên nối blob -> đại diện bằng nhãn đầu tiên (theo thứ tự gốc) nằm trong blob đó
+            texts, text_to_blob = self.texts, self.text_to_blob
+            representative: Dict[str, str] = {}
+            if text_to_blob:
+                for t_id in texts:
+                    blob = text_to_blob.get(t_id)
+                    if blob is not None and blob not in representative:
+                        representative[blob] = t_id
+
+            successors: Dict[str, List[str]] = {}
+            for origin, target in self._arrows:
+                origin = origin if origin in texts else representative.get(origin)
+                target = target if target in texts else representative.get(target)
+                if origin is None or target is None or origin == target:
+                    continue
+                targets = successors.setdefault(origin, [])
+                if target not in targets:
+                    targets.append(target)
+            self._successors = successors
+        return self._successors
+
+    def part_bbox(self, t_id: str) -> Optional[List[int]]:
+        # Ưu tiên bbox của Blob bao quanh Text, không có thì lấy của Text
+        blob = self.blobs.get(self.text_to_blob.get(t_id))
+        if blob is not None:
+            return blob.get("bbox")
+        return self.texts[t_id].get("bbox")
+
+    @staticmethod
+    def _components(roots: List[int], adjacency: List[List[int]]) -> List[List[int]]:
+        """
+        Thành phần liên thông mạnh (Tarjan, viết dạng lặp để không đụng giới hạn đệ quy).
+        Nút đã thuộc 1 thành phần được đánh index = size (lớn hơn mọi low) -> không cần cờ on_stack
+        """
+        size = len(adjacency)
+        index, low, depth = [-1] * size, [0] * size, [0] * size
+        stack, components, counter = [], [], 0
+        for root in roots:
+            if index[root] >= 0:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            depth[root] = len(stack)
+            stack.append(root)
+            work = [(root, iter(adjacency[root]))]
+            while work:
+                node, children = work[-1]
+                for child in children:
+                    i = index[child]
+                    if i < 0:
+                        index[child] = low[child] = counter
+                        counter += 1
+                        depth[child] = len(stack)
+                        stack.append(child)
+                        work.append((child, iter(adjacency[child])))
+                        break
+                    if i < low[node]:
+                        low[node] = i
+                else:
+                    work.pop()
+                    if work and low[node] < low[work[-1][0]]:
+                        low[work[-1][0]] = low[node]
+                    if low[node] == index[node]:
+                        component = stack[depth[node]:]
+                        del stack[depth[node]:]
+                        for member in component:
+                            index[member] = size
+                        components.append(component)
+        return components
+
+    @staticmethod
+    def _walk_cycle(component: List[int], adjacency: List[List[int]], entry: int, leader: List[int]) -> List[int]:
+        # Đi theo mũi tên từ điểm vào, ưu tiên nhánh xuất hiện trước trong document (số nhỏ hơn)
+        head = leader[entry]
+        order, seen, stack = [], set(), [entry]
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            order.append(node)
+            successors = adjacency[node]
+            if len(successors) == 1:
+                # Thường gặp (vòng đơn): không dựng danh sách nhánh
+                succ = successors[0]
+                if leader[succ] == head and succ not in seen:
+                    stack.append(succ)
+                continue
+            nexts = [s for s in successors if leader[s] == head and s not in seen]
+            if len(nexts) > 1:
+                nexts.sort(reverse=True)
+            stack.extend(nexts)
+        if len(order) < len(component):
+            order.extend(sorted(set(component) - seen))
+        return order
+
+    @staticmethod
+    def _topological(connected: List[int], adjacency: List[List[int]], indegree: List[int]) -> List[int]:
+        """
+        Kahn trên từng nút, hòa nhau thì nút xuất hiện trước đi trước. Đồ thị không có chu trình
+        (thường gặp) thì đây đã là thứ tự cuối; có chu trình thì dừng trước các nút nằm trên/sau chu trình
+        """
+        remaining = indegree[:]
+        ready = [i for i in connected if not remaining[i]]  # đã tăng dần -> là heap hợp lệ
+        order = []
+        while ready:
+            node = heapq.heappop(ready)
+            order.append(node)
+            for succ in adjacency[node]:
+                remaining[succ] -= 1
+                if not remaining[succ]:
+                    heapq.heappush(ready, succ)
+        return order
+
+    def ordered_stages(self, nodes: List[str]) -> Tuple[List[str], Dict[str, str], bool]:
+        """
+        Sắp thứ tự các bước theo mũi tên: topo trên đồ thị đã gom chu trình, trong mỗi chu trình
+        đi vòng từ điểm vào. `nodes` theo thứ tự gốc trong document.
+        Trả về (thứ tự, bước kế tiếp của từng nút, có chu trình hay không)
+        """
+        # Đánh số nút theo thứ tự gốc -> so sánh "xuất hiện trước" chỉ là so sánh số;
+        # chỉ giữ mũi tên giữa các nút được xếp (bỏ text không có tên)
+        size = len(nodes)
+        slot = {t_id: i for i, t_id in enumerate(nodes)}
+        adjacency: List[List[int]] = [[] for _ in range(size)]
+        indegree = [0] * size
+        for origin, targets in self.successors.items():
+            a = slot.get(origin)
+            if a is None:
+                continue
+            row = adjacency[a]
+            for target in targets:
+                b = slot.get(target)
+                if b is not None:
+                    row.append(b)
+                    indegree[b] += 1
+        connected = [i for i in range(size) if adjacency[i] or indegree[i]]
+
+        order = self._topological(connected, adjacency, indegree)
+        is_cycle = len(order) < len(connected)
+        if is_cycle:
+            order = self._condensed_order(order, connected, adjacency, indegree)
+
+        # Nhãn không nối mũi tên nào (tiêu đề, chú thích...) xếp sau, theo thứ tự gốc
+        order.extend(i for i in range(size) if not adjacency[i] and not indegree[i])
+
+        # Bước kế tiếp = mũi tên đi ra gần nhất phía sau (vòng lại đầu nếu là bước cuối của chu trình)
+        next_of = {}
+        step_of = None
+        for node in connected:
+            successors = adjacency[node]
+            if len(successors) == 1:
+                next_of[nodes[node]] = nodes[successors[0]]
+            elif successors:
+                if step_of is None:
+                    step_of = [0] * size
+                    for step, i in enumerate(order):
+                        step_of[i] = step
+                here, total = step_of[node], len(order)
+                next_of[nodes[node]] = nodes[min(successors, key=lambda s: (step_of[s] - here) % total)]
+        return [nodes[i] for i in order], next_of, is_cycle
+
+    def _condensed_order(self, acyclic: List[int], connected: List[int], adjacency: List[List[int]],
+                         indegree: List[int]) -> List[int]:
+        """
+        Có chu trình: gom mỗi thành phần liên thông mạnh thành 1 nút rồi Kahn trên đồ thị đã gom.
+        Nút Kahn đã xếp được (`acyclic`) không nằm trên chu trình -> Tarjan chỉ chạy trên phần còn lại.
+        Thành phần đại diện bởi nút xuất hiện trước nhất; nút lẻ giữ nguyên mũi tên và bậc vào,
+        chỉ tính lại phần dính tới chu trình
+        """
+        done = set(acyclic)
+        size = len(adjacency)
+        leader = list(range(size))
+        grouped = [False] * size
+        groups: Dict[int, List[int]] = {}
+        for members in self._components([i for i in connected if i not in done], adjacency):
+            if len(members) > 1:
+                head = min(members)
+                groups[head] = members
+                for node in members:
+                    leader[node] = head
+                    grouped[node] = True
+
+        out_edges = adjacency[:]
+        indegree = indegree[:]
+        for head in groups:
+            out_edges[head] = []
+        entries: Dict[int, List[int]] = {}
+        sources: Dict[int, set] = {head: set() for head in groups}
+        linked = set()
+        for node in connected:
+            successors = adjacency[node]
+            if not grouped[node]:
+                for succ in successors:
+                    if grouped[succ]:
+                        break
+                else:
+                    continue  # nút lẻ -> nút lẻ: giữ nguyên
+                out_edges[node] = []
+            a = leader[node]
+            targets = out_edges[a]
+            for succ in successors:
+                b = leader[succ]
+                if a == b:
+                    continue
+                if grouped[succ]:
+                    entries.setdefault(b, []).append(succ)
+                    sources[b].add(a)
+                else:
+                    indegree[succ] -= 1  # đếm lại theo thành phần nguồn, không theo từng mũi tên
+                if (a, b) not in linked:
+                    linked.add((a, b))
+                    targets.append(b)
+                    if not grouped[succ]:
+                        indegree[succ] += 1
+        for head, heads in sources.items():
+            indegree[head] = len(heads)
+
+        # Kahn, hòa nhau thì thành phần xuất hiện trước trong document đi trước
+        ready = [c for c in connected if leader[c] == c and not indegree[c]]  # đã tăng dần -> là heap hợp lệ
+        order = []
+        while ready:
+            c = heapq.heappop(ready)
+            members = groups.get(c)
+            if members is not None:
+                order.extend(self._walk_cycle(members, adjacency, min(entries.get(c) or members), leader))
+            else:
+                order.append(c)
+            for b in out_edges[c]:
+                indegree[b] -= 1
+                if not indegree[b]:
+                    heapq.heappush(ready, b)
+        return order
@@ -1,42 +1,98 @@
+import asyncio
+from app.core.config import settings
 from app.db.database import db
+from app.services.cache import LRUCache, response_cache
+from app.services.diagram_graph import DiagramGraph
 from typing import Dict, Any, List
 
+# Xếp hạng sơ đồ liên quan trên đồ thị Concept (tạo bởi sync_to_neo4j.py):
+# - concept chung (0 bước) và concept nối với nhau qua CONNECTED_TO (1..depth bước), mỗi bước nhân decay
+# - concept phổ biến (xuất hiện trong nhiều sơ đồ, VD "Sun") được chia cho log(2 + số sơ đồ chứa nó)
+GRAPH_RELATED_CYPHER = """
+    MATCH (d:Diagram {{id: $id}})-[:CONTAINS]->(seed:Concept)
+    WITH d, collect(DISTINCT seed) AS seeds
+    UNWIND seeds AS seed
+    MATCH p = (seed)-[:CONNECTED_TO*0..{depth}]-(n:Concept)
+    WITH d, n, min(length(p)) AS hops
+    ORDER BY hops
+    LIMIT $max_concepts
+    MATCH (n)<-[:CONTAINS]-(other:Diagram)
+    WHERE other <> d
+    WITH other, n, hops, COUNT {{ (n)<-[:CONTAINS]-(:Diagram) }} AS df
+    WITH other,
+        sum($decay ^ hops / log(2.0 + df)) AS score,
+        collect(CASE WHEN hops = 0 THEN n.name END)[..5] AS shared,
+        collect(n.name)[..1] AS nearest
+    RETURN other.id AS diagram_id, score, shared, nearest
+    ORDER BY score DESC, diagram_id
+    LIMIT $limit
+"""
+
+# Các trường Mongo mà formatter template thực sự đọc: không kéo arrows, polygon mũi tên,
+# imageConsts... về chỉ để bỏ đi (giảm byte đọc từ Mongo và thời gian decode BSON)
+TEMPLATE_PROJECTION = {"category": 1, "text": 1, "blobs": 1, "relationships": 1}
+
+# Template đã tính sẵn (app/scripts/materialize_enrichment.py). Tăng FORMAT_VERSION mỗi khi đổi formatter
+# -> các dòng cũ tự bị bỏ qua (tính live) cho tới khi chạy lại job.
+# Hết hạn theo từng sơ đồ: `sync_to_neo4j.py --watch` xóa dòng của sơ đồ vừa đổi, job chạy lại chỉ tính
+# các sơ đồ có source_hash đổi -> tăng phiên bản dữ liệu (xóa cache /enrich) không làm mất cả bảng
+FORMAT_VERSION = 1
+MATERIALIZED_SQL = """
+    SELECT diagram_id, category, group_type, template_type, data
+    FROM diagram_enrichment WHERE diagram_id = ANY(%s) AND format_version = %s
+"""
+
+PRECOMPUTED_RELATED_SQL = "SELECT keywords, related FROM diagram_related WHERE diagram_id = %s"
+PRECOMPUTED_RELATED_BATCH_SQL = "SELECT diagram_id, keywords, related FROM diagram_related WHERE diagram_id = ANY(%s)"
+
+# Từ khóa + sơ đồ liên quan theo từ khóa trong Postgres, cho 1 hoặc nhiều sơ đồ:
+# tối đa `limit` dòng mỗi sơ đồ nguồn, xếp theo (diagram_id, matched_keyword)
+KEYWORDS_BATCH_SQL = """
+    SELECT DISTINCT diagram_id, content FROM entities WHERE diagram_id = ANY(%s) AND type = 'text'
+"""
+RELATED_BATCH_SQL = """
+    WITH kw AS (
+        SELECT DISTINCT diagram_id, content FROM entities WHERE diagram_id = ANY(%s) AND type = 'text'
+    )
+    SELECT src.source_id, m.diagram_id, m.category, m.matched_keyword
+    FROM (SELECT DISTINCT diagram_id AS source_id FROM kw) src
+    CROSS JOIN LATERAL (
+        SELECT DISTINCT e.diagram_id, d.category, e.content AS matched_keyword
+        FROM kw
+        JOIN entities e ON e.content = kw.content AND e.diagram_id != kw.diagram_id
+        JOIN diagrams d ON e.diagram_id = d.id
+        WHERE kw.diagram_id = src.source_id
+        ORDER BY e.diagram_id, matched_keyword
+        LIMIT %s
+    ) m
+    ORDER BY src.source_id, m.diagram_id, m.matched_keyword;
+"""
+
+SEED_CONCEPTS_CYPHER = "MATCH (:Diagram {id: $id})-[:CONTAINS]->(c:Concept) RETURN c.name AS name"
+
 class EnrichmentService:
+
+    def __init__(self):
+        # Kết quả gợi ý từ đồ thị: tính 1 lần / sơ đồ / phiên bản dữ liệu
+        self._graph_cache = LRUCache(maxsize=settings.RELATED_GRAPH_CACHE_SIZE, ttl=24 * 3600)
+        # Template đã format: dùng chung giữa /enrich, /enrich:batch (kể cả khi response cache bị xóa)
+        self._template_cache = LRUCache(maxsize=settings.TEMPLATE_CACHE_SIZE, ttl=24 * 3600)
     
     # --- PHẦN 1: XỬ LÝ LOGIC TEMPLATE (MỚI THÊM) ---
     
-    def _format_structure_template(self, mongo_doc: Dict[str, Any]) -> Dict[str, Any]:
+    def _format_structure_template(self, graph: DiagramGraph) -> Dict[str, Any]:
         """
         Biến đổi dữ liệu thô -> Template A (Cấu trúc)
         """
         parts = []
-        texts = mongo_doc.get("text", {})
-        blobs = mongo_doc.get("blobs", {})
-        
-        # Mapping để tìm bbox chuẩn xác nhất (Ưu tiên bbox của Blob bao quanh Text)
-        # 1. Tạo dict mapping: ID Text -> ID Blob chứa nó (dựa vào quan hệ intraObject)
-        text_to_blob = {}
-        relationships = mongo_doc.get("relationships", {})
-        for rel in relationships.values():
-            if rel.get("category") == "intraObject":
-                text_to_blob[rel["target"]] = rel["origin"]
-
-        # 2. Duyệt qua các text để tạo danh sách parts
-        for t_id, t_data in texts.items():
-            name = t_data.get("value") or t_data.get("utf8_value") or "Unknown"
-            
-            # Tìm bbox: Lấy của Blob nếu có, không thì lấy của Text
-            bbox = t_data.get("bbox") 
-            if t_id in text_to_blob:
-                blob_id = text_to_blob[t_id]
-                if blob_id in blobs:
-                    bbox = blobs[blob_id].get("bbox")
-
+        # Duyệt qua các text để tạo danh sách parts (bbox lấy của Blob bao quanh Text nếu có)
+        description = f"Một phần của {graph.category or 'hệ thống'}" # Có thể customize sau
+        for t_id, t_data in graph.texts.items():
             parts.append({
                 "entity_id": t_id,
-                "name": name,
-                "description": f"Một phần của {mongo_doc.get('category', 'hệ thống')}", # Có thể customize sau
-                "bbox": bbox
+                "name": t_data.get("value") or t_data.get("utf8_value") or "Unknown",
+                "description": description,
+                "bbox": graph.part_bbox(t_id)
             })
             
         return {
@@ -44,111 +100,200 @@ class EnrichmentService:
             "parts": parts
         }
 
-    def _format_cycle_template(self, mongo_doc: Dict[str, Any]) -> Dict[str, Any]:
+    def _format_cycle_template(self, graph: DiagramGraph) -> Dict[str, Any]:
         """
         Biến đổi dữ liệu thô -> Template B (Chu trình)
-        Dựa vào mũi tên (arrows) trong 'interObject' relationships
+        Thứ tự các bước đi theo mũi tên (interObject), chu trình được đi vòng từ điểm vào
         """
+        names = {t_id: t_data.get("value") for t_id, t_data in graph.texts.items() if t_data.get("value")}
+        order, next_of, is_cycle = graph.ordered_stages(list(names))
+
         stages = []
-        texts = mongo_doc.get("text", {})
-        
-        # 1. Tạo map ID -> Name để dễ tra cứu
-        id_to_name = {k: v.get("value", "") for k, v in texts.items()}
-        
-        # 2. Phân tích các mũi tên để tìm quan hệ "Next Step"
-        # connections = { "T1": "T2", "T2": "T3" ... }
-        connections = {} 
-        relationships = mongo_doc.get("relationships", {})
-        
-        for rel in relationships.values():
-            if rel.get("category") == "interObject":
-                origin = rel.get("origin")
-                target = rel.get("target")
-                
-                # Cần map ngược từ Blob ID về Text ID (nếu mũi tên nối Blob)
-                # (Logic này hơi phức tạp, tạm thời giả định mũi tên nối thẳng Text hoặc Blob đã map name)
-                # Để đơn giản cho demo: Ta chỉ lấy tên
-                origin_name = id_to_name.get(origin, origin) # Nếu ko có tên thì lấy ID
-                target_name = id_to_name.get(target, target)
-                
-                if origin_name and target_name:
-                    connections[origin_name] = target_name
-
-        # 3. Tạo danh sách Stages
-        step_count = 1
-        for t_id, t_data in texts.items():
-            name = t_data.get("value")
-            if not name: continue
-            
-            next_step_name = connections.get(name) # Tìm xem thằng này trỏ đi đâu
-            
+        for step, t_id in enumerate(order, start=1):
+            next_id = next_of.get(t_id)
             stages.append({
-                "step": step_count,
-                "name": name,
-                "description": f"Giai đoạn {name}",
-                "next_step": next_step_name if next_step_name else "End"
+                "step": step,
+                "name": names[t_id],
+                "description": f"Giai đoạn {names[t_id]}",
+                "next_step": names[next_id] if next_id else "End"
             })
-            step_count += 1
-            
-        # Sắp xếp lại stages nếu cần (hiện tại đang list theo thứ tự tìm thấy)
+
         return {
             "summary": "Vòng đời/Quy trình diễn ra theo các bước sau.",
+            "is_cycle": is_cycle,
             "stages": stages
         }
 
     # --- PHẦN 2: LOGIC CHÍNH (GIỮ NGUYÊN & GỌI HÀM TRÊN) ---
 
-    def get_related_diagrams(self, current_diagram_id: str):
-        if db.pg_conn is None or db.pg_conn.closed:
-            db.connect()
-        cursor = db.pg_conn.cursor()
-
-        # Lấy từ khóa
-        sql_get_entities = "SELECT DISTINCT content FROM entities WHERE diagram_id = %s AND type = 'text'"
-        cursor.execute(sql_get_entities, (current_diagram_id,))
-        keywords = [row['content'] for row in cursor.fetchall()]
-
-        if not keywords:
-            return [], []
-
-        # Tìm liên kết
-        sql_find_relations = """
-            SELECT DISTINCT e.diagram_id, d.category, e.content as matched_keyword
-            FROM entities e JOIN diagrams d ON e.diagram_id = d.id
-            WHERE e.content = ANY(%s) AND e.diagram_id != %s 
-            LIMIT 10;
-        """
-        cursor.execute(sql_find_relations, (keywords, current_diagram_id))
-        raw_results = cursor.fetchall()
-        cursor.close()
+    async def get_related_diagrams(self, current_diagram_id: str):
+        if settings.RELATED_MODE == "precomputed":
+            # Danh sách đã xếp hạng sẵn bởi app/scripts/build_similarity.py: 1 lần tra khóa chính
+            try:
+                row = await db.pg_fetch(
+                    PRECOMPUTED_RELATED_SQL, (current_diagram_id,), fetch="one", name="related_precomputed"
+                )
+                if row is not None:
+                    return row["keywords"], row["related"]
+            except Exception as e:
+                print(f"- Precomputed related failed, fallback to SQL: {e}")
+
+        if settings.RELATED_MODE == "graph" and db.neo4j_driver is not None:
+            try:
+                return await self._graph_related_diagrams(current_diagram_id)
+            except Exception as e:
+                # Neo4j chậm/lỗi -> quay về cách tìm theo từ khóa trong Postgres
+                print(f"- Graph related failed, fallback to SQL: {e}")
+
+        # Cả 2 query chạy trên cùng 1 connection mượn từ pool, ngoài event loop
+        return await db.pg_run(self._query_related_diagrams, current_diagram_id)
+
+    async def _graph_related_diagrams(self, current_diagram_id: str):
+        cache_key = f"v{await response_cache.data_version.current()}:{current_diagram_id}"
+        cached = await self._graph_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        depth = max(0, min(settings.RELATED_GRAPH_DEPTH, 3))  # chặn độ sâu để không bùng nổ số đường đi
+        params = {
+            "id": current_diagram_id,
+            "decay": settings.RELATED_GRAPH_DECAY,
+            "max_concepts": settings.RELATED_GRAPH_MAX_CONCEPTS,
+            "limit": settings.RELATED_LIMIT,
+        }
+        timeout = settings.RELATED_GRAPH_TIMEOUT
+        rows, seeds = await asyncio.gather(
+            db.neo4j_fetch(GRAPH_RELATED_CYPHER.format(depth=depth), params, timeout=timeout, name="graph_related"),
+            db.neo4j_fetch(SEED_CONCEPTS_CYPHER, {"id": current_diagram_id}, timeout=timeout, name="graph_seeds"),
+        )
+        keywords = [row["name"] for row in seeds]
+
+        # Category nằm ở Postgres: lấy 1 lần cho cả danh sách
+        categories = {}
+        if rows:
+            category_rows = await db.pg_fetch(
+                "SELECT id, category FROM diagrams WHERE id = ANY(%s)", ([row["diagram_id"] for row in rows],),
+                name="related_categories",
+            )
+            categories = {row["id"]: row["category"] for row in category_rows}
 
-        # Format kết quả liên kết
         related_knowledge = []
-        for row in raw_results:
+        for row in rows:
             related_knowledge.append({
-                "concept": row['matched_keyword'],
-                "found_in_diagram": row['diagram_id'],
-                "category": row['category'],
-                "relation": "appears_in",
+                "concept": (row["shared"] or row["nearest"] or [None])[0],
+                "found_in_diagram": row["diagram_id"],
+                "category": categories.get(row["diagram_id"]),
+                "relation": "shares_concept" if row["shared"] else "connected_concept",
+                "score": round(row["score"], 4),
                 "thumbnail_url": f"https://ai2d.r2.cloudflarestorage.com/ai2d/raw/{row['diagram_id']}"
             })
 
-        return keywords, related_knowledge
+        result = (keywords, related_knowledge)
+        await self._graph_cache.set(cache_key, result)
+        return result
 
-    def process_template_data(self, template_type: str, mongo_doc: Dict[str, Any]) -> Dict[str, Any]:
+    def _query_related_diagrams(self, conn, current_diagram_id: str):
+        # Cùng câu query (thứ tự, RELATED_LIMIT) với /enrich:batch: 2 đường cùng ghi 1 khóa cache
+        # nên phải cho ra cùng 1 danh sách
+        return self._query_related_batch(conn, [current_diagram_id])[current_diagram_id]
+
+    @staticmethod
+    def _format_related_row(row) -> Dict[str, Any]:
+        return {
+            "concept": row['matched_keyword'],
+            "found_in_diagram": row['diagram_id'],
+            "category": row['category'],
+            "relation": "appears_in",
+            "thumbnail_url": f"https://ai2d.r2.cloudflarestorage.com/ai2d/raw/{row['diagram_id']}"
+        }
+
+    async def get_related_diagrams_batch(self, diagram_ids: List[str]) -> Dict[str, tuple]:
+        """
+        Gợi ý liên quan cho nhiều sơ đồ cùng lúc: diagram_id -> (keywords, related_knowledge)
+        """
+        results = {diagram_id: ([], []) for diagram_id in diagram_ids}
+        if not diagram_ids:
+            return results
+
+        if settings.RELATED_MODE == "graph" and db.neo4j_driver is not None:
+            # Mỗi sơ đồ 1 truy vấn đồ thị (đã có cache), chạy song song
+            pairs = await asyncio.gather(*(self.get_related_diagrams(i) for i in diagram_ids))
+            return dict(zip(diagram_ids, pairs))
+
+        missing = list(diagram_ids)
+        if settings.RELATED_MODE == "precomputed":
+            try:
+                rows = await db.pg_fetch(PRECOMPUTED_RELATED_BATCH_SQL, (missing,), name="related_precomputed_batch")
+                for row in rows:
+                    results[row["diagram_id"]] = (row["keywords"], row["related"])
+                found = {row["diagram_id"] for row in rows}
+                missing = [i for i in missing if i not in found]
+            except Exception as e:
+                print(f"- Precomputed related failed, fallback to SQL: {e}")
+
+        if missing:
+            results.update(await db.pg_run(self._query_related_batch, missing))
+        return results
+
+    def _query_related_batch(self, conn, diagram_ids: List[str]):
+        results = {diagram_id: ([], []) for diagram_id in diagram_ids}
+        with conn.cursor() as cursor:
+            cursor.execute(KEYWORDS_BATCH_SQL, (diagram_ids,))
+            rows = cursor.fetchall()
+            if not rows:
+                return results
+            for row in rows:
+                results[row['diagram_id']][0].append(row['content'])
+            cursor.execute(RELATED_BATCH_SQL, (diagram_ids, settings.RELATED_LIMIT))
+            for row in cursor.fetchall():
+                results[row['source_id']][1].append(self._format_related_row(row))
+        return results
+
+    @staticmethod
+    def template_type_for(group_type: str) -> str:
+        # Xác định loại template
+        return "structure_view" if group_type == 'Structure' else "process_view"
+
+    async def get_materialized(self, diagram_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Template đã tính sẵn còn hợp lệ (đúng FORMAT_VERSION, chưa bị xóa vì sơ đồ thay đổi):
+        diagram_id -> dòng diagram_enrichment. Sơ đồ không có trong kết quả thì tính live
         """
-        Hàm Router: Quyết định dùng hàm format nào dựa vào template_type
+        try:
+            rows = await db.pg_fetch(MATERIALIZED_SQL, (diagram_ids, FORMAT_VERSION), name="materialized")
+        except Exception as e:
+            print(f"- Materialized enrich failed, fallback to live: {e}")
+            return {}
+        return {row["diagram_id"]: row for row in rows}
+
+    def process_template_data(self, template_type: str, mongo_doc: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Hàm Router: Quyết định dùng hàm format nào dựa vào template_type.
+        Kết quả được nhớ theo (sơ đồ, phiên bản dữ liệu): document chỉ đổi khi dữ liệu được đồng bộ lại.
+        `use_cache=False` cho việc quét toàn bộ (export, materialize): không đẩy các sơ đồ đang nóng ra khỏi cache
         """
         if not mongo_doc:
             return {}
-            
-        if template_type == "structure_view":
-            return self._format_structure_template(mongo_doc)
-        elif template_type == "process_view":
-            return self._format_cycle_template(mongo_doc)
-        else:
+        if template_type not in ("structure_view", "process_view"):
             # Fallback nếu không khớp
             return {"raw": mongo_doc}
 
+        cache_key = None
+        if use_cache and "_id" in mongo_doc:
+            cache_key = f"{template_type}:v{response_cache.data_version.value}:{mongo_doc['_id']}"
+            cached = self._template_cache.get_nowait(cache_key)
+            if cached is not None:
+                return cached
+
+        graph = DiagramGraph(mongo_doc)
+        if template_type == "structure_view":
+            result = self._format_structure_template(graph)
+        else:
+            result = self._format_cycle_template(graph)
+
+        if cache_key is not None:
+            self._template_cache.set_nowait(cache_key, result)
+        return result
+
 # Tạo instance
 enrichment_service = EnrichmentService()
\ No newline at end of file
@@ -0,0 +1,161 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+from app.db.database import db
+from app.services.enrichment import enrichment_service, TEMPLATE_PROJECTION
+from app.utils.responses import dumps
+
+# Các phần có thể có trong mỗi dòng export
+EXPORT_PARTS = ("basic", "raw", "template")
+
+BASIC_BATCH_SQL = "SELECT id, category, group_type FROM diagrams WHERE id = ANY(%s)"
+
+# Hết dữ liệu
+_DONE = object()
+
+
+class ExportSlot:
+    """1 chỗ trong giới hạn EXPORT_MAX_STREAMS; trả lại nhiều lần cũng chỉ tính 1"""
+
+    def __init__(self, service: "ExportService"):
+        self._service = service
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._service.active_streams -= 1
+
+
+class ExportResponse(StreamingResponse):
+    """
+    Trả chỗ khi response kết thúc theo bất kỳ cách nào, kể cả khi body chưa từng được đọc
+    (client ngắt trước khi gửi header -> generator không chạy nên `finally` của nó không chạy)
+    """
+
+    def __init__(self, content, slot: ExportSlot, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.slot.release()
+
+
+class ExportService:
+    """
+    Xuất toàn bộ (hoặc 1 khoảng) sơ đồ dạng NDJSON, mỗi dòng 1 sơ đồ, theo thứ tự _id.
+    - Đọc Mongo bằng 1 cursor (mỗi batch 1 round trip), ghép category/group_type từ Postgres theo batch
+    - Producer (đọc DB) và consumer (format + gửi) nối bằng hàng đợi có giới hạn:
+      client đọc chậm thì producer dừng chờ -> bộ nhớ chỉ giữ vài batch, không phụ thuộc số sơ đồ
+    """
+
+    def __init__(self):
+        self.active_streams = 0
+
+    def reserve(self) -> Optional[ExportSlot]:
+        """
+        Giữ chỗ ngay trong endpoint (kiểm tra + tăng cùng lúc, không có await ở giữa):
+        đếm trong generator thì các request đến cùng lúc đều lọt qua trước khi stream nào bắt đầu
+        """
+        if self.active_streams >= settings.EXPORT_MAX_STREAMS:
+            return None
+        self.active_streams += 1
+        return ExportSlot(self)
+
+    @staticmethod
+    def mongo_projection(parts: Tuple[str, ...], fields: Optional[Dict[str, int]]) -> Optional[Dict[str, int]]:
+        if "raw" in parts:
+            return fields  # None = cả document
+        if "template" in parts:
+            return TEMPLATE_PROJECTION
+        return {"_id": 1}
+
+    async def _produce(self, queue: asyncio.Queue, parts, projection, after: Optional[str],
+                       limit: Optional[int], batch_size: int):
+        try:
+            query = {"_id": {"$gt": after}} if after is not None else {}
+            cursor = db.mongo("diagrams").find(query, projection).sort("_id", 1).batch_size(batch_size)
+            if limit:
+                cursor = cursor.limit(limit)
+            batch: List[Dict[str, Any]] = []
+            async for doc in cursor:
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    await queue.put(await self._with_basic(batch, parts))
+                    batch = []
+            if batch:
+                await queue.put(await self._with_basic(batch, parts))
+            await queue.put(_DONE)
+        except Exception as e:
+            # Báo cho consumer (đang giữ response) thay vì chết lặng trong task nền
+            await queue.put(e)
+
+    @staticmethod
+    async def _with_basic(docs: List[Dict[str, Any]], parts) -> Tuple[List[Dict[str, Any]], Dict[str, Dict]]:
+        if "basic" not in parts and "template" not in parts:
+            return docs, {}
+        rows = await db.pg_fetch(BASIC_BATCH_SQL, ([doc["_id"] for doc in docs],), name="export_basic")
+        return docs, {row["id"]: row for row in rows}
+
+    @staticmethod
+    def render(docs: List[Dict[str, Any]], basic_by_id: Dict[str, Dict], parts) -> bytes:
+        """1 batch -> các dòng NDJSON (chạy trên thread để event loop vẫn phục vụ request khác)"""
+        lines = []
+        for doc in docs:
+            diagram_id = doc["_id"]
+            basic = basic_by_id.get(diagram_id)
+            row: Dict[str, Any] = {"diagram_id": diagram_id}
+            if "basic" in parts:
+                row["category"] = basic["category"] if basic else None
+                row["group_type"] = basic["group_type"] if basic else None
+            if "template" in parts:
+                # Giống /enrich: sơ đồ không có trong Postgres thì không có template
+                template_type = enrichment_service.template_type_for(basic["group_type"]) if basic else None
+                row["template_type"] = template_type
+                row["data"] = (enrichment_service.process_template_data(template_type, doc, use_cache=False)
+                               if template_type else {})
+            if "raw" in parts:
+                row["raw_data"] = doc
+            lines.append(dumps(row))
+        lines.append(b"")
+        return b"\n".join(lines)
+
+    async def stream(self, parts: Tuple[str, ...], fields: Optional[Dict[str, int]] = None,
+                     after: Optional[str] = None, limit: Optional[int] = None,
+                     batch_size: int = None, slot: Optional[ExportSlot] = None) -> AsyncIterator[bytes]:
+        """
+        Sinh từng khối NDJSON (1 khối / batch). Lỗi giữa chừng: status 200 đã gửi rồi nên ghi 1 dòng
+        {"error": ..., "after": id cuối đã gửi} để client gọi lại với `after` đó
+        """
+        batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+        projection = self.mongo_projection(parts, fields)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.EXPORT_PREFETCH_BATCHES)
+        producer = asyncio.create_task(self._produce(queue, parts, projection, after, limit, batch_size))
+        loop = asyncio.get_running_loop()
+        last_id = after
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    print(f"- Export stopped after {last_id}: {item!r}")
+                    yield dumps({"error": str(item) or repr(item), "after": last_id}) + b"\n"
+                    return
+                docs, basic_by_id = item
+                yield await loop.run_in_executor(None, self.render, docs, basic_by_id, parts)
+                last_id = docs[-1]["_id"]
+        finally:
+            # Client ngắt giữa chừng -> dừng đọc DB luôn
+            if slot is not None:
+                slot.release()
+            producer.cancel()
+
+# Tạo instance
+export_service = ExportService()
@@ -0,0 +1,114 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.db.database import db
+
+
+class HealthService:
+    """
+    Kiểm tra sức khỏe cho probe của Kubernetes:
+    - readiness: ping nhẹ từng DB (song song, có timeout), không đếm gì cả
+    - số bản ghi (đắt): task nền làm mới định kỳ, /health chỉ đọc kết quả đã cache
+    """
+
+    def __init__(self):
+        # Chưa đếm lần nào (task nền chưa chạy xong lần đầu)
+        self._counts: Dict[str, str] = {"mongo": "unknown", "postgres": "unknown", "neo4j": "unknown"}
+        self._counts_at: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    # --- READINESS ---
+
+    async def _ping_mongo(self):
+        if db.mongo_async_db is None:
+            raise RuntimeError("not connected")
+        await db.mongo_async_db.command("ping")
+
+    async def _ping_postgres(self):
+        await db.pg_fetch("SELECT 1", fetch="one", name="ping")
+
+    async def _ping_neo4j(self):
+        if db.neo4j_driver is None:
+            raise RuntimeError("not connected")
+        await db.neo4j_fetch("RETURN 1", timeout=settings.HEALTH_CHECK_TIMEOUT, name="ping")
+
+    async def _check(self, store: str, ping) -> str:
+        if not db.is_enabled(store):
+            return "disabled"
+        try:
+            await asyncio.wait_for(ping(), timeout=settings.HEALTH_CHECK_TIMEOUT)
+            return "ok"
+        except asyncio.TimeoutError:
+            return "timeout"
+        except Exception as e:
+            return f"Error: {e}"
+
+    async def readiness(self) -> Dict[str, Any]:
+        stores = ("mongo", "postgres", "neo4j")
+        results = await asyncio.gather(
+            self._check("mongo", self._ping_mongo), self._check("postgres", self._ping_postgres),
+            self._check("neo4j", self._ping_neo4j),
+        )
+        checks = dict(zip(stores, results))
+        # Chỉ các DB bắt buộc mới quyết định ready (Neo4j hỏng thì /enrich vẫn fallback về SQL)
+        ready = all(checks[store] == "ok" for store in settings.HEALTH_REQUIRED_STORES)
+        return {"status": "ready" if ready else "not_ready", "checks": checks}
+
+    # --- SỐ BẢN GHI (CACHE) ---
+
+    async def refresh_counts(self):
+        async def mongo():
+            if db.mongo_async_db is None:
+                return "dead"
+            # Đếm theo metadata của collection, không quét document
+            count = await db.mongo_async_db["diagrams"].estimated_document_count()
+            return f"alive ({count} docs)"
+
+        async def postgres():
+            row = await db.pg_fetch("SELECT COUNT(*) FROM diagrams;", fetch="one", name="count")
+            return f"alive ({row['count']} rows)"
+
+        async def neo4j():
+            if db.neo4j_driver is None:
+                return "dead"
+            rows = await db.neo4j_fetch("MATCH (n) RETURN count(n) AS count", name="count")
+            return f"alive ({rows[0]['count']} nodes)"
+
+        async def guarded(count):
+            # DB không dùng theo cấu hình hiện tại (VD Neo4j khi RELATED_MODE != graph) -> không phải lỗi
+            if not db.is_enabled(count.__name__):
+                return "disabled"
+            try:
+                return await asyncio.wait_for(count(), timeout=settings.HEALTH_COUNTS_TIMEOUT)
+            except Exception as e:
+                return f"Error: {e!r}"
+
+        results = await asyncio.gather(guarded(mongo), guarded(postgres), guarded(neo4j))
+        self._counts = dict(zip(("mongo", "postgres", "neo4j"), results))
+        self._counts_at = time.time()
+
+    def counts(self) -> Dict[str, Any]:
+        age = None if self._counts_at is None else round(time.time() - self._counts_at, 1)
+        return {"status": "ok", **self._counts, "counts_age_seconds": age}
+
+    async def _refresh_loop(self, interval: float):
+        while True:
+            try:
+                await self.refresh_counts()
+            except Exception as e:
+                print(f"- Failed to refresh health counts: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self):
+        if self._refresh_task is None and settings.HEALTH_COUNTS_INTERVAL > 0:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(settings.HEALTH_COUNTS_INTERVAL))
+
+    async def stop(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+# Tạo instance
+health_service = HealthService()
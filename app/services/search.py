@@ -0,0 +1,154 @@
+import asyncio
+import psycopg2
+from app.core.config import settings
+from app.db.database import db
+from app.services.search_index import InMemorySearchIndex
+from typing import Any, Dict, List, Optional
+
+# Truy vấn trên bảng diagram_search (tạo bởi app/scripts/build_search_index.py):
+# mỗi sơ đồ có sẵn 1 "document" = id + category + toàn bộ chữ trong ảnh, có index trigram (ILIKE)
+# và tsvector (xếp hạng). Không còn JOIN entities + DISTINCT trên mỗi lần gõ phím.
+SEARCH_SQL = """
+    SELECT diagram_id AS id, category, storage_path,
+        (CASE WHEN lower(diagram_id) = lower(%(q)s) THEN 3 ELSE 0 END
+         + CASE WHEN category ILIKE %(pattern)s THEN 1 ELSE 0 END
+         + ts_rank(tsv, plainto_tsquery('simple', %(q)s))
+         + word_similarity(lower(%(q)s), document)) AS score
+    FROM diagram_search
+    WHERE document ILIKE %(pattern)s
+    ORDER BY score DESC, diagram_id
+    LIMIT %(limit)s OFFSET %(offset)s;
+"""
+
+# Nạp index RAM: toàn bộ, hoặc chỉ những dòng đổi sau lần nạp trước
+INDEX_ROWS_SQL = """
+    SELECT diagram_id, category, storage_path, document, updated_at
+    FROM diagram_search
+    WHERE updated_at > %s;
+"""
+INDEX_IDS_SQL = "SELECT diagram_id FROM diagram_search;"
+
+# Chưa chạy build_search_index.py (chưa có diagram_search) -> tìm thẳng trên diagrams/entities
+# như trước: chậm hơn và không xếp hạng, nhưng /search không trả 500
+LIVE_SEARCH_SQL = """
+    SELECT DISTINCT d.id, d.category, d.storage_path
+    FROM diagrams d
+    LEFT JOIN entities e ON d.id = e.diagram_id
+    WHERE
+        d.id ILIKE %(pattern)s
+        OR d.category ILIKE %(pattern)s
+        OR e.content ILIKE %(pattern)s
+    ORDER BY d.id
+    LIMIT %(limit)s OFFSET %(offset)s;
+"""
+
+
+def _like_pattern(q: str) -> str:
+    # Escape ký tự đặc biệt của LIKE để "50%" hay "a_b" được tìm đúng nghĩa đen
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _fetch_index_rows(conn, since):
+    with conn.cursor() as cursor:
+        cursor.execute(INDEX_ROWS_SQL, (since,))
+        rows = cursor.fetchall()
+        cursor.execute(INDEX_IDS_SQL)
+        all_ids = {row["diagram_id"] for row in cursor.fetchall()}
+    return rows, all_ids
+
+
+class SearchService:
+
+    def __init__(self):
+        self.memory_index: Optional[InMemorySearchIndex] = None
+        self._index_version = None  # updated_at lớn nhất đã nạp
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._load_task: Optional[asyncio.Task] = None
+        self._refresh_lock = asyncio.Lock()
+        self._warned_no_table = False
+
+    async def search(self, q: str, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Tìm sơ đồ theo id / category / chữ trong ảnh, sắp xếp theo độ liên quan
+        """
+        if self.memory_index is not None:
+            # Chế độ RAM: không chạm tới Postgres
+            return self.memory_index.search(q, limit=limit, offset=offset)
+
+        params = {"q": q, "pattern": _like_pattern(q), "limit": limit, "offset": offset}
+        try:
+            return await db.pg_fetch(SEARCH_SQL, params, name="search")
+        except psycopg2.errors.UndefinedTable:
+            if not self._warned_no_table:
+                print("- Table diagram_search not found, /search falls back to the live query "
+                      "(run app/scripts/build_search_index.py)")
+                self._warned_no_table = True
+            return await db.pg_fetch(LIVE_SEARCH_SQL, params, name="search_live")
+
+    # --- CHẾ ĐỘ INDEX TRONG RAM (SEARCH_MODE=memory) ---
+
+    async def refresh_memory_index(self) -> Dict[str, int]:
+        """
+        Lần đầu: nạp toàn bộ. Các lần sau: chỉ nạp dòng có updated_at mới hơn và bỏ sơ đồ đã bị xóa
+        """
+        async with self._refresh_lock:
+            since = self._index_version or "-infinity"
+            rows, all_ids = await db.pg_run(_fetch_index_rows, since)
+            upserts = [(r["diagram_id"], r["category"], r["storage_path"], r["document"]) for r in rows]
+
+            if self.memory_index is None:
+                loop = asyncio.get_running_loop()
+                self.memory_index = await loop.run_in_executor(
+                    None, lambda: InMemorySearchIndex.build(upserts, ngram=settings.SEARCH_INDEX_NGRAM)
+                )
+                deleted = []
+            else:
+                deleted = [diagram_id for diagram_id in self.memory_index.diagram_ids() if diagram_id not in all_ids]
+                self.memory_index.apply_changes(upserts, deleted)
+
+            if rows:
+                self._index_version = max(r["updated_at"] for r in rows)
+            return {"upserted": len(upserts), "deleted": len(deleted), "diagrams": len(self.memory_index)}
+
+    async def _refresh_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_memory_index()
+            except Exception as e:
+                print(f"- Failed to refresh search index: {e}")
+
+    async def start_memory_index(self):
+        await self.refresh_memory_index()
+        print(f"Loaded in-memory search index ({len(self.memory_index)} diagrams)")
+        if settings.SEARCH_INDEX_REFRESH_SECONDS > 0:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(settings.SEARCH_INDEX_REFRESH_SECONDS))
+
+    async def _load_when_ready(self):
+        await db.wait_connected("postgres")
+        try:
+            await self.start_memory_index()
+        except Exception as e:
+            # Không nạp được thì vẫn chạy, /search dùng Postgres
+            print(f"Failed to load in-memory search index: {e}")
+
+    def start_memory_index_when_ready(self):
+        if self._load_task is None:
+            self._load_task = asyncio.create_task(self._load_when_ready())
+
+    async def stop_memory_index(self):
+        if self._load_task:
+            self._load_task.cancel()
+            self._load_task = None
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+    def memory_stats(self) -> Dict[str, Any]:
+        if self.memory_index is None:
+            return {"mode": "postgres"}
+        return {"mode": "memory", **self.memory_index.memory_stats()}
+
+# Tạo instance
+search_service = SearchService()
@@ -0,0 +1,157 @@
+import heapq
+import sys
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# (diagram_id, category, storage_path, document)
+IndexRow = Tuple[str, Optional[str], Optional[str], str]
+
+
+class InMemorySearchIndex:
+    """
+    Inverted index trong RAM cho /search: n-gram -> danh sách số thứ tự sơ đồ (array 'I').
+    Giữ nguyên ngữ nghĩa "chứa chuỗi con" của ILIKE '%q%':
+    lọc ứng viên bằng giao các posting list rồi kiểm tra lại `q in document`.
+
+    Cập nhật tăng dần: sơ đồ bị sửa/xóa chỉ bị đánh dấu (tombstone), bản mới được thêm vào cuối
+    nên posting list luôn có thứ tự tăng. Khi rác quá nhiều thì gom lại (compact).
+    """
+
+    def __init__(self, ngram: int = 3, compact_ratio: float = 0.25):
+        self.ngram = ngram
+        self.compact_ratio = compact_ratio
+        self._ids: List[str] = []
+        self._categories: List[Optional[str]] = []
+        self._paths: List[Optional[str]] = []
+        self._documents: List[Optional[str]] = []  # None = đã xóa
+        self._position: Dict[str, int] = {}  # diagram_id -> số thứ tự còn hiệu lực
+        self._postings: Dict[str, array] = {}
+        self._deleted = 0
+
+    def __len__(self):
+        return len(self._position)
+
+    def diagram_ids(self):
+        return self._position.keys()
+
+    def _grams(self, text: str):
+        n = self.ngram
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    def _append(self, row: IndexRow):
+        diagram_id, category, storage_path, document = row
+        document = document.lower()
+        ordinal = len(self._ids)
+        # intern: category và các n-gram lặp lại rất nhiều giữa các sơ đồ
+        self._ids.append(sys.intern(diagram_id))
+        self._categories.append(sys.intern(category) if category else category)
+        self._paths.append(storage_path)
+        self._documents.append(document)
+        self._position[diagram_id] = ordinal
+        for gram in self._grams(document):
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[sys.intern(gram)] = array("I")
+            posting.append(ordinal)
+
+    def _remove(self, diagram_id: str):
+        ordinal = self._position.pop(diagram_id, None)
+        if ordinal is not None:
+            self._documents[ordinal] = None
+            self._deleted += 1
+
+    @classmethod
+    def build(cls, rows: Iterable[IndexRow], **kwargs) -> "InMemorySearchIndex":
+        index = cls(**kwargs)
+        for row in rows:
+            index._append(row)
+        return index
+
+    def apply_changes(self, upserts: Iterable[IndexRow], deleted_ids: Iterable[str] = ()):
+        """
+        Áp dụng thay đổi tăng dần (sơ đồ mới/sửa và sơ đồ đã bị xóa)
+        """
+        for diagram_id in deleted_ids:
+            self._remove(diagram_id)
+        for row in upserts:
+            self._remove(row[0])
+            self._append(row)
+
+        if self._deleted > self.compact_ratio * max(len(self._ids), 1):
+            self._compact()
+
+    def _compact(self):
+        alive = [
+            (self._ids[i], self._categories[i], self._paths[i], self._documents[i])
+            for i in range(len(self._ids)) if self._documents[i] is not None
+        ]
+        fresh = InMemorySearchIndex.build(alive, ngram=self.ngram, compact_ratio=self.compact_ratio)
+        self.__dict__.update(fresh.__dict__)
+
+    def _candidates(self, q: str) -> Iterable[int]:
+        if len(q) < self.ngram:
+            # Chuỗi quá ngắn để tra n-gram -> quét tuần tự (corpus nhỏ, vẫn nhanh)
+            return range(len(self._ids))
+
+        postings = []
+        for gram in self._grams(q):
+            posting = self._postings.get(gram)
+            if posting is None:
+                return ()
+            postings.append(posting)
+        postings.sort(key=len)
+
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        return sorted(candidates)
+
+    def search(self, q: str, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        q = q.lower()
+        scored = []
+        for ordinal in self._candidates(q):
+            document = self._documents[ordinal]
+            if document is None or q not in document:
+                continue
+            diagram_id = self._ids[ordinal]
+            category = self._categories[ordinal] or ""
+            # Cùng tiêu chí với truy vấn Postgres: trùng id > trùng category > số lần xuất hiện
+            score = (3 if diagram_id.lower() == q else 0) \
+                + (1 if q in category.lower() else 0) \
+                + min(document.count(q), 10) / 10
+            scored.append((-score, diagram_id, ordinal))
+
+        # Chỉ cần offset + limit kết quả đầu, không sort cả danh sách
+        top = heapq.nsmallest(offset + limit, scored)
+        return [
+            {"id": self._ids[o], "category": self._categories[o], "storage_path": self._paths[o]}
+            for _, _, o in top[offset:]
+        ]
+
+    def memory_stats(self) -> Dict[str, Any]:
+        postings_bytes = sum(sys.getsizeof(p) for p in self._postings.values())
+        keys_bytes = sum(sys.getsizeof(k) for k in self._postings)
+        documents_bytes = sum(sys.getsizeof(d) for d in self._documents if d is not None)
+        # Chuỗi đã intern chỉ tính 1 lần
+        metadata_bytes = sum(sys.getsizeof(s) for s in {*self._ids, *filter(None, self._categories)}) \
+            + sum(sys.getsizeof(p) for p in self._paths if p)
+        containers_bytes = sum(sys.getsizeof(c) for c in (
+            self._ids, self._categories, self._paths, self._documents, self._position, self._postings
+        ))
+        return {
+            "diagrams": len(self._position),
+            "tombstones": self._deleted,
+            "ngram": self.ngram,
+            "distinct_ngrams": len(self._postings),
+            "postings": sum(len(p) for p in self._postings.values()),
+            "bytes": {
+                "postings": postings_bytes,
+                "ngram_keys": keys_bytes,
+                "documents": documents_bytes,
+                "metadata": metadata_bytes,
+                "containers": containers_bytes,
+                "total": postings_bytes + keys_bytes + documents_bytes + metadata_bytes + containers_bytes,
+            },
+        }
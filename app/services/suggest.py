@@ -0,0 +1,97 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.db.database import db
+from app.services.suggest_index import PrefixIndex
+
+# Nguồn từ gợi ý: chữ trong ảnh (entities), category (diagrams), concept trong đồ thị (Neo4j, nếu có)
+ENTITY_TERMS_SQL = """
+    SELECT content, COUNT(DISTINCT diagram_id) AS count
+    FROM entities
+    WHERE type = 'text' AND content IS NOT NULL
+    GROUP BY content;
+"""
+CATEGORY_TERMS_SQL = """
+    SELECT category, COUNT(*) AS count
+    FROM diagrams
+    WHERE category IS NOT NULL
+    GROUP BY category;
+"""
+CONCEPT_TERMS_CYPHER = "MATCH (d:Diagram)-[:CONTAINS]->(c:Concept) RETURN c.name AS name, count(d) AS count"
+
+
+def _fetch_terms(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(ENTITY_TERMS_SQL)
+        terms = [(row["content"], "concept", row["count"]) for row in cursor.fetchall()]
+        cursor.execute(CATEGORY_TERMS_SQL)
+        terms += [(row["category"], "category", row["count"]) for row in cursor.fetchall()]
+    return terms
+
+
+class SuggestService:
+    """
+    Index gợi ý trong RAM: nạp 1 lần khi Postgres sẵn sàng, làm mới định kỳ ở nền.
+    /suggest chỉ đọc index, không chạm DB hay R2
+    """
+
+    def __init__(self):
+        self.index: Optional[PrefixIndex] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self) -> Dict[str, Any]:
+        terms = await db.pg_run(_fetch_terms)
+        if db.neo4j_driver is not None:
+            try:
+                rows = await db.neo4j_fetch(CONCEPT_TERMS_CYPHER, name="suggest_concepts")
+                terms += [(row["name"], "concept", row["count"]) for row in rows if row["name"]]
+            except Exception as e:
+                # Neo4j chỉ là nguồn phụ
+                print(f"- Suggest: bỏ qua concept Neo4j: {e!r}")
+        elif not settings.NEO4J_URI:
+            print("- Suggest: chưa cấu hình NEO4J_URI, index không có concept từ đồ thị")
+        else:
+            # Đang kết nối ở nền: lần làm mới sau sẽ có
+            print("- Suggest: Neo4j chưa kết nối, lần này bỏ qua concept từ đồ thị")
+
+        loop = asyncio.get_running_loop()
+        # Build xong mới thay index cũ -> request đang chạy luôn thấy 1 index hoàn chỉnh
+        self.index = await loop.run_in_executor(None, PrefixIndex, terms)
+        return self.index.stats()
+
+    def suggest(self, prefix: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        if self.index is None:
+            return None
+        return self.index.suggest(prefix, limit)
+
+    async def _run(self, interval: float):
+        await db.wait_connected("postgres")
+        if db.is_enabled("neo4j"):
+            # Chờ Neo4j thêm 1 chút để lần nạp đầu đã có concept; Neo4j hỏng thì vẫn nạp từ Postgres
+            try:
+                await asyncio.wait_for(db.wait_connected("neo4j"), timeout=settings.STARTUP_WAIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        while True:
+            try:
+                stats = await self.refresh()
+                print(f"Loaded suggest index ({stats['terms']} terms)")
+            except Exception as e:
+                print(f"- Failed to refresh suggest index: {e}")
+            if interval <= 0:
+                return
+            # Chưa nạp được lần nào -> thử lại sớm hơn chu kỳ bình thường
+            await asyncio.sleep(interval if self.index is not None else min(interval, 30))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(settings.SUGGEST_REFRESH_SECONDS))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+# Tạo instance
+suggest_service = SuggestService()
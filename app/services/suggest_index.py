@@ -0,0 +1,91 @@
+import bisect
+import heapq
+import sys
+from typing import Any, Dict, Iterable, List, Tuple
+
+# (chuỗi hiển thị, loại: "category" | "concept", số sơ đồ chứa nó)
+SuggestTerm = Tuple[str, str, int]
+
+# Ký tự lớn nhất -> mọi khóa bắt đầu bằng `prefix` nằm trong [prefix, prefix + _MAX_CHAR)
+_MAX_CHAR = chr(sys.maxunicode)
+
+
+class PrefixIndex:
+    """
+    Gợi ý khi gõ (/suggest): mảng khóa đã sắp xếp + tìm nhị phân, không cần trie.
+    Mỗi từ/cụm từ có 1 khóa cho cả cụm và 1 khóa cho từng từ phía sau
+    ("life cycle" tìm được bằng "li" lẫn "cy").
+
+    Top-k theo tần suất trong khoảng khóa khớp:
+    - khoảng nhỏ -> chọn thẳng bằng heap
+    - khoảng lớn (prefix 1-2 ký tự) -> duyệt danh sách term theo tần suất giảm dần,
+      prefix phổ biến nên chỉ cần vài chục bước là đủ k kết quả
+    """
+
+    def __init__(self, terms: Iterable[SuggestTerm], scan_threshold: int = 512):
+        self.scan_threshold = scan_threshold
+        merged: Dict[str, List] = {}
+        for text, kind, count in terms:
+            text = " ".join(text.split())
+            if not text:
+                continue
+            key = text.casefold()
+            entry = merged.get(key)
+            if entry is None:
+                merged[key] = [text, kind, count]
+            else:
+                # Trùng giữa các nguồn: giữ tần suất lớn nhất, category được ưu tiên hiển thị
+                entry[2] = max(entry[2], count)
+                if kind == "category":
+                    entry[0], entry[1] = text, kind
+
+        # Term theo tần suất giảm dần; số thứ tự trong danh sách này = thứ hạng (nhỏ = phổ biến hơn)
+        ranked = sorted(merged.items(), key=lambda item: (-item[1][2], item[0]))
+        self._texts = [sys.intern(entry[0]) for _, entry in ranked]
+        self._kinds = [entry[1] for _, entry in ranked]
+        self._counts = [entry[2] for _, entry in ranked]
+        self._folded = [key for key, _ in ranked]
+
+        pairs = []
+        for rank, key in enumerate(self._folded):
+            words = key.split(" ")
+            for i in range(len(words)):
+                pairs.append((" ".join(words[i:]), rank))
+        pairs.sort()
+        self._keys = [key for key, _ in pairs]
+        self._ranks = [rank for _, rank in pairs]
+
+    def __len__(self):
+        return len(self._texts)
+
+    def _item(self, rank: int) -> Dict[str, Any]:
+        return {"text": self._texts[rank], "kind": self._kinds[rank], "count": self._counts[rank]}
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        normalized = " ".join(prefix.split()).casefold()
+        if not normalized:
+            return []
+        # "water " (đã gõ xong 1 từ) không còn khớp "watercycle"
+        prefix = normalized + " " if prefix[-1].isspace() else normalized
+        lo = bisect.bisect_left(self._keys, prefix)
+        hi = bisect.bisect_left(self._keys, prefix + _MAX_CHAR, lo)
+        if lo == hi:
+            return []
+
+        if hi - lo <= self.scan_threshold:
+            # Cùng 1 term có thể khớp nhiều khóa (cả cụm + từng từ) -> bỏ trùng trước khi chọn
+            ranks = heapq.nsmallest(limit, set(self._ranks[lo:hi]))
+        else:
+            ranks = []
+            for rank, key in enumerate(self._folded):
+                if key.startswith(prefix) or f" {prefix}" in key:
+                    ranks.append(rank)
+                    if len(ranks) >= limit:
+                        break
+        return [self._item(rank) for rank in ranks]
+
+    def stats(self) -> Dict[str, Any]:
+        kinds: Dict[str, int] = {}
+        for kind in self._kinds:
+            kinds[kind] = kinds.get(kind, 0) + 1
+        return {"terms": len(self._texts), "keys": len(self._keys), "by_kind": kinds}
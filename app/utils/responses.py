@@ -0,0 +1,25 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def _default(value: Any):
+    # Kiểu BSON mà orjson không biết (ObjectId, Decimal128, ...) -> chuỗi
+    return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialize JSON bằng orjson (C) thay vì jsonable_encoder + json.dumps (duyệt từng phần tử bằng Python)
+    """
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse dùng orjson. Endpoint trả thẳng FastJSONResponse(...) thì FastAPI bỏ qua cả jsonable_encoder
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,37 +1,150 @@
-import boto3
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import quote
+
 from app.core.config import settings
+from app.core.metrics import PRESIGN
+
+
+def _hmac_sha256(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
 
 class R2Storage:
     def __init__(self):
-        self.s3_client = boto3.client(
-            service_name='s3',
-            endpoint_url=f"https://{settings.R2_ACCOUNT_ID}.r2.cloudflarestorage.com",
-            aws_access_key_id=settings.R2_ACCESS_KEY,
-            aws_secret_access_key=settings.R2_SECRET_KEY,
-            region_name="auto", 
-        )
+        self.endpoint_url = f"https://{settings.R2_ACCOUNT_ID}.r2.cloudflarestorage.com"
+        self._s3_client = None
         self.bucket_name = settings.R2_BUCKET_NAME
+        self.region = "auto"
+
+        # Cache link đã ký: (file_name, expiration) -> (url, thời điểm hết hạn), LRU
+        self.url_cache_size = settings.R2_URL_CACHE_SIZE
+        self.url_bucket_seconds = settings.R2_URL_BUCKET_SECONDS
+        self.url_min_remaining = settings.R2_URL_MIN_REMAINING
+        self._url_cache: "OrderedDict[Tuple[str, int], Tuple[str, int]]" = OrderedDict()
+        self._signing_keys: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def s3_client(self):
+        """
+        Client boto3, chỉ tạo khi cần lần đầu: ký link đã làm tay (SigV4) nên API không cần boto3,
+        import + tạo client tốn ~0.2s lúc khởi động
+        """
+        if self._s3_client is None:
+            import boto3
+
+            with self._lock:
+                if self._s3_client is None:
+                    self._s3_client = boto3.client(
+                        service_name='s3',
+                        endpoint_url=self.endpoint_url,
+                        aws_access_key_id=settings.R2_ACCESS_KEY,
+                        aws_secret_access_key=settings.R2_SECRET_KEY,
+                        region_name="auto",
+                    )
+        return self._s3_client
+
+    def _signing_key(self, datestamp: str) -> bytes:
+        # Khóa ký SigV4 chỉ đổi theo ngày -> tính 1 lần/ngày
+        key = self._signing_keys.get(datestamp)
+        if key is None:
+            key = _hmac_sha256(f"AWS4{settings.R2_SECRET_KEY}".encode("utf-8"), datestamp)
+            for part in (self.region, "s3", "aws4_request"):
+                key = _hmac_sha256(key, part)
+            self._signing_keys = {datestamp: key}
+        return key
+
+    def _presign_get(self, object_name: str, signed_at: int, expiration: int) -> str:
+        """
+        Ký link GET theo SigV4 (query string), giống hệt s3_client.generate_presigned_url
+        nhưng cho chọn thời điểm ký -> cùng file trong cùng khung thời gian luôn ra cùng 1 URL
+        """
+        if not (settings.R2_ACCESS_KEY and settings.R2_SECRET_KEY and self.bucket_name):
+            raise ValueError("Thiếu cấu hình R2 (access key / secret key / bucket)")
+        amz_date = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(signed_at))
+        datestamp = amz_date[:8]
+        scope = f"{datestamp}/{self.region}/s3/aws4_request"
+        host = self.endpoint_url.split("://", 1)[1]
+        canonical_uri = "/" + quote(self.bucket_name, safe="~") + "/" + quote(object_name, safe="/~")
+        canonical_query = "&".join([
+            "X-Amz-Algorithm=AWS4-HMAC-SHA256",
+            "X-Amz-Credential=" + quote(f"{settings.R2_ACCESS_KEY}/{scope}", safe="~"),
+            f"X-Amz-Date={amz_date}",
+            f"X-Amz-Expires={expiration}",
+            "X-Amz-SignedHeaders=host",
+        ])
+        canonical_request = "\n".join([
+            "GET", canonical_uri, canonical_query, f"host:{host}", "", "host", "UNSIGNED-PAYLOAD",
+        ])
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope,
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        ])
+        signature = hmac.new(
+            self._signing_key(datestamp), string_to_sign.encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+        return f"{self.endpoint_url}{canonical_uri}?{canonical_query}&X-Amz-Signature={signature}"
+
+    def _cached_url(self, file_name: str, expiration: int, now: int) -> str:
+        cache_key = (file_name, expiration)
+        with self._lock:
+            entry = self._url_cache.get(cache_key)
+            if entry is not None and entry[1] - now >= self.url_min_remaining:
+                self._url_cache.move_to_end(cache_key)
+                PRESIGN.inc("cache")
+                return entry[0]
+
+        # Làm tròn thời điểm ký xuống đầu khung -> URL ổn định, trình duyệt/CDN cache được
+        signed_at = now - now % self.url_bucket_seconds
+        # Nếu phần hạn còn lại sau khi làm tròn quá ngắn thì ký theo thời điểm hiện tại
+        if signed_at + expiration - now < self.url_min_remaining:
+            signed_at = now
+        # Nếu file name trong DB chưa có folder, thêm vào (tùy cấu trúc bạn upload)
+        url = self._presign_get(f"ai2d/raw/{file_name}", signed_at, expiration)
+        PRESIGN.inc("signed")
+
+        with self._lock:
+            self._url_cache[cache_key] = (url, signed_at + expiration)
+            self._url_cache.move_to_end(cache_key)
+            while len(self._url_cache) > self.url_cache_size:
+                self._url_cache.popitem(last=False)
+        return url
 
     def generate_presigned_url(self, file_name: str, expiration=3600):
         """
-        Tạo link ảnh có hạn sử dụng (mặc định 1 tiếng)
+        Tạo link ảnh có hạn sử dụng (mặc định 1 tiếng).
+        Link được cache, chỉ ký lại khi hạn còn lại < R2_URL_MIN_REMAINING giây
         """
         try:
-            # Nếu file name trong DB chưa có folder, thêm vào (tùy cấu trúc bạn upload)
-            object_name = f"ai2d/raw/{file_name}" 
-            
-            response = self.s3_client.generate_presigned_url(
-                'get_object',
-                Params={
-                    'Bucket': self.bucket_name,
-                    'Key': object_name
-                },
-                ExpiresIn=expiration
-            )
-            return response
+            return self._cached_url(file_name, expiration, int(time.time()))
         except Exception as e:
+            PRESIGN.inc("error")
             print(f"- Error generating URL: {e}")
             return None
 
+    def generate_presigned_urls(self, file_names: Iterable[str], expiration=3600) -> Dict[str, Optional[str]]:
+        """
+        Ký nhiều link cùng lúc (VD: kết quả /search): dùng chung thời điểm ký và khóa ký
+        """
+        now = int(time.time())
+        urls = {}
+        for file_name in file_names:
+            try:
+                urls[file_name] = self._cached_url(file_name, expiration, now)
+            except Exception as e:
+                PRESIGN.inc("error")
+                print(f"- Error generating URL: {e}")
+                urls[file_name] = None
+        return urls
+
+    def url_cache_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._url_cache), "max": self.url_cache_size}
+
 # Tạo instance dùng chung
-storage_client = R2Storage()
\ No newline at end of file
+storage_client = R2Storage()
@@ -0,0 +1,11 @@
+# Benchmark chạy offline: đặt giá trị giả cho các biến môi trường bắt buộc
+# trước khi import app (boto3 ký URL không cần mạng, chỉ cần có key/bucket)
+import os
+
+for _key, _value in {
+    "R2_ACCOUNT_ID": "bench",
+    "R2_ACCESS_KEY": "bench-access-key",
+    "R2_SECRET_KEY": "bench-secret-key",
+    "R2_BUCKET_NAME": "ai2d",
+}.items():
+    os.environ.setdefault(_key, _value)
@@ -0,0 +1,130 @@
+"""
+"Thundering herd" trên 1 sơ đồ nóng: N request /enrich/{id} cùng lúc khi cache còn trống,
+đếm số lần gọi Postgres / Mongo khi có và không có gộp request (single-flight).
+Sau đó kiểm tra rate limiter: 1 client bắn liên tục vs nhiều client (X-Forwarded-For).
+Kết quả được assert: có gộp -> dữ liệu chỉ lấy 1 lần, không gộp -> N lần; hết token -> 429.
+
+Chạy: python -m benchmarks.coalescing_bench [--requests 200] [--latency-ms 5]
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import DB_LATENCY
+from app.core.ratelimit import rate_limiter
+from app.core.singleflight import enrich_flight
+from app.db.database import db
+from app.api.v1 import endpoints
+from app.main import app
+from app.services.cache import LRUCache, response_cache
+from app.services.enrichment import enrichment_service
+from benchmarks.dataset import generate_dataset
+from benchmarks.fakes import install_fakes
+
+
+def postgres_calls() -> int:
+    with DB_LATENCY._lock:
+        return sum(sum(row[:-1]) for labels, row in DB_LATENCY._values.items() if labels[0] == "postgres")
+
+
+def empty_caches():
+    response_cache.backend = LRUCache(maxsize=1000, ttl=3600)
+    enrichment_service._template_cache = LRUCache(maxsize=1000, ttl=24 * 3600)
+
+
+async def herd(client, collection, diagram_id: str, count: int, coalesce: bool):
+    empty_caches()
+    enrich_flight.enabled = coalesce
+    pg_before, mongo_before = postgres_calls(), collection.round_trips
+    # Đếm số lần thực sự lấy dữ liệu (endpoint tra _compute_enrich trong module lúc gọi)
+    computes = []
+    compute = endpoints._compute_enrich
+
+    async def counted(*args):
+        computes.append(args[0])
+        return await compute(*args)
+
+    endpoints._compute_enrich = counted
+    try:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(client.get(f"/api/v1/enrich/{diagram_id}") for _ in range(count)))
+        elapsed = time.perf_counter() - start
+    finally:
+        endpoints._compute_enrich = compute
+    assert all(r.status_code == 200 for r in responses), Counter(r.status_code for r in responses)
+    assert len({r.content for r in responses}) == 1, "các request phải nhận cùng 1 body"
+    return {
+        "computes": len(computes),
+        "postgres": postgres_calls() - pg_before,
+        "mongo": collection.round_trips - mongo_before,
+        "x_cache": Counter(r.headers["x-cache"] for r in responses),
+        "ms": elapsed * 1000,
+    }
+
+
+async def burst(client, count: int, clients: int):
+    responses = await asyncio.gather(*(
+        client.get("/api/v1/enrich/0.png", headers={"X-Forwarded-For": f"10.0.0.{i % clients}"})
+        for i in range(count)
+    ))
+    limited = [r for r in responses if r.status_code == 429]
+    assert all(int(r.headers["retry-after"]) >= 1 for r in limited)
+    return Counter(r.status_code for r in responses)
+
+
+async def run(args):
+    docs = list(generate_dataset(args.diagrams))
+    latency = args.latency_ms / 1000
+    install_fakes(docs, pg_latency=latency, mongo_latency=latency, pool_size=10)
+    collection = db.mongo_async_db["diagrams"]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        print(f"{args.requests} request /enrich cùng 1 id, cache trống (mỗi round trip {args.latency_ms:.0f} ms):")
+        print(f"{'':<18}{'lấy dữ liệu':>12}{'Postgres':>10}{'Mongo':>8}{'thời gian ms':>15}  X-Cache")
+        results = {}
+        for coalesce in (False, True):
+            result = results[coalesce] = await herd(client, collection, docs[1]["_id"], args.requests, coalesce)
+            label = "có gộp request" if coalesce else "không gộp"
+            print(f"{label:<18}{result['computes']:>12}{result['postgres']:>10}{result['mongo']:>8}"
+                  f"{result['ms']:>15.0f}  {dict(result['x_cache'])}")
+        enrich_flight.enabled = settings.COALESCE_ENABLED
+
+        off, on = results[False], results[True]
+        assert off["computes"] == off["mongo"] == args.requests, off
+        assert off["x_cache"] == {"MISS": args.requests}, off["x_cache"]
+        assert on["computes"] == on["mongo"] == 1, on
+        assert on["x_cache"] == {"MISS": 1, "COALESCED": args.requests - 1}, on["x_cache"]
+        assert off["postgres"] == on["postgres"] * args.requests, (off["postgres"], on["postgres"])
+
+        # Rate limit: 5 req/s, burst 10, client lấy từ X-Forwarded-For
+        rate_limiter.rate, rate_limiter.burst = 5, 10
+        settings.RATE_LIMIT_TRUST_FORWARDED = True
+        try:
+            print(f"\nRate limit {rate_limiter.rate:.0f}/s, burst {rate_limiter.burst}, 100 request liền:")
+            single = await burst(client, 100, 1)
+            print(f"  1 client  : {dict(single)}")
+            # Hết burst thì bị chặn; vài token có thể hồi lại trong lúc gửi
+            assert rate_limiter.burst <= single[200] < rate_limiter.burst + 5 and single[429] == 100 - single[200]
+            rate_limiter._buckets.clear()
+            spread = await burst(client, 100, 20)
+            print(f"  20 client : {dict(spread)}")
+            assert spread == {200: 100}  # mỗi client 5 request < burst
+        finally:
+            rate_limiter.rate, rate_limiter.burst = settings.RATE_LIMIT_PER_SECOND, settings.RATE_LIMIT_BURST
+            settings.RATE_LIMIT_TRUST_FORWARDED = False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--diagrams", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
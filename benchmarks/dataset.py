@@ -0,0 +1,116 @@
+"""
+Sinh dữ liệu giả có cấu trúc giống AI2D: mỗi sơ đồ có text (T*), blob (B*),
+quan hệ intraObject (blob chứa text) và interObject (mũi tên giữa các blob).
+Từ vựng phân bố kiểu Zipf để có concept phổ biến (VD "sun") lẫn concept hiếm như dữ liệu thật.
+"""
+import random
+
+CATEGORIES = ["lifeCycles", "foodChainsWebs", "partsOfA", "typesOf", "volcano", "moonPhaseEquinox",
+              "rockCycle", "waterCNPCycle", "photosynthesisRespiration", "solarSystem"]
+BASE_WORDS = ["egg", "larva", "pupa", "adult", "frog", "tadpole", "sun", "moon", "earth", "leaf", "root",
+              "stem", "flower", "seed", "water", "cloud", "rain", "magma", "crust", "mantle", "core",
+              "grass", "rabbit", "fox", "hawk", "snake", "mouse", "deer", "owl", "algae", "fish"]
+
+
+def make_vocabulary(size: int):
+    words = list(BASE_WORDS)
+    i = 0
+    while len(words) < size:
+        words.append(f"{BASE_WORDS[i % len(BASE_WORDS)]} {i // len(BASE_WORDS)}")
+        i += 1
+    return words[:size]
+
+
+def zipf_cum_weights(size: int):
+    cum_weights, total = [], 0.0
+    for rank in range(size):
+        total += 1 / (rank + 1)
+        cum_weights.append(total)
+    return cum_weights
+
+
+def generate_diagram(index: int, rng: random.Random, vocabulary, texts: int = 8, arrows: int = 6, cum_weights=None):
+    """
+    Tạo 1 document Mongo cỡ AI2D (vài đến vài trăm text/mũi tên tùy tham số)
+    """
+    diagram_id = f"{index}.png"
+    cum_weights = cum_weights or zipf_cum_weights(len(vocabulary))
+    words = rng.choices(vocabulary, cum_weights=cum_weights, k=texts)
+
+    text, blobs, relationships = {}, {}, {}
+    for i, word in enumerate(words):
+        x, y = rng.randrange(0, 600), rng.randrange(0, 400)
+        text[f"T{i}"] = {"id": f"T{i}", "value": word, "rectangle": [[x, y], [x + 40, y + 12]],
+                         "bbox": [x, y, 40, 12]}
+        blobs[f"B{i}"] = {"id": f"B{i}", "bbox": [x - 10, y - 10, 60, 40],
+                          "polygon": [[x - 10, y - 10], [x + 50, y - 10], [x + 50, y + 30], [x - 10, y + 30]]}
+        relationships[f"R_intra{i}"] = {"id": f"R_intra{i}", "category": "intraObject",
+                                        "origin": f"B{i}", "target": f"T{i}"}
+    arrow_shapes = {}
+    for j in range(arrows):
+        a, b = rng.randrange(texts), rng.randrange(texts)
+        relationships[f"R_arrow{j}"] = {"id": f"R_arrow{j}", "category": "interObject", "origin": f"B{a}",
+                                        "target": f"B{b}", "relation": "arrowHeadTail"}
+        # Hình mũi tên (polygon) như AI2D: formatter không dùng nhưng chiếm phần lớn dung lượng document
+        (xa, ya), (xb, yb) = text[f"T{a}"]["rectangle"][0], text[f"T{b}"]["rectangle"][0]
+        arrow_shapes[f"A{j}"] = {"id": f"A{j}", "orientation": "right" if xb >= xa else "left",
+                                 "polygon": [[xa + (xb - xa) * k // 8, ya + (yb - ya) * k // 8 + d]
+                                             for k in range(9) for d in (-3, 3)]}
+
+    return {
+        "_id": diagram_id,
+        "category": rng.choice(CATEGORIES),
+        "text": text,
+        "blobs": blobs,
+        "arrows": arrow_shapes,
+        "relationships": relationships,
+    }
+
+
+def generate_dataset(count: int, seed: int = 42, vocabulary_size: int = 2000, texts: int = 8, arrows: int = 6):
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(vocabulary_size)
+    cum_weights = zipf_cum_weights(len(vocabulary))
+    for index in range(count):
+        yield generate_diagram(index, rng, vocabulary, texts=texts, arrows=arrows, cum_weights=cum_weights)
+
+
+def postgres_rows(doc):
+    """
+    (dòng bảng diagrams, các dòng bảng entities) tương ứng với 1 document
+    """
+    group_type = "Process" if doc["category"] in ("lifeCycles", "rockCycle", "waterCNPCycle") else "Structure"
+    diagram = (doc["_id"], doc["category"], group_type, f"ai2d/raw/{doc['_id']}")
+    entities = [(doc["_id"], "text", t["value"]) for t in doc["text"].values()]
+    return diagram, entities
+
+
+def load_postgres(conn, docs, schema: str):
+    """
+    Nạp dữ liệu giả vào bảng diagrams/entities trong schema riêng (xóa và tạo lại)
+    """
+    from psycopg2.extras import execute_values
+
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema};
+            SET search_path TO {schema}, public;
+            CREATE TABLE diagrams (id TEXT PRIMARY KEY, category TEXT, group_type TEXT, storage_path TEXT);
+            CREATE TABLE entities (id SERIAL PRIMARY KEY, diagram_id TEXT, type TEXT, content TEXT);
+        """)
+        diagrams, entities = [], []
+        for doc in docs:
+            diagram, rows = postgres_rows(doc)
+            diagrams.append(diagram)
+            entities.extend(rows)
+        execute_values(cursor, "INSERT INTO diagrams VALUES %s", diagrams, page_size=5000)
+        execute_values(cursor, "INSERT INTO entities (diagram_id, type, content) VALUES %s", entities, page_size=5000)
+        cursor.execute("CREATE INDEX ON entities (diagram_id); CREATE INDEX ON entities (content); ANALYZE;")
+    conn.commit()
+
+
+def drop_schema(conn, schema: str):
+    conn.rollback()
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE;")
+    conn.commit()
@@ -0,0 +1,98 @@
+"""
+So sánh lưới N ảnh: N request /enrich/{id} (trình duyệt mở tối đa 6 kết nối) với 1 request POST /enrich:batch.
+Postgres/Mongo là bản giả trong process (benchmarks.fakes), mỗi round trip tốn --latency-ms.
+
+    python -m benchmarks.enrich_batch_bench --grid 24 --latency-ms 2
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.core.config import settings
+from app.main import app
+from app.services.cache import LRUCache, response_cache
+from app.services.enrichment import enrichment_service
+from benchmarks.dataset import generate_dataset
+from benchmarks.fakes import install_fakes
+
+
+async def singles(client, ids, connections: int):
+    semaphore = asyncio.Semaphore(connections)
+
+    async def one(diagram_id):
+        async with semaphore:
+            response = await client.get(f"/api/v1/enrich/{diagram_id}")
+            response.raise_for_status()
+            return response.json()
+
+    return await asyncio.gather(*(one(i) for i in ids))
+
+
+async def batch(client, ids):
+    response = await client.post("/api/v1/enrich:batch", json={"ids": ids})
+    response.raise_for_status()
+    return response.json()
+
+
+async def measure(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        await response_cache.backend.clear()  # đo đường tính thật, không đo cache
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+async def run(args):
+    docs = list(generate_dataset(args.diagrams))
+    install_fakes(docs, pg_latency=args.latency_ms / 1000, mongo_latency=args.latency_ms / 1000)
+    settings.RELATED_MODE = "sql"
+    response_cache.backend = LRUCache(maxsize=10000, ttl=3600)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        ids = [doc["_id"] for doc in docs[:args.grid]]
+        # Hai cách phải cho cùng kết quả
+        single_results = await singles(client, ids, args.connections)
+        await response_cache.backend.clear()
+        assert await batch(client, ids) == single_results
+
+        # Nguồn phụ lỗi -> vẫn trả đủ sơ đồ (không có related), báo qua header, không ghi cache
+        async def broken_related(diagram_ids):
+            raise RuntimeError("related giả lỗi")
+
+        await response_cache.backend.clear()
+        enrichment_service.get_related_diagrams_batch = broken_related
+        try:
+            response = await client.post("/api/v1/enrich:batch", json={"ids": ids})
+        finally:
+            del enrichment_service.get_related_diagrams_batch
+        assert response.status_code == 200 and response.headers["x-enrich-degraded"] == "related"
+        assert [item["diagram_id"] for item in response.json()] == ids
+        assert all(item["related_knowledge"] == [] for item in response.json())
+        assert response_cache.stats()["size"] == 0
+
+        single_ms = await measure(lambda: singles(client, ids, args.connections), args.repeat)
+        batch_ms = await measure(lambda: batch(client, ids), args.repeat)
+
+    print(f"{args.grid} sơ đồ, latency {args.latency_ms} ms/round trip, {args.connections} kết nối:")
+    print(f"  {args.grid} x GET /enrich/{{id}} : {single_ms:8.1f} ms")
+    print(f"  1 x POST /enrich:batch   : {batch_ms:8.1f} ms  ({single_ms / batch_ms:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--diagrams", type=int, default=2000)
+    parser.add_argument("--grid", type=int, default=24)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--connections", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
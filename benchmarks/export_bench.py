@@ -0,0 +1,104 @@
+"""
+Export toàn bộ corpus: /export/diagrams (NDJSON, gửi dần từng batch) so với cách cũ gọi /diagrams/{id}
+lần lượt từng sơ đồ. DB giả (benchmarks.fakes), mỗi round trip tốn --latency-ms.
+
+Response được đọc thẳng qua ASGI (send chỉ đếm byte rồi bỏ), nên đo được bộ nhớ đỉnh của server
+khi stream: bộ nhớ cấp phát thêm (tracemalloc) gần như không đổi khi số sơ đồ tăng 10 lần.
+
+Chạy: python -m benchmarks.export_bench [--diagrams 2000 20000] [--latency-ms 2] [--client-delay-ms 0]
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+import httpx
+
+from app.main import app
+from benchmarks.dataset import generate_dataset
+from benchmarks.fakes import install_fakes
+
+
+async def stream_export(query_string: str, client_delay: float = 0.0):
+    """
+    Gọi app như uvicorn: send() chỉ đếm byte. `client_delay` giả lập client đọc chậm
+    (server chỉ gửi khối tiếp theo khi send trước đã xong -> backpressure)
+    """
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/api/v1/export/diagrams", "raw_path": b"/api/v1/export/diagrams",
+        "query_string": query_string.encode(), "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80), "root_path": "",
+    }
+    stats = {"status": None, "bytes": 0, "lines": 0, "chunks": 0}
+    done = asyncio.Event()
+
+    async def receive():
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            stats["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            body = message.get("body", b"")
+            stats["bytes"] += len(body)
+            stats["lines"] += body.count(b"\n")
+            stats["chunks"] += 1 if body else 0
+            if client_delay:
+                await asyncio.sleep(client_delay)
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    return stats
+
+
+async def page_one_by_one(ids):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for diagram_id in ids:
+            response = await client.get(f"/api/v1/diagrams/{diagram_id}")
+            response.raise_for_status()
+
+
+async def run(args):
+    latency = args.latency_ms / 1000
+    print(f"{'sơ đồ':>7}  {'cách':<28}{'docs/s':>10}{'MB':>9}{'khối':>7}{'peak MB':>10}")
+    for count in args.diagrams:
+        docs = list(generate_dataset(count))
+        install_fakes(docs, pg_latency=latency, mongo_latency=latency)
+
+        # Cách cũ: từng request (chỉ chạy 1 phần nhỏ rồi quy ra docs/s)
+        sample = [doc["_id"] for doc in docs[:min(count, 500)]]
+        start = time.perf_counter()
+        await page_one_by_one(sample)
+        rate = len(sample) / (time.perf_counter() - start)
+        print(f"{count:>7}  {'GET /diagrams/{id} lần lượt':<28}{rate:>10.0f}")
+
+        for include in ("basic,raw", "basic,template"):
+            query_string = f"include={include}"
+            start = time.perf_counter()
+            stats = await stream_export(query_string)
+            elapsed = time.perf_counter() - start
+            assert stats["status"] == 200 and stats["lines"] == count, stats
+
+            # Lần 2 có tracemalloc (chậm hơn) để đo bộ nhớ đỉnh server cấp phát thêm khi stream
+            tracemalloc.start()
+            await stream_export(query_string, args.client_delay_ms / 1000)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{count:>7}  {'export ' + include:<28}{count / elapsed:>10.0f}"
+                  f"{stats['bytes'] / 1e6:>9.1f}{stats['chunks']:>7}{peak / 1e6:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--diagrams", type=int, nargs="+", default=[2000, 20000])
+    parser.add_argument("--latency-ms", type=float, default=2)
+    parser.add_argument("--client-delay-ms", type=float, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
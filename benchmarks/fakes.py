@@ -0,0 +1,415 @@
+"""
+Bản giả lập trong process của Postgres, MongoDB và Neo4j, chạy trên dữ liệu từ benchmarks.dataset.
+Mỗi round trip tốn `latency` giây (Postgres/Neo4j/Mongo sync: time.sleep vì driver là blocking,
+Mongo async: asyncio.sleep) để benchmark phản ánh đúng số lần gọi DB.
+Chỉ hiểu các câu SQL/Cypher mà app và script đồng bộ thực sự dùng.
+"""
+import asyncio
+import heapq
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from benchmarks.dataset import postgres_rows
+
+
+class FakeDataset:
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.diagrams = {}
+        self.keywords = {}
+        self.by_keyword = defaultdict(list)
+        self.materialized = {}  # bảng diagram_enrichment (xem materialize())
+        for doc in docs:
+            (diagram_id, category, group_type, storage_path), entities = postgres_rows(doc)
+            self.diagrams[diagram_id] = {
+                "id": diagram_id, "category": category, "group_type": group_type, "storage_path": storage_path,
+            }
+            self.keywords[diagram_id] = sorted({content for _, _, content in entities})
+            for content in self.keywords[diagram_id]:
+                self.by_keyword[content].append(diagram_id)
+        for diagram_ids in self.by_keyword.values():
+            diagram_ids.sort()
+
+        # Giống REFRESH_SQL của app/scripts/build_search_index.py (bảng diagram_search)
+        self.search_documents = {
+            diagram_id: " ".join([diagram_id, diagram["category"], *self.keywords[diagram_id]]).lower()
+            for diagram_id, diagram in sorted(self.diagrams.items())
+        }
+
+    def materialize(self, data_version: int = 0):
+        """Điền bảng diagram_enrichment giả bằng đúng hàm của job app/scripts/materialize_enrichment.py"""
+        from app.scripts.materialize_enrichment import build_rows
+
+        columns = ["diagram_id", "category", "group_type", "template_type", "data", "source_hash",
+                   "format_version", "data_version"]
+        for row in build_rows(self.docs.values(), self.diagrams, data_version):
+            row = dict(zip(columns, row))
+            row["data"] = row["data"].adapted
+            self.materialized[row["diagram_id"]] = row
+
+    def related_rows(self, diagram_id, limit):
+        # Trộn các danh sách đã sắp xếp theo từng từ khóa, dừng ở `limit` dòng đầu
+        # (thời gian của "DB" giả chủ yếu là latency, không phải CPU của Python)
+        def stream(content):
+            return ((other, content) for other in self.by_keyword[content] if other != diagram_id)
+
+        streams = [stream(content) for content in self.keywords.get(diagram_id, [])]
+        rows = []
+        for other, content in heapq.merge(*streams):
+            if len(rows) >= limit:
+                break
+            rows.append({"source_id": diagram_id, "diagram_id": other,
+                         "category": self.diagrams[other]["category"], "matched_keyword": content})
+        return rows
+
+
+class FakePgCursor:
+    def __init__(self, dataset: FakeDataset, latency: float):
+        self.dataset = dataset
+        self.latency = latency
+        self._rows = []
+        self.queries = 0
+
+    def execute(self, sql, params=None):
+        time.sleep(self.latency)
+        self._rows = self._dispatch(" ".join(sql.split()), params)
+
+    def _dispatch(self, sql, params):
+        ds = self.dataset
+        if "FROM diagrams WHERE id = %s" in sql:
+            row = ds.diagrams.get(params[0])
+            return [row] if row else []
+        if "FROM diagrams WHERE id = ANY" in sql:
+            return [ds.diagrams[i] for i in params[0] if i in ds.diagrams]
+        if "FROM diagram_enrichment" in sql:
+            return [ds.materialized[i] for i in params[0]
+                    if i in ds.materialized and ds.materialized[i]["format_version"] == params[1]]
+        if sql == "SELECT 1":
+            return [{"?column?": 1}]
+        if "COUNT(*) FROM diagrams" in sql:
+            return [{"count": len(ds.diagrams)}]
+        if sql.startswith("SELECT content, COUNT(DISTINCT diagram_id) AS count FROM entities"):
+            counts = {}
+            for keywords in ds.keywords.values():
+                for content in keywords:
+                    counts[content] = counts.get(content, 0) + 1
+            return [{"content": c, "count": n} for c, n in counts.items()]
+        if sql.startswith("SELECT category, COUNT(*) AS count FROM diagrams"):
+            counts = {}
+            for d in ds.diagrams.values():
+                counts[d["category"]] = counts.get(d["category"], 0) + 1
+            return [{"category": c, "count": n} for c, n in counts.items()]
+        if sql.startswith("SELECT DISTINCT diagram_id, content FROM entities"):
+            return [{"diagram_id": i, "content": c} for i in params[0] for c in ds.keywords.get(i, [])]
+        if sql.startswith("WITH kw AS"):
+            return [row for i in params[0] for row in ds.related_rows(i, params[1])]
+        if sql.startswith("SELECT diagram_id, category, storage_path, document, updated_at FROM diagram_search"):
+            updated_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+            if params[0] != "-infinity":
+                return []
+            return [
+                {"diagram_id": i, "category": d["category"], "storage_path": d["storage_path"],
+                 "document": ds.search_documents[i], "updated_at": updated_at}
+                for i, d in ds.diagrams.items()
+            ]
+        if sql.startswith("SELECT diagram_id FROM diagram_search"):
+            return [{"diagram_id": i} for i in ds.diagrams]
+        if "FROM diagram_search" in sql:
+            q = params["q"].lower()
+            hits = [i for i, document in ds.search_documents.items() if q in document]
+            return [
+                {"id": i, "category": ds.diagrams[i]["category"], "storage_path": ds.diagrams[i]["storage_path"]}
+                for i in hits[params["offset"]:params["offset"] + params["limit"]]
+            ]
+        raise NotImplementedError(f"FakePostgres không hiểu câu SQL: {sql[:80]}")
+
+    def fetchall(self):
+        return self._rows
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakePgConnection:
+    def __init__(self, dataset: FakeDataset, latency: float = 0.002):
+        self.dataset = dataset
+        self.latency = latency
+        self.closed = 0
+
+    def cursor(self, *args, **kwargs):
+        return FakePgCursor(self.dataset, self.latency)
+
+    def close(self):
+        self.closed = 1
+
+
+def _matches(doc, query):
+    for field, condition in (query or {}).items():
+        value = doc.get(field)
+        if isinstance(condition, dict) and "$in" in condition:
+            if value not in condition["$in"]:
+                return False
+        elif isinstance(condition, dict) and "$gt" in condition:
+            if value is None or not value > condition["$gt"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _project(doc, projection):
+    if not projection:
+        return doc
+    included = [k for k, v in projection.items() if v]
+    if not included:
+        excluded = {k for k, v in projection.items() if not v}
+        return {k: v for k, v in doc.items() if k not in excluded}
+    result = {"_id": doc["_id"]}
+    for path in included:
+        source, target = doc, result
+        *parents, leaf = path.split(".")
+        for part in parents:
+            if not isinstance(source, dict) or part not in source:
+                break
+            source = source[part]
+            target = target.setdefault(part, {})
+        else:
+            if isinstance(source, dict) and leaf in source:
+                target[leaf] = source[leaf]
+    return result
+
+
+class FakeAsyncCursor:
+    def __init__(self, collection, docs):
+        self.collection = collection
+        self._docs = docs
+        self._batch_size = 101
+
+    def sort(self, *args, **kwargs):
+        self._docs.sort(key=lambda d: d["_id"])
+        return self
+
+    def batch_size(self, size):
+        self._batch_size = size
+        return self
+
+    def limit(self, count):
+        self._docs = self._docs[:count]
+        return self
+
+    async def to_list(self, length=None):
+        await asyncio.sleep(self.collection.latency)
+        return self._docs[:length] if length else list(self._docs)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for i, doc in enumerate(self._docs):
+            if i % self._batch_size == 0:
+                await asyncio.sleep(self.collection.latency)  # mỗi batch cursor = 1 round trip
+            yield doc
+
+
+class FakeAsyncCollection:
+    def __init__(self, docs, latency: float = 0.002):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.latency = latency
+        self.round_trips = 0
+
+    async def find_one(self, query=None, projection=None, *args, **kwargs):
+        self.round_trips += 1
+        await asyncio.sleep(self.latency)
+        if query and set(query) == {"_id"} and not isinstance(query["_id"], dict):
+            doc = self.docs.get(query["_id"])
+            return _project(doc, projection) if doc else None
+        for doc in self.docs.values():
+            if _matches(doc, query):
+                return _project(doc, projection)
+        return None
+
+    def find(self, query=None, projection=None, *args, **kwargs):
+        self.round_trips += 1
+        docs = [_project(doc, projection) for doc in self.docs.values() if _matches(doc, query)]
+        return FakeAsyncCursor(self, docs)
+
+    async def count_documents(self, query=None):
+        await asyncio.sleep(self.latency)
+        return sum(1 for doc in self.docs.values() if _matches(doc, query))
+
+    async def estimated_document_count(self):
+        await asyncio.sleep(self.latency)
+        return len(self.docs)
+
+
+class FakeAsyncMongoDB(dict):
+    """db.mongo_async_db giả: collection chưa có thì tạo rỗng"""
+
+    def __init__(self, latency: float = 0.002, **collections):
+        super().__init__(collections)
+        self.latency = latency
+
+    def __missing__(self, name):
+        self[name] = FakeAsyncCollection([], self.latency)
+        return self[name]
+
+    def command(self, *args, **kwargs):
+        async def _ping():
+            await asyncio.sleep(self.latency)
+            return {"ok": 1}
+        return _ping()
+
+
+class FakeCollection:
+    """Collection Mongo đồng bộ (pymongo.MongoClient) cho script: find trả về iterator, mỗi batch 1 round trip"""
+
+    def __init__(self, docs, latency: float = 0.002):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.latency = latency
+
+    def find(self, query=None, projection=None, batch_size: int = 101, **kwargs):
+        docs = [_project(doc, projection) for doc in self.docs.values() if _matches(doc, query)]
+        for i, doc in enumerate(docs):
+            if i % batch_size == 0:
+                time.sleep(self.latency)
+            yield doc
+
+    def count_documents(self, query=None):
+        time.sleep(self.latency)
+        return sum(1 for doc in self.docs.values() if _matches(doc, query))
+
+
+class FakeNeo4jResult(list):
+    def consume(self):
+        return None
+
+
+class FakeNeo4jGraph:
+    """
+    Trạng thái Neo4j giả cho app/scripts/sync_to_neo4j.py: node Diagram (kèm sync_hash), Concept,
+    cạnh CONTAINS và CONNECTED_TO (kèm r.diagrams), đủ để so sánh graph giữa các cách đồng bộ.
+    `edges`/`concepts` đếm số dòng đã ghi. Mỗi tx.run/session.run là 1 round trip
+    """
+
+    def __init__(self, latency: float = 0.002):
+        self.latency = latency
+        self.hashes = {}
+        self.concept_names = set()
+        self.contains = set()  # (diagram_id, concept)
+        self.connected = {}  # (t1, t2, rel_type) -> r.diagrams
+        self._edges_of = defaultdict(set)  # diagram_id -> các khóa CONNECTED_TO có diagram_id trong r.diagrams
+        self.edges = 0
+        self.concepts = 0
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def run(self, query, params=None, **kwargs):
+        time.sleep(self.latency)
+        params = {**(params or {}), **kwargs}
+        with self._lock:
+            self.round_trips += 1
+            if "RETURN d.id AS id, d.sync_hash AS hash" in query:
+                return FakeNeo4jResult({"id": i, "hash": h} for i, h in self.hashes.items())
+            if "SET r.diagrams = [x IN r.diagrams WHERE x <> id]" in query:
+                for diagram_id in params["ids"]:
+                    for key in self._edges_of.pop(diagram_id, ()):
+                        self.connected[key].remove(diagram_id)
+                        if not self.connected[key]:
+                            del self.connected[key]
+            elif "DELETE c" in query and "CONTAINS" in query:
+                ids = set(params["ids"])
+                self.contains = {pair for pair in self.contains if pair[0] not in ids}
+            elif "MERGE (d:Diagram {id: row.id})" in query:
+                for row in params["diagrams"]:
+                    self.hashes[row["id"]] = row["hash"]
+            elif "DETACH DELETE d" in query:
+                ids = set(params["ids"])
+                for diagram_id in ids:
+                    self.hashes.pop(diagram_id, None)
+                self.contains = {pair for pair in self.contains if pair[0] not in ids}
+            elif "UNWIND $edges" in query:
+                self.edges += len(params["edges"])
+                for e in params["edges"]:
+                    if e["diagram_id"] not in self.hashes:  # MATCH (d:Diagram) không thấy -> bỏ dòng
+                        continue
+                    self.concept_names.update((e["t1"], e["t2"]))
+                    self.contains.update(((e["diagram_id"], e["t1"]), (e["diagram_id"], e["t2"])))
+                    key = (e["t1"], e["t2"], e["rel_type"])
+                    diagrams = self.connected.setdefault(key, [])
+                    if e["diagram_id"] not in diagrams:
+                        diagrams.append(e["diagram_id"])
+                        self._edges_of[e["diagram_id"]].add(key)
+            elif "UNWIND $concepts" in query:
+                self.concepts += len(params["concepts"])
+                for c in params["concepts"]:
+                    if c["diagram_id"] in self.hashes:
+                        self.concept_names.add(c["name"])
+                        self.contains.add((c["diagram_id"], c["name"]))
+        return FakeNeo4jResult()
+
+    def snapshot(self):
+        """
+        Toàn bộ graph dạng so sánh được. r.diagrams so như tập hợp: thứ tự trong list phụ thuộc
+        thứ tự commit của các worker ghi song song (Neo4j thật cũng vậy)
+        """
+        with self._lock:
+            return {
+                "diagrams": dict(self.hashes),
+                "concepts": set(self.concept_names),
+                "contains": set(self.contains),
+                "connected": {key: sorted(diagrams) for key, diagrams in self.connected.items()},
+            }
+
+
+class FakeNeo4jSession:
+    def __init__(self, graph: FakeNeo4jGraph):
+        self.graph = graph
+
+    def run(self, query, params=None, **kwargs):
+        return self.graph.run(query, params, **kwargs)
+
+    def execute_write(self, fn, *args, **kwargs):
+        return fn(self.graph, *args, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class FakeNeo4jDriver:
+    def __init__(self, latency: float = 0.002):
+        self.graph = FakeNeo4jGraph(latency)
+
+    def session(self, **kwargs):
+        return FakeNeo4jSession(self.graph)
+
+    def close(self):
+        pass
+
+
+def install_fakes(docs, pg_latency: float = 0.002, mongo_latency: float = 0.002, pool_size: int = 10):
+    """
+    Gắn Postgres/Mongo giả vào `db` dùng chung của app. Trả về dataset để benchmark kiểm tra kết quả.
+    """
+    from app.db.database import db, PostgresPool
+
+    dataset = FakeDataset(docs)
+    if db.pg_pool is not None:
+        db.pg_pool.close()
+    db.pg_pool = PostgresPool(lambda: FakePgConnection(dataset, pg_latency), minconn=1, maxconn=pool_size,
+                              acquire_timeout=30)
+    db.mongo_async_db = FakeAsyncMongoDB(mongo_latency, diagrams=FakeAsyncCollection(docs, mongo_latency))
+    return dataset
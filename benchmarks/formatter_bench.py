@@ -0,0 +1,111 @@
+"""
+Formatter template trên sơ đồ lớn (hàng trăm text và mũi tên): bản cũ (dict theo tên hiển thị,
+dựng lại text_to_blob mỗi lần) so với DiagramGraph (khóa theo id, sắp thứ tự theo mũi tên) và khi trúng cache.
+
+    python -m benchmarks.formatter_bench --texts 50 300 1000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app.services.diagram_graph import DiagramGraph
+from app.services.enrichment import enrichment_service
+from benchmarks.dataset import generate_diagram, make_vocabulary, zipf_cum_weights
+
+
+def old_structure(mongo_doc):
+    parts = []
+    texts = mongo_doc.get("text", {})
+    blobs = mongo_doc.get("blobs", {})
+    text_to_blob = {}
+    for rel in mongo_doc.get("relationships", {}).values():
+        if rel.get("category") == "intraObject":
+            text_to_blob[rel["target"]] = rel["origin"]
+    for t_id, t_data in texts.items():
+        bbox = t_data.get("bbox")
+        if t_id in text_to_blob and text_to_blob[t_id] in blobs:
+            bbox = blobs[text_to_blob[t_id]].get("bbox")
+        parts.append({"entity_id": t_id, "name": t_data.get("value") or t_data.get("utf8_value") or "Unknown",
+                      "description": f"Một phần của {mongo_doc.get('category', 'hệ thống')}", "bbox": bbox})
+    return {"summary": f"Biểu đồ mô tả cấu tạo gồm {len(parts)} thành phần.", "parts": parts}
+
+
+def old_cycle(mongo_doc):
+    texts = mongo_doc.get("text", {})
+    id_to_name = {k: v.get("value", "") for k, v in texts.items()}
+    connections = {}
+    for rel in mongo_doc.get("relationships", {}).values():
+        if rel.get("category") == "interObject":
+            origin_name = id_to_name.get(rel.get("origin"), rel.get("origin"))
+            target_name = id_to_name.get(rel.get("target"), rel.get("target"))
+            if origin_name and target_name:
+                connections[origin_name] = target_name
+    stages = []
+    for t_data in texts.values():
+        name = t_data.get("value")
+        if name:
+            stages.append({"step": len(stages) + 1, "name": name, "description": f"Giai đoạn {name}",
+                           "next_step": connections.get(name) or "End"})
+    return {"summary": "Vòng đời/Quy trình diễn ra theo các bước sau.", "stages": stages}
+
+
+def timed_us(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+
+def lifecycle(stages: int, closed: bool = True):
+    """
+    Vòng khép kín T0 -> T1 -> ... -> T0 (closed=False: quy trình thẳng, không có mũi tên quay về T0),
+    mũi tên nối blob, document liệt kê text theo thứ tự xáo trộn
+    """
+    ids = list(range(stages))
+    random.Random(0).shuffle(ids)
+    text = {f"T{i}": {"id": f"T{i}", "value": f"stage {i}", "bbox": [i, i, 10, 10]} for i in ids}
+    blobs = {f"B{i}": {"id": f"B{i}", "bbox": [i, i, 20, 20]} for i in ids}
+    relationships = {f"I{i}": {"category": "intraObject", "origin": f"B{i}", "target": f"T{i}"} for i in ids}
+    relationships.update({f"A{i}": {"category": "interObject", "origin": f"B{i}", "target": f"B{(i + 1) % stages}"}
+                          for i in range(stages if closed else stages - 1)})
+    return {"_id": "cycle.png", "category": "lifeCycles", "text": text, "blobs": blobs, "relationships": relationships}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, nargs="+", default=[50, 300, 1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    # Thứ tự: bản cũ giữ thứ tự document, bản mới đi đúng vòng
+    doc = lifecycle(6)
+    print("Vòng đời 6 bước (text xáo trộn trong document):")
+    print("  cũ :", [s["name"] for s in old_cycle(doc)["stages"]])
+    print("  mới:", [s["name"] for s in enrichment_service.process_template_data("process_view", doc)["stages"]])
+
+    vocabulary = make_vocabulary(2000)
+    cum_weights = zipf_cum_weights(len(vocabulary))
+    print(f"\n{'texts':>6} {'template':<10} {'cũ µs':>10} {'graph µs':>10} {'cache µs':>10}")
+    for texts in args.texts:
+        docs = {
+            "random": generate_diagram(0, random.Random(texts), vocabulary, texts=texts, arrows=texts,
+                                       cum_weights=cum_weights),
+            "cycle": lifecycle(texts),
+            "chain": lifecycle(texts, closed=False),
+        }
+        for shape, doc in docs.items():
+            for template, old, new in (("structure", old_structure, enrichment_service._format_structure_template),
+                                       ("process", old_cycle, enrichment_service._format_cycle_template)):
+                old_us = timed_us(lambda: old(doc), args.repeat)
+                new_us = timed_us(lambda: new(DiagramGraph(doc)), args.repeat)
+                template_type = "structure_view" if template == "structure" else "process_view"
+                enrichment_service.process_template_data(template_type, doc)
+                cached_us = timed_us(lambda: enrichment_service.process_template_data(template_type, doc), args.repeat)
+                print(f"{texts:>6} {template:<10} {old_us:>10.1f} {new_us:>10.1f} {cached_us:>10.1f}  ({shape})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Chi phí của metrics: 1 lần observe/inc/time() và phần middleware thêm vào mỗi request
+(đo /health/live qua ASGI, có và không có MetricsMiddleware), cùng thời gian render /metrics.
+
+Chạy: python -m benchmarks.metrics_overhead_bench
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from app.core.metrics import Counter, Histogram, registry
+from app.main import MetricsMiddleware, app
+
+
+def per_call_us(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+async def request_us(asgi_app, repeat: int) -> float:
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(100):  # làm nóng
+            await client.get("/health/live")
+        start = time.perf_counter()
+        for _ in range(repeat):
+            await client.get("/health/live")
+        return (time.perf_counter() - start) / repeat * 1e6
+
+
+async def run(args):
+    histogram = Histogram("bench_seconds", "bench", ("route",))
+    counter = Counter("bench_total", "bench", ("result",))
+
+    def timed():
+        with histogram.time("/x"):
+            pass
+
+    print(f"  Histogram.observe : {per_call_us(lambda: histogram.observe(0.012, '/x'), args.repeat):6.2f} us")
+    print(f"  Counter.inc       : {per_call_us(lambda: counter.inc('cache'), args.repeat):6.2f} us")
+    print(f"  Histogram.time()  : {per_call_us(timed, args.repeat):6.2f} us")
+
+    # App đã có MetricsMiddleware; bản "không metrics" là app gốc chưa bọc middleware
+    app.build_middleware_stack()
+    with_metrics = await request_us(app, args.requests)
+    app.user_middleware = [m for m in app.user_middleware if m.cls is not MetricsMiddleware]
+    app.middleware_stack = app.build_middleware_stack()
+    without_metrics = await request_us(app, args.requests)
+    print(f"  GET /health/live  : {without_metrics:7.1f} us không metrics, {with_metrics:7.1f} us có metrics "
+          f"(+{with_metrics - without_metrics:.1f} us)")
+
+    start = time.perf_counter()
+    body = registry.render()
+    print(f"  render /metrics   : {(time.perf_counter() - start) * 1000:6.2f} ms ({len(body)} bytes)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200_000)
+    parser.add_argument("--requests", type=int, default=2000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark /diagrams/{id}: Mongo blocking (pymongo sync gọi trong async def, như trước)
+so với client async. Mongo giả lập bằng collection có độ trễ cố định mỗi find_one.
+Đo throughput của /diagrams/{id} và độ trễ của /health chạy song song.
+
+Chạy: python -m benchmarks.mongo_async_bench [--latency-ms 20] [--requests 200]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.db.database import db
+from app.api.v1.endpoints import get_diagram_detail, health
+
+
+def _fake_doc(diagram_id):
+    return {"_id": diagram_id, "text": {}, "blobs": {}, "relationships": {}}
+
+
+class BlockingCollection:
+    """Giống pymongo sync: find_one block cả event loop"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def find_one(self, query, *args, **kwargs):
+        time.sleep(self.latency)
+        return _fake_doc(query["_id"])
+
+
+class AsyncCollection:
+    """Giống client async: find_one nhường event loop trong lúc chờ mạng"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def find_one(self, query, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+        return _fake_doc(query["_id"])
+
+
+async def run(total: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    health_latencies = []
+    done = asyncio.Event()
+
+    async def detail(i):
+        async with sem:
+            await get_diagram_detail(f"{i}.png", fields=None)
+
+    async def probe():
+        # /health được gọi đều đặn trong lúc tải cao
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0)
+            health()
+            health_latencies.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(0.005)
+
+    probe_task = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(detail(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe_task
+    return total / elapsed, max(health_latencies), statistics.median(health_latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+
+    print(f"{'mode':<10}{'req/s':>10}{'health p50 ms':>16}{'health max ms':>16}")
+    for mode, collection in (("blocking", BlockingCollection(latency)), ("async", AsyncCollection(latency))):
+        db.mongo_async_db = {"diagrams": collection}
+        rps, worst, p50 = asyncio.run(run(args.requests, args.concurrency))
+        print(f"{mode:<10}{rps:>10.1f}{p50:>16.2f}{worst:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
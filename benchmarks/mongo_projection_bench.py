@@ -0,0 +1,71 @@
+"""
+Dung lượng đọc từ Mongo (BSON) và thời gian serialize cho document AI2D: cả document so với
+projection của /enrich (TEMPLATE_PROJECTION) và sparse fieldset của /diagrams/{id}?fields=...
+
+    python -m benchmarks.mongo_projection_bench --texts 8 40 150
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+import bson
+from fastapi.encoders import jsonable_encoder
+
+from app.services.diagram_graph import DiagramGraph
+from app.services.enrichment import TEMPLATE_PROJECTION, enrichment_service
+from benchmarks.dataset import generate_diagram, make_vocabulary, zipf_cum_weights
+from benchmarks.fakes import _project
+
+
+def timed_us(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+
+def measure(doc, projection, repeat: int):
+    projected = _project(doc, projection)
+    raw = bson.encode(projected)
+    # Đường đi của driver (decode BSON) + FastAPI (jsonable_encoder + json.dumps)
+    decode_us = timed_us(lambda: bson.decode(raw), repeat)
+    encode_us = timed_us(lambda: json.dumps(jsonable_encoder(projected)), repeat)
+    format_us = timed_us(lambda: enrichment_service._format_structure_template(DiagramGraph(bson.decode(raw))), repeat)
+    return len(raw), decode_us, encode_us, format_us
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, nargs="+", default=[8, 40, 150])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    vocabulary = make_vocabulary(2000)
+    cum_weights = zipf_cum_weights(len(vocabulary))
+    variants = [
+        ("toàn bộ document", None),
+        ("/enrich projection", TEMPLATE_PROJECTION),
+        ("fields=text", {"text": 1}),
+    ]
+    print(f"{'texts':>6} {'projection':<20} {'BSON bytes':>11} {'decode µs':>10} {'json µs':>10} {'format µs':>10}")
+    for texts in args.texts:
+        doc = generate_diagram(0, random.Random(42), vocabulary, texts=texts, arrows=texts, cum_weights=cum_weights)
+        doc.update({
+            "imageName": doc["_id"],
+            "imageConsts": {f"C{i}": {"id": f"C{i}", "polygon": [[i, i]] * 8} for i in range(texts // 4)},
+            "arrowHeads": {f"H{i}": {"id": f"H{i}", "rectangle": [[i, i], [i + 5, i + 5]]} for i in range(texts)},
+        })
+        base = None
+        for name, projection in variants:
+            size, decode_us, encode_us, format_us = measure(doc, projection, args.repeat)
+            base = base or size
+            print(f"{texts:>6} {name:<20} {size:>11,} {decode_us:>10.1f} {encode_us:>10.1f} {format_us:>10.1f}"
+                  f"  ({size / base:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Load test cho /search: so sánh throughput khi dùng 1 connection duy nhất (như trước)
+và khi dùng pool, với Postgres giả lập có độ trễ cố định mỗi query.
+
+Chạy: python -m benchmarks.pg_pool_load_test [--latency-ms 20] [--requests 200]
+"""
+import argparse
+import asyncio
+import time
+
+from app.db.database import db, PostgresPool
+from app.api.v1.endpoints import search_diagrams
+
+
+class FakeCursor:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def execute(self, sql, params=None):
+        # Giả lập round trip tới Postgres (blocking như psycopg2)
+        time.sleep(self.latency)
+
+    def fetchall(self):
+        return [{"id": f"{i}.png", "category": "lifeCycles", "storage_path": None} for i in range(20)]
+
+    def fetchone(self):
+        return {"id": "1.png", "category": "lifeCycles", "group_type": "Process"}
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeConnection:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.closed = 0
+
+    def cursor(self):
+        return FakeCursor(self.latency)
+
+    def close(self):
+        self.closed = 1
+
+
+async def run_load(concurrency: int, total: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            await search_diagrams(q="frog", limit=20, offset=0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=10)
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+
+    print(f"{'mode':<12}{'concurrency':>12}{'req/s':>10}")
+    for mode, maxconn in (("single", 1), ("pool", args.pool_size)):
+        db.pg_pool = PostgresPool(lambda: FakeConnection(latency), minconn=1, maxconn=maxconn, acquire_timeout=30)
+        for concurrency in (1, 4, 8, 16, 32):
+            rps = asyncio.run(run_load(concurrency, args.requests))
+            print(f"{mode:<12}{concurrency:>12}{rps:>10.1f}")
+        db.pg_pool.close()
+
+
+if __name__ == "__main__":
+    main()
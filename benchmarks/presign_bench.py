@@ -0,0 +1,47 @@
+"""
+Micro-benchmark ký link ảnh R2: boto3 (cách cũ), ký SigV4 trực tiếp khi cache trống (cold)
+và khi link đã có trong cache, với 20 link (1 trang /search) và 1000 link.
+
+Chạy: python -m benchmarks.presign_bench
+"""
+import time
+
+from app.utils.storage import R2Storage
+
+
+def bench(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    print(f"{'urls':>6}{'boto3 ms':>12}{'cold ms':>12}{'cached ms':>12}")
+    for count in (20, 1000):
+        names = [f"{i}.png" for i in range(count)]
+        repeat = 50 if count == 20 else 3
+        storage = R2Storage()
+
+        def boto3_sign():
+            for name in names:
+                storage.s3_client.generate_presigned_url(
+                    'get_object', Params={'Bucket': storage.bucket_name, 'Key': f"ai2d/raw/{name}"}, ExpiresIn=3600
+                )
+
+        def cold():
+            storage._url_cache.clear()
+            storage.generate_presigned_urls(names)
+
+        def cached():
+            storage.generate_presigned_urls(names)
+
+        boto3_ms = bench(boto3_sign, repeat)
+        cold_ms = bench(cold, repeat)
+        storage.generate_presigned_urls(names)
+        cached_ms = bench(cached, repeat)
+        print(f"{count:>6}{boto3_ms:>12.3f}{cold_ms:>12.3f}{cached_ms:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+CPU mỗi request cho phần dựng + serialize JSON của /diagrams/{id} và /enrich/{id}, sơ đồ nhỏ và lớn:
+đường cũ (jsonable_encoder + json.dumps, validate KnowledgeResponse + model_dump_json) so với
+đường mới (orjson, không validate lại dữ liệu formatter đã tạo).
+
+    python -m benchmarks.serialization_bench --texts 8 300
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from typing import Any, Dict, List
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from app.api.v1.endpoints import _knowledge_from
+from app.main import app
+from app.services.cache import LRUCache, response_cache
+from app.services.enrichment import enrichment_service
+from app.utils.responses import dumps
+from benchmarks.dataset import generate_diagram, make_vocabulary, zipf_cum_weights
+from benchmarks.fakes import install_fakes
+
+
+class OldKnowledgeResponse(BaseModel):
+    """KnowledgeResponse trước khi có model cho parts/stages (data là Dict[str, Any])"""
+    diagram_id: str
+    title: str
+    group_type: str
+    template_type: str
+    data: Dict[str, Any]
+    related_knowledge: List[Dict[str, Any]] = []
+
+
+def cpu_us(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.process_time()
+        fn()
+        samples.append((time.process_time() - start) * 1e6)
+    return statistics.mean(samples)
+
+
+def old_detail(doc):
+    return json.dumps(jsonable_encoder({"diagram_id": doc["_id"], "raw_data": doc, "message": "m"})).encode()
+
+
+def new_detail(doc):
+    return dumps({"diagram_id": doc["_id"], "raw_data": doc, "message": "m"})
+
+
+def old_enrich(doc, basic, related):
+    return OldKnowledgeResponse(**_knowledge_from(doc["_id"], basic, doc, related)).model_dump_json().encode()
+
+
+def new_enrich(doc, basic, related):
+    return dumps(_knowledge_from(doc["_id"], basic, doc, related))
+
+
+async def end_to_end(docs, repeat: int):
+    """CPU cho 1 request qua toàn bộ FastAPI (DB giả không trễ, không cache)"""
+    install_fakes(docs, pg_latency=0, mongo_latency=0)
+    response_cache.backend = LRUCache(maxsize=0)
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for path in ("diagrams", "enrich"):
+            for doc in docs:
+                start = time.process_time()
+                for _ in range(repeat):
+                    (await client.get(f"/api/v1/{path}/{doc['_id']}")).raise_for_status()
+                results[path, doc["_id"]] = (time.process_time() - start) / repeat * 1e6
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, nargs="+", default=[8, 300])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    enrichment_service._template_cache.maxsize = 0  # đo cả phần format, không đo cache
+    vocabulary = make_vocabulary(2000)
+    cum_weights = zipf_cum_weights(len(vocabulary))
+    docs = [generate_diagram(i, random.Random(i), vocabulary, texts=texts, arrows=texts, cum_weights=cum_weights)
+            for i, texts in enumerate(args.texts)]
+    related = [{"concept": "sun", "found_in_diagram": f"{i}.png", "category": "lifeCycles", "relation": "appears_in",
+                "thumbnail_url": f"https://ai2d.r2.cloudflarestorage.com/ai2d/raw/{i}.png"} for i in range(10)]
+
+    print(f"{'texts':>6} {'phần':<22} {'cũ µs':>10} {'mới µs':>10} {'nhanh hơn':>10}")
+    for texts, doc in zip(args.texts, docs):
+        for group_type in ("Structure", "Process"):
+            basic = {"category": doc["category"], "group_type": group_type}
+            assert json.loads(old_enrich(doc, basic, related)) == json.loads(new_enrich(doc, basic, related))
+            old = cpu_us(lambda: old_enrich(doc, basic, related), args.repeat)
+            new = cpu_us(lambda: new_enrich(doc, basic, related), args.repeat)
+            print(f"{texts:>6} {'enrich ' + group_type:<22} {old:>10.1f} {new:>10.1f} {old / new:>9.1f}x")
+        old = cpu_us(lambda: old_detail(doc), args.repeat)
+        new = cpu_us(lambda: new_detail(doc), args.repeat)
+        print(f"{texts:>6} {'diagrams (raw)':<22} {old:>10.1f} {new:>10.1f} {old / new:>9.1f}x")
+
+    print("\nCPU / request qua FastAPI (đường mới):")
+    for (path, diagram_id), us in asyncio.run(end_to_end(docs, max(args.repeat // 10, 5))).items():
+        print(f"  /{path}/{diagram_id:<8} {us:>10.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
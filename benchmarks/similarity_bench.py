@@ -0,0 +1,93 @@
+"""
+Benchmark ma trận tương đồng tính trước (app/scripts/build_similarity.py):
+- thời gian build (ma trận thưa + top-k vector hóa) trên 5k..50k sơ đồ giả (không cần DB)
+- nếu có BENCH_PG_DSN: độ trễ /enrich lấy gợi ý bằng 1 lần tra khóa chính so với 2 query SQL cũ
+
+Chạy: python -m benchmarks.similarity_bench [--sizes 5000 20000 50000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+from app.scripts.build_similarity import build_matrix, build_rows, build_similarity, compute_neighbors
+from benchmarks.dataset import drop_schema, generate_dataset, load_postgres
+
+
+def bench_build(docs, weighting: str, k: int = 10):
+    keyword_sets = [{t["value"] for t in doc["text"].values()} for doc in docs]
+    diagrams = [{"id": doc["_id"], "category": doc["category"]} for doc in docs]
+    start = time.perf_counter()
+    matrix, terms, idf = build_matrix(keyword_sets, weighting)
+    neighbors, scores = compute_neighbors(matrix, k=k, weighting=weighting)
+    topk_s = time.perf_counter() - start
+    build_rows(diagrams, keyword_sets, neighbors, scores, dict(zip(terms, idf.tolist())))
+    return topk_s, time.perf_counter() - start
+
+
+async def bench_lookup(ids, repeat: int):
+    from app.core.config import settings
+    from app.services.enrichment import enrichment_service
+
+    results = {}
+    for mode in ("sql", "precomputed"):
+        settings.RELATED_MODE = mode
+        samples = []
+        for _ in range(repeat):
+            for diagram_id in ids:
+                start = time.perf_counter()
+                await enrichment_service.get_related_diagrams(diagram_id)
+                samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        results[mode] = (statistics.median(samples), samples[int(len(samples) * 0.95)])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 20000, 50000])
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'diagrams':>10}{'weighting':>10}{'top-k s':>10}{'total s':>10}")
+    for size in args.sizes:
+        docs = list(generate_dataset(size))
+        for weighting in ("tfidf", "jaccard"):
+            topk_s, total_s = bench_build(docs, weighting)
+            print(f"{size:>10}{weighting:>10}{topk_s:>10.2f}{total_s:>10.2f}")
+
+    dsn = os.getenv("BENCH_PG_DSN")
+    if not dsn:
+        print("(Bỏ qua đo độ trễ tra cứu: chưa đặt BENCH_PG_DSN)")
+        return
+
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    from app.db.database import db, PostgresPool
+
+    docs = list(generate_dataset(args.sizes[0]))
+    conn = psycopg2.connect(dsn)
+    try:
+        load_postgres(conn, docs, "bench_similarity")
+        build_similarity(conn)
+
+        def factory():
+            c = psycopg2.connect(dsn, cursor_factory=RealDictCursor, options="-c search_path=bench_similarity")
+            c.autocommit = True
+            return c
+
+        db.pg_pool = PostgresPool(factory, minconn=1, maxconn=4)
+        ids = [doc["_id"] for doc in random.Random(1).sample(docs, args.queries)]
+        print(f"{'mode':<12}{'p50 ms':>10}{'p95 ms':>10}")
+        for mode, (p50, p95) in asyncio.run(bench_lookup(ids, 3)).items():
+            print(f"{mode:<12}{p50:>10.2f}{p95:>10.2f}")
+        db.pg_pool.close()
+    finally:
+        drop_schema(conn, "bench_similarity")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Thời gian khởi động API:
+1. Import app.main (process mới, lấy trung vị) so với cách cũ import sẵn neo4j + tạo client boto3
+2. Thời gian tới lúc startup xong (lifespan) với DB giả chậm / chết:
+   connect() lần lượt như cũ so với start() mở song song + chờ có giới hạn
+
+Chạy: python -m benchmarks.startup_bench [--runs 5] [--latency-ms 300] [--wait 2]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from app.core.config import settings
+from app.db.database import db
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+{eager}
+import app.main
+print(time.perf_counter() - start)
+"""
+
+# Những gì app.main từng làm lúc import trước khi client được tạo lười
+EAGER_CLIENTS = """
+import neo4j, boto3
+boto3.client("s3", endpoint_url="https://bench.r2.cloudflarestorage.com", region_name="auto",
+             aws_access_key_id="bench", aws_secret_access_key="bench")
+"""
+
+
+def import_seconds(eager: bool, runs: int) -> float:
+    code = IMPORT_SNIPPET.format(eager=EAGER_CLIENTS if eager else "")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=root)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def fake_connector(store: str, latency: float, failures: int = 0, dead: bool = False):
+    state = {"failures": failures}
+
+    def connect():
+        time.sleep(latency)
+        if dead or state["failures"] > 0:
+            state["failures"] -= 1
+            raise ConnectionError(f"{store} unreachable")
+
+    return connect
+
+
+def install(connectors):
+    db._connectors = lambda: dict(connectors)
+
+
+async def time_start(wait: float) -> float:
+    start = time.perf_counter()
+    await db.start(wait=wait)
+    elapsed = time.perf_counter() - start
+    for task in db._connect_tasks.values():
+        task.cancel()
+    db._connect_tasks = {}
+    return elapsed
+
+
+def time_sequential() -> float:
+    start = time.perf_counter()
+    db.connect()
+    return time.perf_counter() - start
+
+
+async def run(args):
+    print(f"Import app.main (trung vị {args.runs} lần, process mới):")
+    lazy = import_seconds(False, args.runs)
+    eager = import_seconds(True, args.runs)
+    print(f"  client tạo lười : {lazy * 1000:7.0f} ms")
+    print(f"  import sẵn      : {eager * 1000:7.0f} ms (neo4j + boto3 như trước)")
+
+    latency = args.latency_ms / 1000
+    settings.DB_RECONNECT_MIN_DELAY = latency
+    # Hàm tạo connector mới cho mỗi lần chạy (đếm số lần lỗi lại từ đầu)
+    scenarios = {
+        "cả 3 DB chậm": lambda: {
+            "mongo": fake_connector("mongo", latency),
+            "postgres": fake_connector("postgres", latency),
+            "neo4j": fake_connector("neo4j", latency),
+        },
+        "Postgres lỗi 2 lần đầu": lambda: {
+            "mongo": fake_connector("mongo", latency),
+            "postgres": fake_connector("postgres", latency, failures=2),
+            "neo4j": fake_connector("neo4j", latency),
+        },
+        "Neo4j chết hẳn": lambda: {
+            "mongo": fake_connector("mongo", latency),
+            "postgres": fake_connector("postgres", latency),
+            "neo4j": fake_connector("neo4j", latency * 10, dead=True),
+        },
+    }
+    print(f"\nTới lúc startup xong (mỗi lần kết nối {args.latency_ms:.0f} ms, chờ tối đa {args.wait:.1f}s):")
+    print(f"{'kịch bản':<26}{'lần lượt ms':>14}{'song song ms':>15}")
+    for name, connectors in scenarios.items():
+        install(connectors())
+        sequential = time_sequential()
+        install(connectors())
+        concurrent = await time_start(args.wait)
+        print(f"{name:<26}{sequential * 1000:>14.0f}{concurrent * 1000:>15.0f}")
+    print("(lần lượt: DB lỗi bị bỏ qua, không thử lại; song song: DB chưa lên tiếp tục thử ở nền)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--wait", type=float, default=2)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
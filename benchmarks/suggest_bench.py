@@ -0,0 +1,139 @@
+"""
+Độ trễ gợi ý khi gõ (/suggest) với từ vựng cỡ thật: --terms concept (mặc định 50k, AI2D có
+cỡ vài chục nghìn nhãn chữ khác nhau) tần suất kiểu Zipf + các category.
+Mỗi truy vấn là tiền tố 1..6 ký tự của 1 term lấy theo tần suất (người dùng hay gõ từ phổ biến).
+
+So sánh: PrefixIndex.suggest vs quét tuyến tính (startswith trên mọi term), và cả request
+GET /api/v1/suggest qua ASGI so với GET /api/v1/search (Postgres giả).
+
+Chạy: python -m benchmarks.suggest_bench [--terms 50000] [--queries 20000]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import tracemalloc
+
+import httpx
+
+from app.main import app
+from app.services.suggest import suggest_service
+from app.services.suggest_index import PrefixIndex
+from benchmarks.dataset import CATEGORIES, generate_dataset, make_vocabulary
+from benchmarks.fakes import install_fakes
+
+
+def make_terms(count: int, seed: int):
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(count)
+    # Tần suất Zipf (số sơ đồ chứa term), xáo thứ hạng để term phổ biến không dồn về đầu bảng chữ cái
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    terms = [(word, "concept", max(1, 100_000 // rank)) for word, rank in zip(vocabulary, ranks)]
+    terms += [(category, "category", rng.randrange(100, 1000)) for category in CATEGORIES]
+    return terms
+
+
+def make_queries(terms, count: int, seed: int):
+    rng = random.Random(seed)
+    texts = [text for text, _, _ in terms]
+    weights = [weight for _, _, weight in terms]
+    queries = []
+    for text in rng.choices(texts, weights=weights, k=count):
+        queries.append(text[:rng.randint(1, min(6, len(text)))])
+    return queries
+
+
+def linear_suggest(terms_by_count, prefix: str, limit: int):
+    prefix = prefix.casefold()
+    results = []
+    for text, kind, count in terms_by_count:
+        folded = text.casefold()
+        if folded.startswith(prefix) or f" {prefix}" in folded:
+            results.append({"text": text, "kind": kind, "count": count})
+            if len(results) >= limit:
+                break
+    return results
+
+
+def latency_us(fn, queries):
+    samples = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        "p50": statistics.median(samples),
+        "p99": samples[int(len(samples) * 0.99) - 1],
+        "max": samples[-1],
+    }
+
+
+async def http_latency_ms(client, urls):
+    samples = []
+    for url in urls:
+        start = time.perf_counter()
+        response = await client.get(url)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.text
+    return statistics.median(samples)
+
+
+async def run(args):
+    terms = make_terms(args.terms, args.seed)
+    queries = make_queries(terms, args.queries, args.seed)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = PrefixIndex(terms)
+    build_s = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"Index: {len(index)} term, {index.stats()['keys']} khóa, build {build_s * 1000:.0f} ms, "
+          f"~{memory / 1e6:.1f} MB")
+
+    # Kết quả phải giống quét tuyến tính (cùng thứ tự: tần suất giảm dần, rồi theo chữ)
+    terms_by_count = sorted(terms, key=lambda t: (-t[2], t[0].casefold()))
+    for q in queries[:500]:
+        expected = [item["text"] for item in linear_suggest(terms_by_count, q, 10)]
+        assert [item["text"] for item in index.suggest(q, 10)] == expected, q
+
+    print(f"\n{'':<22}{'p50 us':>10}{'p99 us':>10}{'max us':>10}")
+    for name, fn in (("PrefixIndex", lambda q: index.suggest(q, 10)),
+                     ("quét tuyến tính", lambda q: linear_suggest(terms_by_count, q, 10))):
+        sample = queries if name == "PrefixIndex" else queries[:2000]
+        result = latency_us(fn, sample)
+        print(f"{name:<22}{result['p50']:>10.1f}{result['p99']:>10.1f}{result['max']:>10.1f}")
+    for length in range(1, 7):
+        sample = [q for q in queries if len(q) == length]
+        if sample:
+            result = latency_us(lambda q: index.suggest(q, 10), sample)
+            print(f"{'  tiền tố ' + str(length) + ' ký tự':<22}{result['p50']:>10.1f}{result['p99']:>10.1f}"
+                  f"{result['max']:>10.1f}")
+
+    # Qua HTTP: /suggest (chỉ đọc RAM) vs /search (Postgres giả + ký 20 link ảnh)
+    install_fakes(list(generate_dataset(2000)), pg_latency=args.latency_ms / 1000,
+                  mongo_latency=args.latency_ms / 1000)
+    suggest_service.index = index
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        http_queries = [q for q in queries if len(q) >= 2][:500]
+        suggest_ms = await http_latency_ms(client, [f"/api/v1/suggest?q={q}" for q in http_queries])
+        search_ms = await http_latency_ms(client, [f"/api/v1/search?q={q}" for q in http_queries])
+    print(f"\nGET /suggest p50 {suggest_ms:.2f} ms, GET /search p50 {search_ms:.2f} ms "
+          f"(round trip DB giả {args.latency_ms:.0f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--terms", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=20_000)
+    parser.add_argument("--latency-ms", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Bộ benchmark lặp lại được cho API và script đồng bộ, chạy hoàn toàn trong process:
+dữ liệu giả cỡ AI2D (benchmarks.dataset, seed cố định) + Postgres/Mongo/Neo4j giả (benchmarks.fakes),
+mỗi round trip DB tốn --latency-ms. Kết quả in ra dạng JSON để so sánh giữa các commit.
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.suite --output bench-main.json
+    python -m benchmarks.suite --output bench-branch.json --compare bench-main.json
+    python -m benchmarks.suite --only enrich_cold,sync_neo4j_full
+
+So sánh: kịch bản HTTP so p50, kịch bản job so docs/s; chậm đi quá --threshold thì exit code 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import httpx
+
+from app.core.config import settings
+from app.main import app
+from app.scripts import sync_to_neo4j
+from app.services.cache import LRUCache, response_cache
+from app.services.enrichment import enrichment_service
+from app.services.search import search_service
+from benchmarks.dataset import generate_dataset
+from benchmarks.fakes import FakeCollection, FakeNeo4jDriver, install_fakes
+
+
+@contextmanager
+def overrides(**values):
+    """Đổi tạm Settings trong 1 kịch bản"""
+    previous = {name: getattr(settings, name) for name in values}
+    for name, value in values.items():
+        setattr(settings, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(settings, name, value)
+
+
+def use_caches(enabled: bool):
+    # Tắt cache = LRU cỡ 0: mọi request đi đường tính thật
+    size = 100_000 if enabled else 0
+    response_cache.backend = LRUCache(maxsize=size, ttl=3600)
+    enrichment_service._template_cache = LRUCache(maxsize=size, ttl=24 * 3600)
+    enrichment_service._graph_cache = LRUCache(maxsize=size, ttl=24 * 3600)
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def load(client, make_request, requests: int, concurrency: int, warmup: int, repeat: int):
+    """
+    `requests` request chia cho `concurrency` worker, lặp `repeat` lần.
+    Trả về thống kê latency (ms) trên mọi lần lặp và throughput trung vị giữa các lần
+    """
+    for i in range(warmup):
+        (await make_request(client, i)).raise_for_status()
+
+    samples, throughputs = [], []
+    for _ in range(repeat):
+        counter = iter(range(requests))
+
+        async def worker():
+            for i in counter:
+                start = time.perf_counter()
+                response = await make_request(client, i)
+                samples.append((time.perf_counter() - start) * 1000)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        throughputs.append(requests / (time.perf_counter() - start))
+    return {
+        "kind": "http",
+        "requests": requests * repeat,
+        "concurrency": concurrency,
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(percentile(samples, 0.95), 3),
+        "p99_ms": round(percentile(samples, 0.99), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "throughput_rps": round(statistics.median(throughputs), 1),
+    }
+
+
+# --- KỊCH BẢN HTTP ---
+# Mỗi kịch bản: (chuẩn bị, hàm tạo request thứ i); chuẩn bị trả về context manager
+
+def http_scenarios(ids, words, dataset):
+    rng = random.Random(7)
+    picks = [rng.choice(ids) for _ in range(10_000)]
+    # Tập "nóng" nhỏ: sau phần làm nóng mọi request đều trúng cache
+    hot = [ids[i % 20] for i in range(10_000)]
+    queries = [rng.choice(words) for _ in range(10_000)]
+    grids = [[rng.choice(ids) for _ in range(24)] for _ in range(500)]
+
+    def search(client, i):
+        return client.get("/api/v1/search", params={"q": queries[i % len(queries)]})
+
+    def enrich(client, i):
+        return client.get(f"/api/v1/enrich/{picks[i % len(picks)]}")
+
+    def enrich_batch(client, i):
+        return client.post("/api/v1/enrich:batch", json={"ids": grids[i % len(grids)]})
+
+    def enrich_hot(client, i):
+        return client.get(f"/api/v1/enrich/{hot[i % len(hot)]}")
+
+    def diagram(client, i):
+        return client.get(f"/api/v1/diagrams/{picks[i % len(picks)]}")
+
+    def diagram_fields(client, i):
+        return client.get(f"/api/v1/diagrams/{picks[i % len(picks)]}", params={"fields": "category,text"})
+
+    @contextmanager
+    def memory_index():
+        with overrides(SEARCH_MODE="memory"):
+            asyncio.get_event_loop().run_until_complete(search_service.refresh_memory_index())
+            try:
+                yield
+            finally:
+                search_service.memory_index = None
+                search_service._index_version = None
+
+    @contextmanager
+    def precomputed():
+        # Đo đường đọc bảng diagram_enrichment, không đo cache phản hồi
+        use_caches(False)
+        dataset.materialize()
+        with overrides(ENRICH_MODE="precomputed"):
+            yield
+
+    @contextmanager
+    def caches(enabled):
+        use_caches(enabled)
+        yield
+
+    return {
+        "search_postgres": (lambda: caches(True), search),
+        "search_memory": (memory_index, search),
+        "enrich_cold": (lambda: caches(False), enrich),
+        "enrich_warm": (lambda: caches(True), enrich_hot),
+        "enrich_precomputed": (precomputed, enrich),
+        "enrich_batch_24": (lambda: caches(False), enrich_batch),
+        "diagram_detail": (lambda: caches(True), diagram),
+        "diagram_detail_fields": (lambda: caches(True), diagram_fields),
+    }
+
+
+# --- KỊCH BẢN JOB (script đồng bộ Neo4j) ---
+
+def run_sync(docs, args, incremental: bool, processes=None):
+    """
+    Chạy sync_collection `repeat` lần trên Neo4j giả mới, lấy thời gian trung vị.
+    `processes` khác None = chạy dạng pipeline (đọc / biến đổi / ghi song song)
+    """
+    runs = []
+    for _ in range(args.repeat):
+        collection = FakeCollection(docs, args.latency_ms / 1000)
+        driver = FakeNeo4jDriver(args.latency_ms / 1000)
+        if incremental:
+            # Lần chạy đầu ghi hết, lần đo là chạy lại khi dữ liệu không đổi (chỉ tính hash)
+            sync_to_neo4j.sync_collection(driver, collection, args.sync_batch_size, args.sync_workers, False)
+            driver.graph.round_trips = 0
+        start = time.perf_counter()
+        stats = sync_to_neo4j.sync_collection(
+            driver, collection, args.sync_batch_size, args.sync_workers, incremental, processes
+        )
+        runs.append((time.perf_counter() - start, stats, driver.graph.round_trips))
+    seconds, stats, round_trips = sorted(runs, key=lambda run: run[0])[len(runs) // 2]
+    return {
+        "kind": "job",
+        "docs": len(docs),
+        "written": stats["written"],
+        "skipped": stats["skipped"],
+        "seconds": round(seconds, 3),
+        "docs_per_s": round(len(docs) / seconds, 1),
+        "round_trips": round_trips,
+    }
+
+
+def verify_pipeline(docs, args, processes):
+    """
+    Pipeline phải cho ra đúng graph như chạy lần lượt: cùng node, CONTAINS, CONNECTED_TO (kể cả r.diagrams)
+    và sync_hash. Chạy lại incremental trên graph của pipeline thì không còn gì để ghi
+    """
+    snapshots = {}
+    for label, mode in (("sequential", None), ("pipeline", processes)):
+        driver = FakeNeo4jDriver(0)
+        stats = sync_to_neo4j.sync_collection(
+            driver, FakeCollection(docs, 0), args.sync_batch_size, args.sync_workers, False, mode
+        )
+        assert stats["written"] == len(docs), (label, stats)
+        snapshots[label] = (driver, driver.graph.snapshot())
+
+    (_, sequential), (driver, pipeline) = snapshots["sequential"], snapshots["pipeline"]
+    assert sequential["connected"], "dữ liệu giả phải có cạnh CONNECTED_TO"
+    for part in ("diagrams", "concepts", "contains", "connected"):
+        assert len(pipeline[part]) == len(sequential[part]), (part, len(pipeline[part]), len(sequential[part]))
+        assert pipeline[part] == sequential[part], f"{part} khác nhau giữa pipeline và chạy lần lượt"
+
+    stats = sync_to_neo4j.sync_collection(
+        driver, FakeCollection(docs, 0), args.sync_batch_size, args.sync_workers, True, processes
+    )
+    assert stats == {"written": 0, "skipped": len(docs), "deleted": 0}, stats
+    assert driver.graph.snapshot() == pipeline
+    return {key: len(value) for key, value in sequential.items()}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(__file__)
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    docs = list(generate_dataset(args.diagrams, seed=args.seed, texts=args.texts, arrows=args.arrows))
+    ids = [doc["_id"] for doc in docs]
+    dataset = install_fakes(docs, pg_latency=args.latency_ms / 1000, mongo_latency=args.latency_ms / 1000)
+    words = sorted({word for keywords in dataset.keywords.values() for word in keywords if len(word) > 2})
+
+    scenarios = http_scenarios(ids, words, dataset)
+    # tên -> (incremental, processes)
+    jobs = {
+        "sync_neo4j_full": (False, None),
+        "sync_neo4j_incremental": (True, None),
+        "sync_neo4j_pipeline": (False, args.sync_processes),
+    }
+    selected = set(args.only.split(",")) if args.only else None
+    if selected and selected - set(scenarios) - set(jobs):
+        raise SystemExit(f"Không có kịch bản: {', '.join(sorted(selected - set(scenarios) - set(jobs)))}")
+    results = {}
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    try:
+        for name, (prepare, make_request) in scenarios.items():
+            if selected and name not in selected:
+                continue
+            with overrides(RELATED_MODE="sql"), prepare():
+                results[name] = loop.run_until_complete(
+                    load(client, make_request, args.requests, args.concurrency, args.warmup, args.repeat)
+                )
+            print(f"  {name:<24} p50 {results[name]['p50_ms']:8.2f} ms  p95 {results[name]['p95_ms']:8.2f} ms  "
+                  f"{results[name]['throughput_rps']:8.1f} req/s", file=sys.stderr)
+    finally:
+        loop.run_until_complete(client.aclose())
+        loop.close()
+
+    for name, (incremental, processes) in jobs.items():
+        if selected and name not in selected:
+            continue
+        # Log của script đồng bộ không lẫn vào JSON ở stdout
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        try:
+            if processes is not None:
+                counts = verify_pipeline(docs, args, processes)
+                print(f"  {name:<24} graph giống chạy lần lượt: {counts}", file=sys.stderr)
+            results[name] = run_sync(docs, args, incremental, processes)
+        finally:
+            sys.stdout = stdout
+        print(f"  {name:<24} {results[name]['seconds']:8.2f} s  {results[name]['docs_per_s']:8.1f} docs/s",
+              file=sys.stderr)
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "config": {key: getattr(args, key) for key in (
+            "diagrams", "seed", "texts", "arrows", "latency_ms", "requests", "concurrency", "warmup", "repeat",
+            "sync_batch_size", "sync_workers", "sync_processes",
+        )},
+        "scenarios": results,
+    }
+
+
+def compare(current, baseline, threshold: float, min_delta_ms: float = 0.5):
+    """
+    In bảng so sánh, trả về danh sách kịch bản chậm đi quá ngưỡng.
+    Kịch bản HTTP dưới 1ms dao động mạnh giữa các lần chạy -> cần chậm thêm ít nhất `min_delta_ms` mới tính
+    """
+    regressions = []
+    print(f"{'scenario':<26}{'baseline':>12}{'current':>12}{'change':>9}", file=sys.stderr)
+    for name, result in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        if result["kind"] == "http":
+            before, after = old["p50_ms"], result["p50_ms"]
+            change = after / before - 1  # latency: tăng là xấu
+            significant = after - before >= min_delta_ms
+        else:
+            before, after = old["docs_per_s"], result["docs_per_s"]
+            change = before / after - 1  # throughput: giảm là xấu
+            significant = True
+        flag = "  REGRESSION" if change > threshold and significant else ""
+        print(f"{name:<26}{before:>12}{after:>12}{change:>+8.0%}{flag}", file=sys.stderr)
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API + script đồng bộ trên dữ liệu giả")
+    parser.add_argument("--diagrams", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--texts", type=int, default=8, help="Số text mỗi sơ đồ")
+    parser.add_argument("--arrows", type=int, default=6, help="Số mũi tên mỗi sơ đồ")
+    parser.add_argument("--latency-ms", type=float, default=1.0, help="Thời gian 1 round trip DB giả")
+    parser.add_argument("--requests", type=int, default=300, help="Số request đo mỗi kịch bản HTTP")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần lặp mỗi kịch bản (lấy trung vị)")
+    parser.add_argument("--sync-batch-size", type=int, default=200)
+    parser.add_argument("--sync-workers", type=int, default=4)
+    parser.add_argument("--sync-processes", type=int, default=0,
+                        help="Số process biến đổi của kịch bản sync_neo4j_pipeline (0 = 1 thread)")
+    parser.add_argument("--only", help="Chỉ chạy các kịch bản này (phân cách bằng dấu phẩy)")
+    parser.add_argument("--output", help="Ghi kết quả JSON ra file (mặc định: stdout)")
+    parser.add_argument("--compare", help="File JSON kết quả cũ để so sánh")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Chậm đi quá tỉ lệ này = regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                        help="Kịch bản HTTP phải chậm thêm ít nhất chừng này ms mới tính regression")
+    args = parser.parse_args()
+
+    result = run(args)
+    payload = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.threshold, args.min_delta_ms)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()